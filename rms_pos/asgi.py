@@ -2,6 +2,8 @@
 ASGI config for rms_pos project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the app through it (e.g. ``uvicorn rms_pos.asgi:application``) to get
+the live dashboard stream at inventory/dashboard/events/.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
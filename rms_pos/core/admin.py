@@ -0,0 +1,8 @@
+from django.contrib import admin
+from .models import ExportJob
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'rows_written', 'requested_by', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    readonly_fields = ['params_hash', 'rows_written', 'created_at', 'started_at', 'finished_at']
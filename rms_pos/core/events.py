@@ -0,0 +1,164 @@
+"""
+In-process publish/subscribe for live dashboard updates.
+
+Views publish small JSON events (``publish('sale', {...})``) after their
+transaction commits. Each connected Server-Sent Events stream holds an
+asyncio queue registered with the process-wide ``bus``. A publish is one
+queue put per open stream and touches the database zero times, however many
+dashboards are watching.
+
+With several worker processes, set EVENTS_SOCKET_DIR to a directory shared
+by the workers on one host. Each worker then binds a Unix datagram socket
+there and relays what it publishes to every other socket in the directory,
+so a sale completed on any worker reaches dashboards connected to any other.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Events a slow client has not read yet are dropped beyond this
+QUEUE_SIZE = 100
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._socket = None
+        self._socket_path = None
+
+    def subscribe(self):
+        """Register a queue on the running event loop and return it"""
+        self._ensure_listener()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {item for item in self._subscribers if item[1] is not queue}
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event, data):
+        """Deliver an event to local subscribers and relay it to sibling workers"""
+        message = json.dumps({'event': event, 'data': data}, default=str)
+        self._deliver(message)
+        self._relay(message)
+
+    def _deliver(self, message):
+        # Framed once and shared by every stream
+        frame = format_sse(next(self._ids), message)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, frame)
+            except RuntimeError:
+                # The loop has shut down; its streams are gone
+                self.unsubscribe(queue)
+
+    # Multi-worker fan-out over Unix datagram sockets
+
+    def _socket_dir(self):
+        return getattr(settings, 'EVENTS_SOCKET_DIR', None)
+
+    def _ensure_listener(self):
+        directory = self._socket_dir()
+        if not directory or self._socket is not None:
+            return
+        with self._lock:
+            if self._socket is not None:
+                return
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'worker-{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            self._socket, self._socket_path = sock, path
+        threading.Thread(target=self._listen, name='event-bus-listener', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                message = self._socket.recv(65536).decode()
+            except OSError:
+                return
+            self._deliver(message)
+
+    def _relay(self, message):
+        directory = self._socket_dir()
+        if not directory or not os.path.isdir(directory):
+            return
+        payload = message.encode()
+        sender = self._socket or socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if not name.endswith('.sock') or path == self._socket_path:
+                    continue
+                try:
+                    sender.sendto(payload, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a worker that exited
+                    _unlink_quietly(path)
+                except OSError as e:
+                    logger.warning("Could not relay event to %s: %s", path, e)
+        finally:
+            if sender is not self._socket:
+                sender.close()
+
+
+def _offer(queue, item):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+def _unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def format_sse(event_id, message):
+    """Server-Sent Events frame for a published message"""
+    payload = json.loads(message)
+    return f"id: {event_id}\nevent: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
+
+
+bus = EventBus()
+
+
+def publish(event, data):
+    bus.publish(event, data)
+
+
+async def stream():
+    """Async iterator of SSE frames for one client, with keep-alive comments"""
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    queue = bus.subscribe()
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                frame = ': keep-alive\n\n'
+            yield frame
+    finally:
+        bus.unsubscribe(queue)
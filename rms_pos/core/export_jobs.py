@@ -0,0 +1,128 @@
+"""
+Background CSV exports.
+
+A full year of sales takes longer to export than the serverless request
+limit allows. ``request_export`` records an ExportJob and returns at once.
+The ``run_export_worker`` command picks up pending jobs and runs the same
+row producers as the streaming export views. It writes a gzip-compressed
+CSV to the default storage under exports/<kind>/ and updates ``rows_written``
+as it goes, so the status endpoint can show progress. A user asking again
+for the same export with the same filters gets their recent finished file,
+or their job already in progress, instead of a new one.
+"""
+import gzip
+import hashlib
+import json
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from django.utils.module_loading import import_string
+
+from .models import ExportJob
+from .streaming import csv_rows
+
+# kind -> (row producer, query parameters it understands)
+EXPORTERS = {
+    'sales': ('pos.exports.sales_export', ('view', 'date', 'month')),
+    'products': ('inventory.exports.products_export', ('stock_status',)),
+    'customers': ('pos.exports.customers_export', ()),
+}
+
+# How often progress is written back while a job runs
+PROGRESS_EVERY = 1000
+
+
+def clean_params(kind, params):
+    """Keep only the filters that affect this kind of export"""
+    allowed = EXPORTERS[kind][1]
+    return {key: params.get(key) for key in allowed if params.get(key)}
+
+
+def params_hash(kind, params):
+    payload = json.dumps([kind, params], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def fresh_for():
+    return timedelta(seconds=getattr(settings, 'EXPORT_JOB_FRESH_SECONDS', 15 * 60))
+
+
+def request_export(kind, params, user):
+    """Return a job for this export, reusing the user's fresh or in-flight one when possible
+
+    Raises ValueError for filters the exporter rejects, before anything is queued.
+    """
+    params = clean_params(kind, params)
+    # Exporters only build lazy querysets, so this validates without querying
+    import_string(EXPORTERS[kind][0])(params)
+    digest = params_hash(kind, params)
+    jobs = ExportJob.objects.filter(kind=kind, params_hash=digest, requested_by=user)
+
+    in_flight = jobs.filter(status__in=('pending', 'running')).first()
+    if in_flight is not None:
+        return in_flight
+    recent = jobs.filter(status='done', finished_at__gte=timezone.now() - fresh_for()).first()
+    if recent is not None and recent.file and recent.file.storage.exists(recent.file.name):
+        return recent
+
+    return ExportJob.objects.create(
+        kind=kind,
+        params=params,
+        params_hash=digest,
+        requested_by=user
+    )
+
+
+def claim_next_job():
+    """Atomically move the oldest pending job to running, or return None"""
+    for job in ExportJob.objects.filter(status='pending').order_by('created_at')[:5]:
+        claimed = ExportJob.objects.filter(pk=job.pk, status='pending').update(
+            status='running',
+            started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def requeue_stale_jobs(older_than):
+    """Hand jobs orphaned by a crashed worker back to the queue"""
+    return ExportJob.objects.filter(
+        status='running',
+        started_at__lt=timezone.now() - older_than
+    ).update(status='pending', started_at=None, rows_written=0)
+
+
+def run_job(job):
+    exporter = import_string(EXPORTERS[job.kind][0])
+    try:
+        filename, header, rows = exporter(job.params)
+
+        written = 0
+        with tempfile.TemporaryFile() as spool:
+            with gzip.open(spool, 'wt', encoding='utf-8', newline='') as out:
+                for line in csv_rows(header, rows):
+                    out.write(line)
+                    written += 1
+                    if written % PROGRESS_EVERY == 0:
+                        # The header line is not a data row
+                        ExportJob.objects.filter(pk=job.pk).update(rows_written=written - 1)
+            spool.seek(0)
+            # get_valid_filename keeps the name a single path component whatever the exporter returns
+            name = get_valid_filename(f"{filename}-{job.pk}.csv.gz")
+            job.file.name = default_storage.save(f"exports/{job.kind}/{name}", File(spool))
+
+        job.rows_written = max(written - 1, 0)
+        job.status = 'done'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'rows_written', 'status', 'error', 'finished_at'])
+    return job
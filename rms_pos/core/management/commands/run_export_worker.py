@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.export_jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued CSV export jobs and write their files to the default storage under exports/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of polling')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds to wait between polls when idle')
+        parser.add_argument('--stale-after', type=int, default=60 * 60, help='Requeue running jobs started more than this many seconds ago')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(timedelta(seconds=options['stale_after']))
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale export jobs")
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            run_job(job)
+            if job.status == 'done':
+                self.stdout.write(f"Export #{job.pk} ({job.kind}): {job.rows_written} rows -> {job.file.name}")
+            else:
+                self.stderr.write(f"Export #{job.pk} ({job.kind}) failed: {job.error}")
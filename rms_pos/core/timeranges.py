@@ -0,0 +1,87 @@
+"""
+Date filters as half-open timestamp ranges.
+
+``created_at__date=...`` and ``created_at__year/month`` wrap the column in a
+date function, so the database cannot use an index on it. These helpers turn
+a local date, month or date span into ``[lower, upper)`` datetimes in the
+store's timezone, which the composite (is_completed, created_at) and
+(cashier, created_at) indexes can serve directly.
+"""
+import datetime
+
+from django.utils import timezone
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), timezone.get_current_timezone())
+
+
+def date_range(start=None, end=None):
+    """Aware [start, end + 1 day) datetimes for inclusive local dates; None is open-ended"""
+    lower = _local_midnight(start) if start else None
+    upper = _local_midnight(end + datetime.timedelta(days=1)) if end else None
+    return lower, upper
+
+
+def parse_date(value):
+    """datetime.date for 'YYYY-MM-DD', or None if missing or malformed"""
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_month(value):
+    """(first day, last day) of a 'YYYY-MM' month, or (None, None)"""
+    try:
+        year, month = (int(part) for part in value.split('-'))
+        first = datetime.date(year, month, 1)
+    except (AttributeError, TypeError, ValueError):
+        return None, None
+    following = (first + datetime.timedelta(days=32)).replace(day=1)
+    return first, following - datetime.timedelta(days=1)
+
+
+def report_period(params):
+    """Inclusive (start, end) dates selected by a report's view/date/month parameters
+
+    Raises ValueError for a date or month that is given but malformed, rather
+    than quietly reporting on all history.
+    """
+    view_type = params.get('view', 'all')
+    date_input = params.get('date')
+    month_input = params.get('month')
+    if view_type in ('daily', 'product') and date_input:
+        day = parse_date(date_input)
+        if day is None:
+            raise ValueError("date must be YYYY-MM-DD")
+        return day, day
+    if view_type in ('monthly', 'product') and month_input:
+        first, last = parse_month(month_input)
+        if first is None:
+            raise ValueError("month must be YYYY-MM")
+        return first, last
+    return None, None
+
+
+def timestamp_filter(field, start=None, end=None):
+    """Filter kwargs selecting rows whose datetime field falls on local dates start..end"""
+    lower, upper = date_range(start, end)
+    filters = {}
+    if lower:
+        filters[f'{field}__gte'] = lower
+    if upper:
+        filters[f'{field}__lt'] = upper
+    return filters
+
+
+def date_filter(field, start=None, end=None):
+    """Filter kwargs for a DateField (e.g. the rollup tables) over start..end"""
+    filters = {}
+    if start:
+        filters[f'{field}__gte'] = start
+    if end:
+        filters[f'{field}__lte'] = end
+    return filters
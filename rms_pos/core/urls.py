@@ -3,4 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('exports/job/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('exports/job/<int:job_id>/download/', views.export_job_download, name='export_job_download'),
+    path('exports/<str:kind>/', views.request_export_job, name='request_export_job'),
 ]
@@ -0,0 +1,86 @@
+"""
+Cache entries tied to data version counters.
+
+Each cached value is stored under a key that includes the current version of
+every data set it was computed from (e.g. 'sales', 'stock'). Writers call
+``bump('sales')`` once a change commits. Readers then compute a fresh key,
+and the stale entries age out on their own. Nothing has to be deleted, and
+a version number doubles as an ETag.
+
+Bumps only reach workers that share the cache. With a per-process backend
+(the LocMemCache default), other workers never see a bump. So both the
+entries and the version counters expire after VERSIONED_CACHE_LOCAL_TIMEOUT
+seconds, which bounds how stale a widget or ETag can get.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+PREFIX = 'vcache'
+
+# Backends whose contents live inside one worker process
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared():
+    """Whether every worker sees the same default cache"""
+    return not isinstance(caches['default'], PROCESS_LOCAL_BACKENDS)
+
+
+def _local_timeout():
+    return getattr(settings, 'VERSIONED_CACHE_LOCAL_TIMEOUT', 30)
+
+
+def _version_key(name):
+    return f'{PREFIX}:version:{name}'
+
+
+def version(name):
+    """Current version of a data set"""
+    key = _version_key(name)
+    current = cache.get(key)
+    if current is None:
+        # Seed from the clock so an evicted counter cannot restart at a number
+        # whose cached entries are still around.
+        cache.add(key, int(time.time() * 1000), timeout=None if is_shared() else _local_timeout())
+        current = cache.get(key)
+    return current
+
+
+def versions(*names):
+    return tuple(version(name) for name in names)
+
+
+def bump(*names):
+    """Invalidate everything cached from these data sets once the transaction commits"""
+    def _bump():
+        for name in names:
+            try:
+                cache.incr(_version_key(name))
+            except ValueError:
+                version(name)
+    transaction.on_commit(_bump)
+
+
+def tag(name, depends_on, *extra):
+    """Stable identifier for the current value of an entry, usable as an ETag"""
+    parts = [name, *map(str, versions(*depends_on)), *map(str, extra)]
+    return ':'.join(parts)
+
+
+def get_or_compute(name, depends_on, compute, *extra, timeout=None):
+    """Cached compute() for the current versions of depends_on"""
+    if timeout is None:
+        timeout = getattr(settings, 'VERSIONED_CACHE_TIMEOUT', 60 * 60)
+    if not is_shared():
+        timeout = min(timeout, _local_timeout())
+    key = f'{PREFIX}:{tag(name, depends_on, *extra)}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
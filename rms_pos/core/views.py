@@ -1,5 +1,12 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from django.http import JsonResponse, FileResponse, Http404
+from django.urls import reverse
+from django.conf import settings
+from django.views.static import serve
+
+from .models import ExportJob
 
 @login_required
 def home(request):
@@ -8,3 +15,70 @@ def home(request):
     elif request.user.is_cashier():
         return redirect('pos_dashboard')
     return render(request, 'base.html') # Fallback
+
+def _can_export(user, kind):
+    # Product exports are manager-only, like the inventory export view
+    if kind == 'products':
+        return user.is_superuser or user.is_admin() or user.is_manager()
+    return True
+
+def _job_payload(job):
+    payload = {
+        'job_id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'rows_written': job.rows_written,
+        'poll_url': reverse('export_job_status', args=[job.pk]),
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == 'done':
+        payload['download_url'] = reverse('export_job_download', args=[job.pk])
+    if job.status == 'failed':
+        payload['error'] = job.error
+    return payload
+
+def _own_job(request, job_id):
+    job = get_object_or_404(ExportJob, pk=job_id, requested_by=request.user)
+    if not _can_export(request.user, job.kind):
+        raise Http404
+    return job
+
+@login_required
+@require_POST
+def request_export_job(request, kind):
+    """Queue a CSV export for the background worker and return its job id"""
+    from .export_jobs import EXPORTERS, request_export
+
+    if kind not in EXPORTERS:
+        return JsonResponse({'error': f'Unknown export: {kind}'}, status=404)
+    if not _can_export(request.user, kind):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    params = request.POST if request.POST else request.GET
+    try:
+        job = request_export(kind, params, request.user)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(_job_payload(job), status=202 if job.status != 'done' else 200)
+
+@login_required
+def export_job_status(request, job_id):
+    return JsonResponse(_job_payload(_own_job(request, job_id)))
+
+@login_required
+def export_job_download(request, job_id):
+    job = _own_job(request, job_id)
+    if job.status != 'done' or not job.file:
+        raise Http404
+    try:
+        handle = job.file.open('rb')
+    except FileNotFoundError:
+        raise Http404
+    return FileResponse(handle, as_attachment=True, filename=job.file.name.rsplit('/', 1)[-1], content_type='application/gzip')
+
+def thumbnail(request, path):
+    """Development server for product thumbnails; named after their content, so browsers may keep them forever"""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT / 'thumbnails')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -1,15 +1,15 @@
 from django.contrib import admin
-from .models import Category, Product, InventoryLog
+from .models import Category, Product, InventoryLog, StockAllotment, ProductPlanning, StockAlert, InventorySnapshot, InventoryLogArchive, StockTake, StockTakeCount
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description']
+    list_display = ['name', 'description', 'reorder_level']
     search_fields = ['name']
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'barcode', 'price', 'cost', 'stock_quantity']
-    list_filter = ['category']
+    list_display = ['name', 'category', 'barcode', 'price', 'cost', 'stock_quantity', 'low_stock_threshold', 'escrow_enabled']
+    list_filter = ['category', 'escrow_enabled']
     search_fields = ['name', 'barcode']
     list_editable = ['price', 'stock_quantity']
 
@@ -19,3 +19,54 @@ class InventoryLogAdmin(admin.ModelAdmin):
     list_filter = ['action', 'timestamp']
     search_fields = ['product__name']
     readonly_fields = ['timestamp']
+    list_select_related = ['product', 'user']
+    # Skips the unfiltered COUNT(*) over the whole table on every page
+    show_full_result_count = False
+
+@admin.register(StockAllotment)
+class StockAllotmentAdmin(admin.ModelAdmin):
+    list_display = ['product', 'slot', 'allotted', 'remaining', 'updated_at']
+    search_fields = ['product__name']
+    readonly_fields = ['updated_at']
+
+@admin.register(ProductPlanning)
+class ProductPlanningAdmin(admin.ModelAdmin):
+    list_display = ['product', 'smoothed_demand', 'velocity', 'reorder_point', 'order_quantity', 'days_of_cover', 'computed_at']
+    search_fields = ['product__name', 'product__barcode']
+    list_select_related = ['product']
+    readonly_fields = ['computed_at']
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ['product', 'stock_quantity', 'threshold', 'opened_at', 'resolved_at']
+    list_filter = [('resolved_at', admin.EmptyFieldListFilter)]
+    search_fields = ['product__name']
+    list_select_related = ['product']
+    readonly_fields = ['opened_at']
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['product', 'balance', 'log_id', 'as_of', 'taken_at']
+    search_fields = ['product__name']
+    list_select_related = ['product']
+    readonly_fields = ['taken_at']
+
+@admin.register(InventoryLogArchive)
+class InventoryLogArchiveAdmin(admin.ModelAdmin):
+    list_display = ['month', 'row_count', 'first_log_id', 'last_log_id', 'file', 'created_at']
+    readonly_fields = ['created_at']
+
+@admin.register(StockTake)
+class StockTakeAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'status', 'created_by', 'created_at', 'applied_at']
+    list_filter = ['status']
+    readonly_fields = ['status', 'created_at', 'applied_by', 'applied_at']
+
+@admin.register(StockTakeCount)
+class StockTakeCountAdmin(admin.ModelAdmin):
+    list_display = ['product', 'stock_take', 'counted', 'expected', 'counted_by', 'counted_at']
+    list_filter = ['stock_take']
+    search_fields = ['product__name', 'product__barcode']
+    list_select_related = ['product', 'stock_take', 'counted_by']
+    raw_id_fields = ['product']
+    readonly_fields = ['expected', 'counted_at']
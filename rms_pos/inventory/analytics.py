@@ -0,0 +1,94 @@
+"""
+Dashboard chart widgets, cached per data version.
+
+Each widget is cached under its own key, tied to the versions of the data it
+reads (see core.versioned_cache). Completed sales bump 'sales' and stock
+changes bump 'stock', so a manager polling the dashboard re-reads the
+database only when something it shows has changed.
+"""
+import datetime
+
+from django.utils import timezone
+
+from core import versioned_cache
+from .models import StockAlert
+
+SALES = 'sales'
+STOCK = 'stock'
+
+
+def top_products():
+    from pos.rollups import top_selling
+
+    top = top_selling(5)
+    return {
+        'labels': [item['product__name'] for item in top],
+        'data': [item['total_qty'] for item in top]
+    }
+
+
+def low_stock():
+    alerts = StockAlert.objects.open().order_by('opened_at')\
+        .values('product__name', 'product__stock_quantity')[:10]
+    return {
+        'labels': [alert['product__name'] for alert in alerts],
+        'data': [alert['product__stock_quantity'] for alert in alerts]
+    }
+
+
+def sales_trend():
+    from pos.timeseries import series
+
+    today = timezone.localdate()
+    trend = series('day', today - datetime.timedelta(days=6), today)
+    return {
+        'labels': trend['labels'],
+        'data': trend['series'][0]['amount']
+    }
+
+
+# widget -> (compute, data sets it reads, depends on the current date)
+WIDGETS = {
+    'top_products': (top_products, (SALES,), False),
+    'low_stock': (low_stock, (STOCK,), False),
+    'sales_trend': (sales_trend, (SALES,), True),
+}
+
+
+def _extra(dated):
+    return (timezone.localdate().isoformat(),) if dated else ()
+
+
+def widget_tag(name):
+    compute, depends_on, dated = WIDGETS[name]
+    return versioned_cache.tag(name, depends_on, *_extra(dated))
+
+
+def widget(name):
+    compute, depends_on, dated = WIDGETS[name]
+    return versioned_cache.get_or_compute(f'dashboard:{name}', depends_on, compute, *_extra(dated))
+
+
+def widget_names(request):
+    """Widgets requested with ?widget=, or all of them"""
+    requested = request.GET.getlist('widget')
+    return [name for name in WIDGETS if name in requested] or list(WIDGETS)
+
+
+def analytics_etag(request, *args, **kwargs):
+    return '|'.join(widget_tag(name) for name in widget_names(request))
+
+
+def warm():
+    """Compute every widget for the current versions"""
+    for name in WIDGETS:
+        widget(name)
+    return list(WIDGETS)
+
+
+def sales_changed():
+    versioned_cache.bump(SALES)
+
+
+def stock_changed():
+    versioned_cache.bump(STOCK)
@@ -0,0 +1,260 @@
+"""
+Moving old InventoryLog rows out of the table, and reading them back.
+
+Every sale line writes an InventoryLog row, so the table only grows.
+``archive_logs`` moves the rows logged before the last
+INVENTORY_LOG_HOT_MONTHS whole months into gzip-compressed CSV files, one
+per calendar month, saved through the file field's storage under
+archive/inventory_logs/. Each file is recorded by an InventoryLogArchive
+row. Before the rows are deleted, every
+product they belong to gets an InventorySnapshot at its last archived entry,
+unless a later snapshot already covers it. Ledger balances (inventory.ledger)
+then never need the archived rows again.
+
+``history`` returns the entries for a date range in id order. It reads the
+table and, only when the range reaches back that far, the archive files that
+overlap it. ``restore_archive`` puts a file's rows back with their original
+ids, e.g. for an audit; the snapshots stay valid because the ids do not change.
+"""
+import csv
+import datetime
+import gzip
+import heapq
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from core.streaming import chunk_size
+from core.timeranges import date_range
+from .ledger import CHUNK_SIZE, product_balances, take_snapshots
+from .models import InventoryLog, InventoryLogArchive, InventorySnapshot, Product
+
+FIELDS = ['id', 'product_id', 'action', 'quantity', 'timestamp', 'user_id', 'note']
+
+
+def hot_months():
+    return getattr(settings, 'INVENTORY_LOG_HOT_MONTHS', 12)
+
+
+def horizon(months=None, today=None):
+    """Local midnight starting the oldest month kept in the table"""
+    month = (today or timezone.localdate()).replace(day=1)
+    for _ in range(hot_months() if months is None else months):
+        month = (month - datetime.timedelta(days=1)).replace(day=1)
+    return date_range(month)[0]
+
+
+def pending(before=None):
+    """[(month, rows)] that archive_logs would move"""
+    rows = InventoryLog.objects.filter(timestamp__lt=before or horizon())\
+        .annotate(month=TruncMonth('timestamp')).values('month').annotate(rows=Count('id')).order_by('month')
+    return [(row['month'].date(), row['rows']) for row in rows]
+
+
+def _row(values, local):
+    row = dict(zip(FIELDS, values))
+    row['timestamp'] = local.isoformat()
+    return [row[field] if row[field] is not None else '' for field in FIELDS]
+
+
+def _parse(line):
+    row = dict(zip(FIELDS, line))
+    return {
+        'id': int(row['id']),
+        'product_id': int(row['product_id']),
+        'action': row['action'],
+        'quantity': int(row['quantity']),
+        'timestamp': datetime.datetime.fromisoformat(row['timestamp']),
+        'user_id': int(row['user_id']) if row['user_id'] else None,
+        'note': row['note'],
+    }
+
+
+def read_archive(archive):
+    """Yield the rows of one archive file as dicts, in id order"""
+    with archive.file.open('rb') as raw, gzip.open(raw, 'rt', encoding='utf-8', newline='') as data:
+        lines = csv.reader(data)
+        next(lines)
+        for line in lines:
+            yield _parse(line)
+
+
+def _write_months(rows):
+    """Write rows into one stored file per local month; returns {month: InventoryLogArchive (unsaved)}"""
+    archives = {}
+    spools = {}
+    files = {}
+    writers = {}
+    # Resolved once; calling timezone.localtime() per row was most of the run time
+    zone = timezone.get_current_timezone()
+    try:
+        for values in rows:
+            log_id, timestamp = values[0], values[FIELDS.index('timestamp')]
+            local = timestamp.astimezone(zone)
+            month = local.date().replace(day=1)
+            archive = archives.get(month)
+            if archive is None:
+                # Spooled locally, then saved through the file's storage like any upload
+                spools[month] = tempfile.TemporaryFile()
+                files[month] = gzip.open(spools[month], 'wt', encoding='utf-8', newline='')
+                writers[month] = csv.writer(files[month])
+                writers[month].writerow(FIELDS)
+                archive = archives[month] = InventoryLogArchive(
+                    month=month,
+                    first_log_id=log_id,
+                    first_timestamp=timestamp,
+                    last_timestamp=timestamp,
+                )
+            writers[month].writerow(_row(values, local))
+            archive.row_count += 1
+            archive.last_log_id = log_id
+            archive.first_timestamp = min(archive.first_timestamp, timestamp)
+            archive.last_timestamp = max(archive.last_timestamp, timestamp)
+        for month, out in files.items():
+            out.close()
+            spools[month].seek(0)
+            archive = archives[month]
+            archive.file.save(f"{month:%Y-%m}-{archive.first_log_id}.csv.gz", File(spools[month]), save=False)
+    except Exception:
+        for archive in archives.values():
+            if archive.file:
+                archive.file.delete(save=False)
+        raise
+    finally:
+        for out in files.values():
+            out.close()
+        for spool in spools.values():
+            spool.close()
+    return archives
+
+
+def archive_logs(before=None):
+    """Move every row logged before `before` (default: horizon()) to archive files; returns the archives"""
+    before = before or horizon()
+    last_id = InventoryLog.objects.filter(timestamp__lt=before).aggregate(last=Max('id'))['last']
+    if last_id is None:
+        return []
+
+    # product_id -> id of its last archived entry
+    last_entries = {}
+
+    def rows():
+        logs = InventoryLog.objects.filter(id__lte=last_id).order_by('id').values_list(*FIELDS)
+        for values in logs.iterator(chunk_size=chunk_size()):
+            last_entries[values[1]] = values[0]
+            yield values
+
+    archives = _write_months(rows())
+    try:
+        with transaction.atomic():
+            ids = sorted(last_entries)
+            for start in range(0, len(ids), CHUNK_SIZE):
+                chunk = ids[start:start + CHUNK_SIZE]
+                covered = dict(
+                    InventorySnapshot.objects.filter(product_id__in=chunk).values('product_id')
+                    .annotate(last=Max('log_id')).values_list('product_id', 'last').order_by()
+                )
+                # Snapshot each product at its last archived entry, unless a later
+                # snapshot already covers it (a restored month being archived again)
+                uncovered = [pk for pk in chunk if covered.get(pk, 0) < last_entries[pk]]
+                take_snapshots(product_balances(uncovered, upto=last_id), min_entries=1)
+            InventoryLogArchive.objects.bulk_create(archives.values())
+            deleted, _ = InventoryLog.objects.filter(id__lte=last_id).delete()
+            written = sum(archive.row_count for archive in archives.values())
+            if deleted != written:
+                raise RuntimeError(f"Archived {written} inventory log rows but {deleted} matched for deletion")
+    except Exception:
+        for archive in archives.values():
+            archive.file.delete(save=False)
+        raise
+    return sorted(archives.values(), key=lambda archive: archive.first_log_id)
+
+
+@transaction.atomic
+def restore_archive(archive, keep_file=False):
+    """Put an archive's rows back into InventoryLog with their original ids; returns the row count"""
+    from django.contrib.auth import get_user_model
+
+    restored = 0
+    batch = []
+
+    def flush():
+        # Rows of products deleted since are dropped; users deleted since become None, as on_delete would
+        products = set(Product.objects.filter(pk__in={row['product_id'] for row in batch}).values_list('pk', flat=True))
+        users = set(get_user_model().objects.filter(pk__in={row['user_id'] for row in batch})
+                    .values_list('pk', flat=True))
+        logs = [
+            InventoryLog(**dict(row, user_id=row['user_id'] if row['user_id'] in users else None))
+            for row in batch
+            if row['product_id'] in products
+        ]
+        InventoryLog.objects.bulk_create(logs, ignore_conflicts=True)
+        # auto_now_add stamped the insert time; put the original timestamps back
+        for log, row in zip(logs, (row for row in batch if row['product_id'] in products)):
+            log.timestamp = row['timestamp']
+        InventoryLog.objects.bulk_update(logs, ['timestamp'], batch_size=CHUNK_SIZE)
+        return len(logs)
+
+    for row in read_archive(archive):
+        batch.append(row)
+        if len(batch) == CHUNK_SIZE:
+            restored += flush()
+            batch = []
+    if batch:
+        restored += flush()
+
+    if not keep_file:
+        archive.file.delete(save=False)
+    archive.delete()
+    return restored
+
+
+def _archives_between(lower=None, upper=None):
+    archives = InventoryLogArchive.objects.order_by('first_log_id')
+    if lower:
+        archives = archives.filter(last_timestamp__gte=lower)
+    if upper:
+        archives = archives.filter(first_timestamp__lt=upper)
+    return archives
+
+
+def history(product_id=None, start=None, end=None):
+    """Inventory log entries on local dates start..end, from the table and the archives, in id order"""
+    lower, upper = date_range(start, end)
+
+    def archived():
+        for archive in _archives_between(lower, upper):
+            for row in read_archive(archive):
+                if product_id is not None and row['product_id'] != product_id:
+                    continue
+                if (lower and row['timestamp'] < lower) or (upper and row['timestamp'] >= upper):
+                    continue
+                row['archived'] = True
+                yield row
+
+    logs = InventoryLog.objects.order_by('id')
+    if product_id is not None:
+        logs = logs.filter(product_id=product_id)
+    if lower:
+        logs = logs.filter(timestamp__gte=lower)
+    if upper:
+        logs = logs.filter(timestamp__lt=upper)
+    hot = (dict(row, archived=False) for row in logs.values(*FIELDS).iterator(chunk_size=chunk_size()))
+    return heapq.merge(archived(), hot, key=lambda row: row['id'])
+
+
+def archived_delta(product_id, after_id, until):
+    """Signed quantity of a product's archived entries with id > after_id logged at or before until"""
+    delta = 0
+    archives = InventoryLogArchive.objects.filter(last_log_id__gt=after_id, first_timestamp__lte=until)\
+        .order_by('first_log_id')
+    for archive in archives:
+        for row in read_archive(archive):
+            if row['product_id'] == product_id and row['id'] > after_id and row['timestamp'] <= until:
+                delta += row['quantity'] if row['action'] == 'add' else -row['quantity']
+    return delta
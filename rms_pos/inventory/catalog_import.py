@@ -0,0 +1,313 @@
+"""
+Bulk product catalog import from CSV or XLSX.
+
+The file is read a row at a time and handled in batches of BATCH_SIZE rows.
+For each batch:
+- one query loads and locks the products whose barcodes the batch mentions;
+- bulk_create inserts the new ones and bulk_update rewrites the changed ones;
+- one UPDATE moves each product's stock by the difference to the file's
+  figure (F('stock_quantity') + difference, as stock_take.apply does) rather
+  than overwriting it;
+- bulk_create writes the 'add'/'remove' InventoryLog rows for the stock they
+  bring, as add_product and edit_product would one at a time.
+Categories are matched by name, case-insensitively, and missing ones are
+created. A row that fails validation is reported with its row number and
+skipped; the rest of its batch still loads.
+
+Columns are matched by header, ignoring case and punctuation: name, category,
+barcode, price, cost, discount, stock and reorder level. The product export's
+header is understood, so an exported file can be edited and imported again.
+Price and cost are required for new products; for existing ones, blank
+cells leave the current value alone.
+
+Bulk writes skip Product.save(), so thresholds and low-stock alerts are
+refreshed once at the end. POS search indexes pick the products up through
+their periodic sync on updated_at.
+"""
+import csv
+import io
+import os
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, When
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import Category, InventoryLog, Product, StockAllotment
+
+# Rows per transaction; also bounds the barcode IN list under SQLite's parameter limit
+BATCH_SIZE = 500
+
+COLUMNS = {
+    'name': 'name',
+    'productname': 'name',
+    'category': 'category',
+    'barcode': 'barcode',
+    'sku': 'barcode',
+    'price': 'price',
+    'cost': 'cost',
+    'costprice': 'cost',
+    'discount': 'discount_percentage',
+    'discountpercentage': 'discount_percentage',
+    'stock': 'stock_quantity',
+    'stockquantity': 'stock_quantity',
+    'quantity': 'stock_quantity',
+    'reorderlevel': 'reorder_level',
+}
+REQUIRED_COLUMNS = ('name', 'barcode')
+REQUIRED_FOR_NEW = ('category', 'price', 'cost')
+# Stock is not rewritten with these but moved by the difference; see _load
+UPDATABLE = ['name', 'category', 'price', 'cost', 'discount_percentage', 'reorder_level']
+
+# row is the spreadsheet row number, counting the header as row 1
+RowError = namedtuple('RowError', 'row barcode message')
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+
+    @property
+    def total(self):
+        return self.created + self.updated + self.unchanged + len(self.errors)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets store numeric barcodes and quantities as floats
+        value = int(value)
+    return str(value).strip()
+
+
+def _csv_rows(file):
+    if isinstance(file, io.TextIOBase):
+        text = file
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    for row in csv.reader(text):
+        yield [_cell(value) for value in row]
+
+
+def _xlsx_rows(file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX import needs the openpyxl package; upload a CSV file instead")
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [_cell(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_rows(file, filename):
+    """Yield the cells of each row of a CSV or XLSX file as stripped strings"""
+    if os.path.splitext(filename)[1].lower() in ('.xlsx', '.xlsm'):
+        return _xlsx_rows(file)
+    return _csv_rows(file)
+
+
+def _columns(header):
+    """{field: column index} for a header row"""
+    columns = {}
+    for i, title in enumerate(header):
+        field = COLUMNS.get(''.join(ch for ch in title.lower() if ch.isalnum()))
+        if field and field not in columns:
+            columns[field] = i
+    missing = [field for field in REQUIRED_COLUMNS if field not in columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return columns
+
+
+def _model_fields(columns):
+    """[(field, column index, model field that validates it)]"""
+    return [
+        (field, i, Category._meta.get_field('name') if field == 'category' else Product._meta.get_field(field))
+        for field, i in columns.items()
+    ]
+
+
+def _clean(fields, cells):
+    """{field: value} for the non-blank cells of a row; raises ValidationError"""
+    values = {}
+    for field, i, model_field in fields:
+        raw = cells[i] if i < len(cells) else ''
+        if raw == '':
+            continue
+        try:
+            values[field] = model_field.clean(raw, None)
+        except ValidationError as e:
+            raise ValidationError(f"{field}: {' '.join(e.messages)}")
+    for field in ('name', 'barcode'):
+        if field not in values:
+            raise ValidationError(f"{field} is required")
+    if values.get('discount_percentage') is not None and not 0 <= values['discount_percentage'] <= 100:
+        raise ValidationError("discount_percentage: must be between 0 and 100")
+    return values
+
+
+class CatalogImporter:
+    def __init__(self, user=None, batch_size=BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.result = ImportResult()
+        self.seen = set()
+        self.categories = {}
+        for pk, name in Category.objects.annotate(key=Lower('name')).order_by('-pk').values_list('pk', 'key'):
+            # Lowest pk wins when names repeat
+            self.categories[name] = pk
+
+    def run(self, rows):
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("The file is empty")
+        columns = _columns(header)
+        fields = _model_fields(columns)
+
+        batch = []
+        for number, cells in enumerate(rows, start=2):
+            if not any(cells):
+                continue
+            try:
+                values = _clean(fields, cells)
+            except ValidationError as e:
+                self.error(number, cells[columns['barcode']] if columns['barcode'] < len(cells) else '', e.messages[0])
+                continue
+            if values['barcode'] in self.seen:
+                self.error(number, values['barcode'], "barcode appears earlier in the file")
+                continue
+            self.seen.add(values['barcode'])
+            batch.append((number, values))
+            if len(batch) >= self.batch_size:
+                self.load(batch)
+                batch = []
+        if batch:
+            self.load(batch)
+        self.finish()
+        self.result.errors.sort()
+        return self.result
+
+    def error(self, number, barcode, message):
+        self.result.errors.append(RowError(number, barcode, message))
+
+    def _resolve_categories(self, batch):
+        """Create the categories the batch names that do not exist yet"""
+        missing = {}
+        for _, values in batch:
+            name = values.get('category')
+            if name and name.lower() not in self.categories:
+                missing.setdefault(name.lower(), name)
+        if missing:
+            created = Category.objects.bulk_create([Category(name=name) for name in missing.values()])
+            for category in created:
+                self.categories[category.name.lower()] = category.pk
+
+    def load(self, batch):
+        categories = dict(self.categories)
+        try:
+            with transaction.atomic():
+                counts = self._load(batch)
+        except DatabaseError as e:
+            # Categories created by the failed batch were rolled back with it
+            self.categories = categories
+            for number, values in batch:
+                self.error(number, values['barcode'], f"not saved: {e}")
+            return
+        self.result.created += counts[0]
+        self.result.updated += counts[1]
+        self.result.unchanged += counts[2]
+
+    def _load(self, batch):
+        from . import escrow
+
+        self._resolve_categories(batch)
+        barcodes = [values['barcode'] for _, values in batch]
+        # Locked in pk order, as checkout locks them, so no sale lands between
+        # reading a product's stock and logging the difference
+        existing = {
+            product.barcode: product
+            for product in Product.objects.select_for_update().filter(barcode__in=barcodes).order_by('pk')
+        }
+        escrowed = {product.pk for product in existing.values() if product.escrow_enabled}
+        escrowed.update(StockAllotment.objects.filter(product__barcode__in=barcodes)
+                        .values_list('product_id', flat=True).distinct())
+        for product_id in escrowed:
+            # Count what the terminals have sold before comparing stock, as edit_product does
+            escrow.reconcile(product_id)
+        if escrowed:
+            for product in Product.objects.filter(pk__in=escrowed).only('barcode', 'stock_quantity'):
+                existing[product.barcode].stock_quantity = product.stock_quantity
+
+        now = timezone.now()
+        created, changed, unchanged, logs, stock_moves = [], [], 0, [], {}
+        for number, values in batch:
+            if 'category' in values:
+                values['category_id'] = self.categories[values.pop('category').lower()]
+            product = existing.get(values['barcode'])
+            if product is None:
+                absent = [field for field in REQUIRED_FOR_NEW if field not in values and f'{field}_id' not in values]
+                if absent:
+                    self.error(number, values['barcode'], f"new product needs {', '.join(absent)}")
+                    continue
+                created.append(Product(**values))
+                continue
+
+            delta = values.get('stock_quantity', product.stock_quantity) - product.stock_quantity
+            updates = {field: value for field, value in values.items() if getattr(product, field) != value}
+            if not updates:
+                unchanged += 1
+                continue
+            for field, value in updates.items():
+                setattr(product, field, value)
+            product.updated_at = now
+            changed.append(product)
+            if delta:
+                stock_moves[product.pk] = delta
+                logs.append(InventoryLog(
+                    product=product,
+                    action='add' if delta > 0 else 'remove',
+                    quantity=abs(delta),
+                    user=self.user,
+                    note='Catalog import'
+                ))
+
+        Product.objects.bulk_create(created)
+        logs.extend(
+            InventoryLog(product=product, action='add', quantity=product.stock_quantity,
+                         user=self.user, note='Initial stock (catalog import)')
+            for product in created
+            if product.stock_quantity
+        )
+        Product.objects.bulk_update(changed, UPDATABLE + ['updated_at'])
+        if stock_moves:
+            Product.objects.filter(pk__in=stock_moves).update(stock_quantity=Case(
+                *(When(pk=pk, then=F('stock_quantity') + delta) for pk, delta in stock_moves.items())
+            ))
+        InventoryLog.objects.bulk_create(logs)
+        for product_id in escrowed:
+            escrow.reconcile(product_id)
+        return len(created), len(changed), unchanged
+
+    def finish(self):
+        from .analytics import stock_changed
+        from .stock_alerts import refresh_thresholds, sync_alerts
+
+        if self.result.created or self.result.updated:
+            refresh_thresholds()
+            sync_alerts()
+            stock_changed()
+
+
+def import_catalog(file, filename, user=None, batch_size=BATCH_SIZE):
+    """Create or update products from a CSV/XLSX file; returns an ImportResult"""
+    return CatalogImporter(user, batch_size).run(read_rows(file, filename))
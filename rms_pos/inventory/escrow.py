@@ -0,0 +1,148 @@
+"""
+Stock escrow for hot products.
+
+When every terminal sells the same promoted product, locking its Product row
+at checkout lets only one sale through at a time. Products flagged with
+``escrow_enabled`` instead have their stock dealt out into StockAllotment
+rows, one per slot. A terminal decrements its own slot with a conditional
+update and never touches the Product row, so terminals on different slots
+do not wait for each other.
+
+``reconcile`` folds what the slots have sold back into
+``Product.stock_quantity`` and deals the reconciled total out again. It runs
+from the ``rebalance_stock_escrow`` command, on demand when a terminal's
+slots run dry, and around manual stock edits. Between runs,
+``stock_quantity`` can overstate stock by at most what was sold since the
+last reconcile.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import stock_changed
+from .models import Product, StockAllotment
+from .stock_alerts import sync_alerts
+
+# How many other slots a terminal tries before forcing a reconcile
+BORROW_ATTEMPTS = 3
+
+
+def escrow_slots():
+    return getattr(settings, 'STOCK_ESCROW_SLOTS', 4)
+
+
+def slot_for(user):
+    """Terminals are keyed by the logged in cashier"""
+    return (user.pk or 0) % escrow_slots()
+
+
+def _take_from(product_id, slot, quantity):
+    return StockAllotment.objects.filter(
+        product_id=product_id,
+        slot=slot,
+        remaining__gte=quantity
+    ).update(remaining=F('remaining') - quantity) == 1
+
+
+def _take_any(product_id, slot, quantity):
+    if _take_from(product_id, slot, quantity):
+        return True
+    # Our slot is dry; borrow from whichever slots have the most left
+    others = StockAllotment.objects.filter(
+        product_id=product_id,
+        remaining__gte=quantity
+    ).exclude(slot=slot).order_by('-remaining').values_list('slot', flat=True)
+    for other in others[:BORROW_ATTEMPTS]:
+        if _take_from(product_id, other, quantity):
+            return True
+    return False
+
+
+def _take_pooled(product_id, quantity):
+    allotments = list(
+        StockAllotment.objects.select_for_update()
+        .filter(product_id=product_id)
+        .order_by('slot')
+    )
+    if sum(a.remaining for a in allotments) < quantity:
+        return False
+    for allotment in sorted(allotments, key=lambda a: -a.remaining):
+        used = min(allotment.remaining, quantity)
+        allotment.remaining -= used
+        quantity -= used
+        if not quantity:
+            break
+    StockAllotment.objects.bulk_update(allotments, ['remaining'])
+    return True
+
+
+def take(product_id, quantity, slot):
+    """Decrement escrowed stock, returning False if there is not enough"""
+    if _take_any(product_id, slot, quantity):
+        return True
+    # No single slot can cover the line: re-deal the stock, then split the
+    # line across slots under a lock. This is the slow path, not the norm.
+    reconcile(product_id)
+    return _take_pooled(product_id, quantity)
+
+
+@transaction.atomic
+def reconcile(product_id):
+    """Fold sold allotments into stock_quantity and deal the total out again"""
+    product = Product.objects.select_for_update().get(pk=product_id)
+    allotments = list(
+        StockAllotment.objects.select_for_update()
+        .filter(product_id=product_id)
+        .order_by('slot')
+    )
+    sold = sum(a.allotted - a.remaining for a in allotments)
+    stock = product.stock_quantity - sold
+    now = timezone.now()
+    if sold:
+        from pos import live
+
+        Product.objects.filter(pk=product_id).update(stock_quantity=stock, updated_at=now)
+        stock_changed()
+        sync_alerts(Product.objects.filter(pk=product_id))
+        # Checkout never locks escrowed products, so their crossings are reported here
+        live.stock_levels_changed({product: (product.stock_quantity, stock)})
+
+    if not product.escrow_enabled:
+        if allotments:
+            StockAllotment.objects.filter(product_id=product_id).delete()
+        return stock
+
+    slots = escrow_slots()
+    share, extra = divmod(max(stock, 0), slots)
+    existing = {a.slot: a for a in allotments}
+    to_create = []
+    to_update = []
+    for slot in range(slots):
+        quantity = share + (1 if slot < extra else 0)
+        allotment = existing.pop(slot, None)
+        if allotment is None:
+            to_create.append(StockAllotment(
+                product_id=product_id,
+                slot=slot,
+                allotted=quantity,
+                remaining=quantity
+            ))
+        else:
+            allotment.allotted = allotment.remaining = quantity
+            allotment.updated_at = now
+            to_update.append(allotment)
+
+    StockAllotment.objects.bulk_create(to_create)
+    StockAllotment.objects.bulk_update(to_update, ['allotted', 'remaining', 'updated_at'])
+    if existing:
+        # STOCK_ESCROW_SLOTS was lowered since the last run
+        StockAllotment.objects.filter(pk__in=[a.pk for a in existing.values()]).delete()
+    return stock
+
+
+def products_to_reconcile():
+    """Hot products, plus products whose escrow was just switched off"""
+    return Product.objects.filter(escrow_enabled=True).values_list('pk', flat=True).union(
+        StockAllotment.objects.filter(product__escrow_enabled=False).values_list('product_id', flat=True)
+    )
@@ -0,0 +1,38 @@
+"""
+Row producer for the product CSV export, shared by the streaming view and
+background export jobs. Returns ``(filename, header, rows)``.
+"""
+from core.streaming import pk_chunks
+from .models import Product
+from .stock_alerts import low_stock_filter
+
+PRODUCTS_HEADER = ['Name', 'Category', 'Barcode', 'Cost', 'Discount (%)', 'Stock Quantity']
+
+
+def _product_rows(products):
+    for product in pk_chunks(products):
+        yield [
+            product.name,
+            product.category.name if product.category else 'Uncategorized',
+            product.barcode,
+            product.cost,
+            product.discount_percentage,
+            product.stock_quantity
+        ]
+
+
+def products_export(params):
+    status = params.get('stock_status', 'all')
+    products = Product.objects.select_related('category').only(
+        'name', 'barcode', 'cost', 'discount_percentage', 'stock_quantity', 'category__name'
+    )
+    filename = "products_all"
+
+    if status == 'low':
+        products = products.filter(low_stock_filter())
+        filename = "products_low_stock"
+    elif status == 'instock':
+        products = products.exclude(low_stock_filter())
+        filename = "products_in_stock"
+
+    return filename, PRODUCTS_HEADER, _product_rows(products)
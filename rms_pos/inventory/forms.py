@@ -4,7 +4,7 @@ from .models import Product, Category
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['name', 'category', 'barcode', 'price', 'discount_percentage', 'cost', 'stock_quantity', 'image']
+        fields = ['name', 'category', 'barcode', 'price', 'discount_percentage', 'cost', 'stock_quantity', 'reorder_level', 'image']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md'}),
             'category': forms.Select(attrs={'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md'}),
@@ -13,10 +13,17 @@ class ProductForm(forms.ModelForm):
             'discount_percentage': forms.NumberInput(attrs={'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md', 'step': '0.01', 'min': '0', 'max': '100'}),
             'cost': forms.NumberInput(attrs={'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md'}),
             'stock_quantity': forms.NumberInput(attrs={'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md'}),
+            'reorder_level': forms.NumberInput(attrs={'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md', 'min': '0'}),
             'image': forms.FileInput(attrs={'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md'}),
         }
 
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
-        fields = ['name', 'description']
+        fields = ['name', 'description', 'reorder_level']
+
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="CSV or XLSX with a header row: name, category, barcode, price, cost, discount, stock, reorder level",
+        widget=forms.FileInput(attrs={'accept': '.csv,.xlsx', 'class': 'shadow-sm focus:ring-indigo-500 focus:border-indigo-500 block w-full sm:text-sm border-gray-300 rounded-md'})
+    )
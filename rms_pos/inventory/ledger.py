@@ -0,0 +1,190 @@
+"""
+Stock ledger: InventoryLog balances, snapshots and reconciliation.
+
+InventoryLog is append-only. 'add' entries count up, and 'remove' and
+'sale' entries count down, so a product's ledger balance is the signed
+sum of its entries. An InventorySnapshot records that balance as of a log
+id. Any balance is then the nearest snapshot plus the short tail of entries
+after it, and never a scan of the product's whole history.
+
+``walk`` goes through the catalogue a chunk of products at a time:
+- the chunk's product and allotment rows are locked, as a checkout locks them;
+- one query reads each product's latest snapshot and its stock;
+- one grouped query sums every product's tail.
+The locks are what make a snapshot safe: ids are handed out before commit, so
+without them an entry could commit below a snapshot that was already taken.
+
+Comparing the ledger with ``stock_quantity`` is the ``reconcile_inventory``
+command, which also takes new snapshots as it goes. For escrowed products,
+the units sold from allotments but not yet reconciled are subtracted from
+``stock_quantity`` first, because their sale entries are already in the
+ledger.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, When
+from django.utils import timezone
+
+from .models import InventoryLog, InventorySnapshot, Product, StockAllotment
+
+SIGNED_QUANTITY = Case(
+    When(action='add', then=F('quantity')),
+    default=-F('quantity'),
+    output_field=IntegerField(),
+)
+
+# Two query parameters per product in the tail query
+CHUNK_SIZE = 400
+
+Balance = namedtuple('Balance', 'product_id name stock ledger entries last_log_id as_of')
+
+
+def snapshot_min_entries():
+    return getattr(settings, 'INVENTORY_SNAPSHOT_MIN_ENTRIES', 100)
+
+
+def balance_at(product_id, when=None):
+    """Ledger balance of a product at when (default: now)"""
+    snapshots = InventorySnapshot.objects.filter(product_id=product_id)
+    tail = InventoryLog.objects.filter(product_id=product_id)
+    if when is not None:
+        snapshots = snapshots.filter(as_of__lte=when)
+        tail = tail.filter(timestamp__lte=when)
+    snapshot = snapshots.order_by('-log_id').values_list('log_id', 'balance').first()
+    log_id, balance = snapshot or (0, 0)
+    delta = tail.filter(id__gt=log_id).aggregate(delta=Sum(SIGNED_QUANTITY))['delta'] or 0
+    if when is not None:
+        from .archive import archived_delta
+        # Only reads archive files when the snapshot predates archived entries
+        delta += archived_delta(product_id, log_id, when)
+    return balance + delta
+
+
+def unreconciled_sales(product_ids):
+    """{product_id: units sold from escrow allotments not yet folded into stock_quantity}"""
+    rows = StockAllotment.objects.filter(product_id__in=product_ids).values('product_id').annotate(
+        sold=Sum(F('allotted') - F('remaining'))
+    ).order_by()
+    return {row['product_id']: row['sold'] or 0 for row in rows}
+
+
+def _lock(product_ids):
+    """Hold the rows a sale locks while it logs: the product's, or its escrow allotments'"""
+    list(Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk').values_list('pk', flat=True))
+    list(
+        StockAllotment.objects.select_for_update().filter(product_id__in=product_ids)
+        .order_by('product_id', 'slot').values_list('pk', flat=True)
+    )
+
+
+@transaction.atomic
+def product_balances(product_ids, upto=None):
+    """[Balance] for a chunk of at most CHUNK_SIZE products; upto limits the ledger to log ids <= upto"""
+    if upto is None:
+        # A checkout still holding one of these rows may log an entry with a
+        # lower id than one already committed. Waiting for it means every
+        # entry up to last_id has committed, so a snapshot there misses none,
+        # and stock and ledger are read at the same point.
+        _lock(product_ids)
+    latest = InventorySnapshot.objects.filter(product=OuterRef('pk')).order_by('-log_id')
+    if upto is not None:
+        latest = latest.filter(log_id__lte=upto)
+    products = Product.objects.filter(pk__in=product_ids).annotate(
+        snapshot_log_id=Subquery(latest.values('log_id')[:1]),
+        snapshot_balance=Subquery(latest.values('balance')[:1]),
+    ).values_list('pk', 'name', 'stock_quantity', 'snapshot_log_id', 'snapshot_balance')
+    products = list(products)
+
+    # Whole history for products never snapshotted, the tail for the rest
+    tails = Q(product_id__in=[pk for pk, _, _, log_id, _ in products if log_id is None])
+    for pk, _, _, log_id, _ in products:
+        if log_id is not None:
+            tails |= Q(product_id=pk, id__gt=log_id)
+    logs = InventoryLog.objects.filter(tails)
+    if upto is not None:
+        logs = logs.filter(id__lte=upto)
+    sums = {
+        row['product_id']: row
+        for row in logs.values('product_id').annotate(
+            delta=Sum(SIGNED_QUANTITY),
+            entries=Count('id'),
+            last_log_id=Max('id'),
+            as_of=Max('timestamp'),
+        ).order_by()
+    }
+    pending = unreconciled_sales(product_ids)
+
+    balances = []
+    for pk, name, stock, log_id, balance in products:
+        tail = sums.get(pk, {})
+        balances.append(Balance(
+            product_id=pk,
+            name=name,
+            stock=stock - pending.get(pk, 0),
+            ledger=(balance or 0) + (tail.get('delta') or 0),
+            entries=tail.get('entries', 0),
+            last_log_id=tail.get('last_log_id'),
+            as_of=tail.get('as_of'),
+        ))
+    return balances
+
+
+def walk(chunk_size=CHUNK_SIZE, products=None, upto=None):
+    """Yield a list of Balance per chunk of products, in pk order; upto limits the ledger to log ids <= upto"""
+    products = (products if products is not None else Product.objects.all()).order_by('pk')
+    last_pk = 0
+    while True:
+        ids = list(products.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield product_balances(ids, upto)
+        last_pk = ids[-1]
+
+
+def take_snapshots(balances, min_entries=None):
+    """Snapshot the products whose tail has grown to min_entries; returns how many were taken"""
+    if min_entries is None:
+        min_entries = snapshot_min_entries()
+    snapshots = [
+        InventorySnapshot(
+            product_id=balance.product_id,
+            log_id=balance.last_log_id,
+            as_of=balance.as_of,
+            balance=balance.ledger,
+        )
+        for balance in balances
+        if balance.entries and balance.entries >= min_entries
+    ]
+    InventorySnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+    return len(snapshots)
+
+
+@transaction.atomic
+def fix_drift(product_id, trust):
+    """Make stock and ledger agree for one product; trust='ledger' rewrites stock, 'stock' appends an entry"""
+    from . import escrow
+
+    if StockAllotment.objects.filter(product_id=product_id).exists():
+        # Fold escrow sales into stock_quantity so both sides count them once
+        escrow.reconcile(product_id)
+    product = Product.objects.select_for_update().get(pk=product_id)
+    # Recomputed under the lock; a sale may have landed since the walk
+    drift = product.stock_quantity - balance_at(product_id)
+    if not drift:
+        return 0
+
+    if trust == 'ledger':
+        product.stock_quantity -= drift
+        product.save(update_fields=['stock_quantity', 'updated_at'])
+        if product.escrow_enabled:
+            escrow.reconcile(product_id)
+    else:
+        InventoryLog.objects.create(
+            product=product,
+            action='add' if drift > 0 else 'remove',
+            quantity=abs(drift),
+            note=f'Ledger reconciliation at {timezone.now():%Y-%m-%d %H:%M}',
+        )
+    return drift
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from inventory.archive import archive_logs, horizon, hot_months, pending
+
+
+class Command(BaseCommand):
+    help = "Move InventoryLog rows older than the hot months into compressed monthly archive files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help='Whole months to keep in the table besides the current one (default: INVENTORY_LOG_HOT_MONTHS)')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the months that would be archived')
+
+    def handle(self, *args, **options):
+        months = hot_months() if options['months'] is None else options['months']
+        before = horizon(months)
+        if options['dry_run']:
+            for month, rows in pending(before):
+                self.stdout.write(f"{month:%Y-%m}: {rows} rows")
+            return
+        archives = archive_logs(before)
+        for archive in archives:
+            self.stdout.write(f"{archive.month:%Y-%m}: {archive.row_count} rows -> {archive.file.name}")
+        self.stdout.write(
+            f"Archived {sum(archive.row_count for archive in archives)} inventory log rows "
+            f"logged before {before:%Y-%m-%d}"
+        )
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.thumbnails import build, pending
+
+
+class Command(BaseCommand):
+    help = "Build resized WebP/JPEG thumbnails for product images that do not have current ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds between passes when looping')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild every product, e.g. after changing PRODUCT_THUMBNAIL_WIDTHS')
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        while True:
+            built = failed = original_bytes = thumbnail_bytes = 0
+            for product in pending(rebuild).only('pk', 'image').iterator():
+                thumbnails = build(product)
+                if thumbnails is None:
+                    failed += 1
+                    self.stderr.write(f"Could not read the image of product #{product.pk} ({product.image.name})")
+                    continue
+                built += 1
+                original_bytes += product.image.size
+                # The POS grid loads the smallest JPEG
+                thumbnail_bytes += product.image.storage.size(thumbnails['jpeg'][min(thumbnails['jpeg'], key=int)])
+            if built or failed or options['verbosity'] > 1 or not options['loop']:
+                summary = f"Built thumbnails for {built} products"
+                if built:
+                    summary += (f"; smallest JPEG {thumbnail_bytes / 1024:.0f} KB in total"
+                                f" against {original_bytes / 1024:.0f} KB of original images")
+                if failed:
+                    summary += f"; {failed} unreadable"
+                self.stdout.write(summary)
+            if not options['loop']:
+                break
+            rebuild = False
+            time.sleep(options['interval'])
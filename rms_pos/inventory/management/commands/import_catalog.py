@@ -0,0 +1,37 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.catalog_import import BATCH_SIZE, import_catalog
+
+
+class Command(BaseCommand):
+    help = "Create or update products from a CSV or XLSX catalog, matched by barcode"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file with a header row')
+        parser.add_argument('--user', help='Username recorded on the inventory log entries')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['user']}")
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as file:
+                result = import_catalog(file, options['path'], user=user, batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error.row} ({error.barcode or 'no barcode'}): {error.message}")
+        self.stdout.write(
+            f"{result.total} rows in {time.perf_counter() - started:.1f}s: {result.created} created, "
+            f"{result.updated} updated, {result.unchanged} unchanged, {len(result.errors)} skipped"
+        )
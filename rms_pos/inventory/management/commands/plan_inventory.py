@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.planning import plan_inventory
+
+
+class Command(BaseCommand):
+    help = "Forecast daily demand and recompute reorder points and order quantities for every product"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products = plan_inventory()
+        self.stdout.write(f"Planned {products} products in {time.perf_counter() - started:.1f}s")
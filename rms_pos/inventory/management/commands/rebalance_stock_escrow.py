@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.escrow import products_to_reconcile, reconcile
+
+
+class Command(BaseCommand):
+    help = "Fold sold escrow allotments into Product.stock_quantity and redistribute hot product stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between passes when looping')
+
+    def handle(self, *args, **options):
+        while True:
+            product_ids = list(products_to_reconcile())
+            for product_id in product_ids:
+                reconcile(product_id)
+            if options['verbosity'] > 1 or not options['loop']:
+                self.stdout.write(f"Reconciled {len(product_ids)} escrowed products")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
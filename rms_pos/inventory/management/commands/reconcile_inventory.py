@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.ledger import CHUNK_SIZE, fix_drift, take_snapshots, walk
+
+
+class Command(BaseCommand):
+    help = "Compare every product's stock_quantity with its InventoryLog ledger and snapshot the ledger balances"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Products checked per batch')
+        parser.add_argument(
+            '--fix', choices=['ledger', 'stock'],
+            help="Resolve drift: 'ledger' sets stock_quantity to the ledger balance, "
+                 "'stock' appends a log entry so the ledger matches stock_quantity"
+        )
+        parser.add_argument('--no-snapshots', action='store_true', help='Only report; do not take ledger snapshots')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products = entries = snapshots = drifted = fixed = 0
+        for balances in walk(options['chunk_size']):
+            products += len(balances)
+            entries += sum(balance.entries for balance in balances)
+            if not options['no_snapshots']:
+                snapshots += take_snapshots(balances)
+            for balance in balances:
+                drift = balance.stock - balance.ledger
+                if not drift:
+                    continue
+                drifted += 1
+                self.stdout.write(
+                    f"#{balance.product_id} {balance.name}: stock {balance.stock}, "
+                    f"ledger {balance.ledger} ({drift:+d})"
+                )
+                if options['fix'] and fix_drift(balance.product_id, options['fix']):
+                    fixed += 1
+
+        self.stdout.write(
+            f"Checked {products} products ({entries} log entries read) in "
+            f"{time.perf_counter() - started:.1f}s: {drifted} drifted, {fixed} fixed, "
+            f"{snapshots} snapshots taken"
+        )
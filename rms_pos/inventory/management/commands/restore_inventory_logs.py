@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.timeranges import parse_month
+from inventory.archive import restore_archive
+from inventory.models import InventoryLogArchive
+
+
+class Command(BaseCommand):
+    help = "Move archived InventoryLog rows back into the table, e.g. for an audit"
+
+    def add_arguments(self, parser):
+        parser.add_argument('months', nargs='*', help='Months to restore as YYYY-MM')
+        parser.add_argument('--all', action='store_true', help='Restore every archive')
+        parser.add_argument('--keep-file', action='store_true', help='Keep the archive files after restoring')
+
+    def handle(self, *args, **options):
+        archives = InventoryLogArchive.objects.all()
+        if not options['all']:
+            if not options['months']:
+                raise CommandError("Give one or more months as YYYY-MM, or --all")
+            firsts = []
+            for value in options['months']:
+                first, _ = parse_month(value)
+                if first is None:
+                    raise CommandError(f"Not a YYYY-MM month: {value}")
+                firsts.append(first)
+            archives = archives.filter(month__in=firsts)
+
+        total = 0
+        for archive in archives:
+            restored = restore_archive(archive, keep_file=options['keep_file'])
+            total += restored
+            self.stdout.write(f"{archive.month:%Y-%m}: restored {restored} of {archive.row_count} rows")
+        self.stdout.write(f"Restored {total} inventory log rows")
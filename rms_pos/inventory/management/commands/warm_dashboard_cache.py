@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import versioned_cache
+from inventory.analytics import warm
+
+
+class Command(BaseCommand):
+    help = "Precompute the cached dashboard analytics widgets in the shared cache (run after deploy)"
+
+    def handle(self, *args, **options):
+        if not versioned_cache.is_shared():
+            # Entries warmed in this process's memory would die with it
+            raise CommandError(
+                "The default cache is per-process, so no web worker would see the warmed widgets; "
+                "set CACHE_BACKEND to a shared cache such as RedisCache first"
+            )
+        widgets = warm()
+        self.stdout.write(f"Warmed {len(widgets)} dashboard widgets: {', '.join(widgets)}")
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_product_discount_percentage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='escrow_enabled',
+            field=models.BooleanField(default=False, help_text='Split stock into per-terminal allotments so busy terminals do not queue on this product'),
+        ),
+        migrations.CreateModel(
+            name='StockAllotment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('allotted', models.IntegerField(default=0)),
+                ('remaining', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allotments', to='inventory.product')),
+            ],
+            options={
+                'unique_together': {('product', 'slot')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stock_escrow'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['product', 'timestamp'], name='inv_log_product_timestamp'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_inventorylog_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPlanning',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('velocity', models.FloatField(default=0, help_text='Average daily sales over the last 28 days')),
+                ('smoothed_demand', models.FloatField(default=0, help_text='Exponentially smoothed daily demand')),
+                ('demand_std', models.FloatField(default=0, help_text='Standard deviation of daily sales over the last 91 days')),
+                ('history_days', models.IntegerField(default=0, help_text='Days of sales history the forecast is based on')),
+                ('reorder_point', models.IntegerField(default=0)),
+                ('order_quantity', models.IntegerField(default=0, help_text='Suggested quantity to order now')),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='planning', to='inventory.product')),
+            ],
+        ),
+    ]
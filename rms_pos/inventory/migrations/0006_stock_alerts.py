@@ -0,0 +1,76 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_thresholds_and_alerts(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    ProductPlanning = apps.get_model('inventory', 'ProductPlanning')
+    StockAlert = apps.get_model('inventory', 'StockAlert')
+    forecast = ProductPlanning.objects.filter(product=OuterRef('pk')).values('reorder_point')
+    Product.objects.update(low_stock_threshold=Coalesce(Subquery(forecast), Value(10)))
+    low = Product.objects.filter(stock_quantity__lte=F('low_stock_threshold'))
+    StockAlert.objects.bulk_create(
+        [
+            StockAlert(product_id=product_id, stock_quantity=stock, threshold=threshold)
+            for product_id, stock, threshold in low.values_list('pk', 'stock_quantity', 'low_stock_threshold')
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_productplanning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.IntegerField()),
+                ('stock_quantity', models.IntegerField(help_text='Stock when the alert was raised')),
+                ('opened_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='reorder_level',
+            field=models.IntegerField(blank=True, help_text='Default low-stock threshold for products in this category without a forecast', null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='low_stock_threshold',
+            field=models.IntegerField(default=10, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reorder_level',
+            field=models.IntegerField(blank=True, help_text='Low-stock threshold; leave blank to use the demand forecast or the category default', null=True),
+        ),
+        migrations.AlterField(
+            model_name='productplanning',
+            name='reorder_point',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock_quantity__lte', models.F('low_stock_threshold'))), fields=['stock_quantity'], name='inv_product_low_stock'),
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='inventory.product'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockalert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('product',), name='inv_stock_alert_one_open'),
+        ),
+        migrations.RunPython(backfill_thresholds_and_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_stock_alerts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('log_id', models.BigIntegerField()),
+                ('as_of', models.DateTimeField(help_text='Timestamp of the last log entry included')),
+                ('balance', models.IntegerField()),
+                ('taken_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['product', 'id'], name='inv_log_product_id'),
+        ),
+        migrations.AddField(
+            model_name='inventorysnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshots', to='inventory.product'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorysnapshot',
+            index=models.Index(fields=['product', 'as_of'], name='inventory_i_product_a1822f_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='inventorysnapshot',
+            unique_together={('product', 'log_id')},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_ledger_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, help_text='First day of the month the rows were logged in')),
+                ('file', models.FileField(upload_to='archive/inventory_logs/')),
+                ('row_count', models.IntegerField(default=0)),
+                ('first_log_id', models.BigIntegerField()),
+                ('last_log_id', models.BigIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['month', 'first_log_id'],
+            },
+        ),
+    ]
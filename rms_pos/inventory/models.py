@@ -3,6 +3,7 @@ from django.db import models
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    reorder_level = models.IntegerField(null=True, blank=True, help_text="Default low-stock threshold for products in this category without a forecast")
 
     class Meta:
         verbose_name_plural = 'Categories'
@@ -18,16 +19,43 @@ class Product(models.Model):
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Discount percentage (0-100)")
     cost = models.DecimalField(max_digits=10, decimal_places=2, help_text="Cost price per unit")
     stock_quantity = models.IntegerField(default=0)
+    reorder_level = models.IntegerField(null=True, blank=True, help_text="Low-stock threshold; leave blank to use the demand forecast or the category default")
+    # Effective threshold kept up to date by inventory.stock_alerts.refresh_thresholds
+    low_stock_threshold = models.IntegerField(default=10, editable=False)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized copies of image built by `manage.py build_thumbnails` (inventory.thumbnails);
+    # thumbnail_source is the image they were made from, so a new upload shows as pending
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+    thumbnail_source = models.CharField(max_length=100, blank=True, editable=False)
+    escrow_enabled = models.BooleanField(default=False, help_text="Split stock into per-terminal allotments so busy terminals do not queue on this product")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Only low-stock rows are indexed, so "below threshold" is a small index scan
+            models.Index(
+                fields=['stock_quantity'],
+                condition=models.Q(stock_quantity__lte=models.F('low_stock_threshold')),
+                name='inv_product_low_stock'
+            ),
+        ]
+
     def get_discounted_price(self):
         if self.discount_percentage > 0:
             discount_amount = (self.price * self.discount_percentage) / 100
             return round(self.price - discount_amount, 2)
         return self.price
 
+    def get_thumbnail_url(self):
+        """Smallest thumbnail, or the uploaded image while its thumbnails are pending"""
+        from .thumbnails import thumbnail_urls
+
+        urls = thumbnail_urls(self)
+        if urls:
+            return urls['src']
+        return self.image.url if self.image else None
+
     def __str__(self):
         return self.name
 
@@ -44,5 +72,140 @@ class InventoryLog(models.Model):
     user = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True)
     note = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'timestamp'], name='inv_log_product_timestamp'),
+            # Ledger tails: a product's entries after its latest snapshot
+            models.Index(fields=['product', 'id'], name='inv_log_product_id'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.action} - {self.quantity}"
+
+class InventorySnapshot(models.Model):
+    """A product's ledger balance as of an InventoryLog row (see inventory.ledger)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='ledger_snapshots')
+    # Last InventoryLog id included; not a foreign key so old log rows can be archived
+    log_id = models.BigIntegerField()
+    as_of = models.DateTimeField(help_text="Timestamp of the last log entry included")
+    balance = models.IntegerField()
+    taken_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('product', 'log_id')
+        indexes = [
+            models.Index(fields=['product', 'as_of']),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.balance} as of log #{self.log_id}"
+
+class InventoryLogArchive(models.Model):
+    """Gzip-compressed CSV of InventoryLog rows moved out of the table (see inventory.archive)"""
+    month = models.DateField(db_index=True, help_text="First day of the month the rows were logged in")
+    file = models.FileField(upload_to='archive/inventory_logs/')
+    row_count = models.IntegerField(default=0)
+    first_log_id = models.BigIntegerField()
+    last_log_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['month', 'first_log_id']
+
+    def __str__(self):
+        return f"Inventory logs {self.month:%Y-%m} ({self.row_count} rows)"
+
+class StockAllotment(models.Model):
+    """Slice of a hot product's stock that one group of terminals sells from"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='allotments')
+    slot = models.PositiveSmallIntegerField()
+    allotted = models.IntegerField(default=0)
+    remaining = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('product', 'slot')
+
+    def __str__(self):
+        return f"{self.product.name} - slot {self.slot} - {self.remaining}/{self.allotted}"
+
+class ProductPlanning(models.Model):
+    """Demand forecast and reorder point for a product, computed by the plan_inventory command"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='planning')
+    # Units per day
+    velocity = models.FloatField(default=0, help_text="Average daily sales over the last 28 days")
+    smoothed_demand = models.FloatField(default=0, help_text="Exponentially smoothed daily demand")
+    demand_std = models.FloatField(default=0, help_text="Standard deviation of daily sales over the last 91 days")
+    history_days = models.IntegerField(default=0, help_text="Days of sales history the forecast is based on")
+    # None until there is enough history to forecast from
+    reorder_point = models.IntegerField(null=True, blank=True)
+    order_quantity = models.IntegerField(default=0, help_text="Suggested quantity to order now")
+    days_of_cover = models.FloatField(null=True, blank=True)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.product.name}: reorder at {self.reorder_point if self.reorder_point is not None else '-'}"
+
+class StockAlertQuerySet(models.QuerySet):
+    def open(self):
+        return self.filter(resolved_at__isnull=True)
+
+class StockAlert(models.Model):
+    """A product that fell to its low-stock threshold; resolved once stock climbs back above it"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    threshold = models.IntegerField()
+    stock_quantity = models.IntegerField(help_text="Stock when the alert was raised")
+    opened_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    objects = StockAlertQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also the index the dashboard counts open alerts from
+            models.UniqueConstraint(
+                fields=['product'],
+                condition=models.Q(resolved_at__isnull=True),
+                name='inv_stock_alert_one_open'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.stock_quantity} <= {self.threshold}"
+
+class StockTake(models.Model):
+    """A stock count session; counts are submitted in batches and applied in one go (see inventory.stock_take)"""
+    STATUS_CHOICES = (
+        ('open', 'Counting'),
+        ('applied', 'Applied'),
+        ('cancelled', 'Cancelled'),
+    )
+    name = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open', db_index=True)
+    created_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, related_name='stock_takes')
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    applied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.name or f"Stock take #{self.pk}"
+
+class StockTakeCount(models.Model):
+    stock_take = models.ForeignKey(StockTake, on_delete=models.CASCADE, related_name='counts')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_take_counts')
+    counted = models.IntegerField()
+    # stock_quantity the count was compared with; set when the stock take is applied
+    expected = models.IntegerField(null=True, blank=True)
+    counted_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, related_name='+')
+    counted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('stock_take', 'product')
+
+    def __str__(self):
+        return f"{self.product.name}: {self.counted}"
@@ -0,0 +1,152 @@
+"""
+Demand forecasts and reorder points for the whole catalogue.
+
+``plan_inventory`` reads the ProductDailySales rollup in a single grouped
+query. It returns one row per product, with the units sold in a few age bands
+(last 7 days, 7-28 days ago and so on) plus the sum of squares over the
+variance window. From those few numbers per SKU it derives:
+
+- velocity: mean units per day over the last 28 days
+- smoothed_demand: exponentially weighted daily demand (half-life
+  PLANNING_HALF_LIFE_DAYS), taking each band's daily rate as uniform
+- demand_std: standard deviation of daily sales over the last 91 days
+- reorder_point: demand over the lead time plus safety stock,
+  ceil(d * L + z * std * sqrt(L))
+- order_quantity: what brings stock up to cover lead time + review period
+
+Days before a product was created are left out of its averages. Products
+with less than PLANNING_MIN_HISTORY_DAYS of history get no reorder point.
+Their low-stock threshold falls back as described in inventory.stock_alerts.
+"""
+import datetime
+import math
+
+from django.conf import settings
+from django.db.models import F, Min, Q, Sum
+from django.utils import timezone
+
+from core.streaming import chunk_size
+from .models import Product, ProductPlanning
+from .stock_alerts import refresh_thresholds, sync_alerts
+
+# Age bands in days, [newer, older); velocity and variance windows end on band edges
+BANDS = ((0, 7), (7, 28), (28, 91), (91, 365), (365, 730))
+VELOCITY_DAYS = 28
+VARIANCE_DAYS = 91
+
+FIELDS = [
+    'velocity', 'smoothed_demand', 'demand_std', 'history_days',
+    'reorder_point', 'order_quantity', 'days_of_cover', 'computed_at',
+]
+
+
+def _options():
+    return {
+        'half_life': getattr(settings, 'PLANNING_HALF_LIFE_DAYS', 14),
+        'lead_time': getattr(settings, 'PLANNING_LEAD_TIME_DAYS', 7),
+        'review': getattr(settings, 'PLANNING_REVIEW_DAYS', 14),
+        'service_z': getattr(settings, 'PLANNING_SERVICE_Z', 1.65),
+        'min_history': getattr(settings, 'PLANNING_MIN_HISTORY_DAYS', 14),
+    }
+
+
+def _band_sums(today):
+    """{product_id: row} with units sold per age band, sum of squares and first ever sale date"""
+    from pos.models import ProductDailySales
+
+    def ages(newer, older):
+        return Q(date__lte=today - datetime.timedelta(days=newer), date__gt=today - datetime.timedelta(days=older))
+
+    aggregates = {f'band{i}': Sum('quantity', filter=ages(*band)) for i, band in enumerate(BANDS)}
+    aggregates['variance_squares'] = Sum(F('quantity') * F('quantity'), filter=ages(0, VARIANCE_DAYS))
+    aggregates['first_sale'] = Min('date')
+    # No date range in WHERE: the bands bound every sum, and grouping in
+    # (product, date) index order beats sorting a range scan of the date index
+    rows = ProductDailySales.objects.filter(product__isnull=False)\
+        .values('product_id').annotate(**aggregates).order_by()
+    return {row['product_id']: row for row in rows.iterator(chunk_size=chunk_size())}
+
+
+def _units(row, days):
+    """Units sold in the last days, which must end on a band edge"""
+    return sum(row.get(f'band{i}') or 0 for i, (_, older) in enumerate(BANDS) if older <= days)
+
+
+def _overlap(newer, older, history_days):
+    """Days of [newer, older) that fall within the product's history"""
+    return max(0, min(older, history_days) - newer)
+
+
+def forecast(row, stock, history_days, options):
+    """Planning figures for one product from its band sums"""
+    beta = 0.5 ** (1 / options['half_life'])
+    weighted = weights = 0.0
+    for i, (newer, older) in enumerate(BANDS):
+        days = _overlap(newer, older, history_days)
+        if not days:
+            continue
+        # Exact sum of beta ** age over the band's days
+        weight = beta ** newer * (1 - beta ** days) / (1 - beta)
+        weighted += weight * (row.get(f'band{i}') or 0) / days
+        weights += weight
+    smoothed = weighted / weights if weights else 0.0
+
+    velocity_days = _overlap(0, VELOCITY_DAYS, history_days)
+    velocity = _units(row, VELOCITY_DAYS) / velocity_days if velocity_days else 0.0
+
+    variance_days = _overlap(0, VARIANCE_DAYS, history_days)
+    std = 0.0
+    if variance_days:
+        mean = _units(row, VARIANCE_DAYS) / variance_days
+        std = math.sqrt(max(0.0, (row.get('variance_squares') or 0) / variance_days - mean * mean))
+
+    lead_time = options['lead_time']
+    safety = options['service_z'] * std * math.sqrt(lead_time)
+    if history_days < options['min_history']:
+        reorder_point = None
+    else:
+        reorder_point = math.ceil(smoothed * lead_time + safety)
+    order_up_to = smoothed * (lead_time + options['review']) + safety
+    return {
+        'velocity': velocity,
+        'smoothed_demand': smoothed,
+        'demand_std': std,
+        'history_days': history_days,
+        'reorder_point': reorder_point,
+        'order_quantity': max(0, math.ceil(order_up_to - stock)),
+        'days_of_cover': stock / smoothed if smoothed > 0 else None,
+    }
+
+
+def plan_inventory():
+    """Recompute ProductPlanning and low-stock thresholds for every product; returns the number of products"""
+    options = _options()
+    now = timezone.now()
+    today = timezone.localdate()
+    sums = _band_sums(today)
+
+    plans = []
+    products = Product.objects.order_by().values_list('id', 'stock_quantity', 'created_at')
+    for product_id, stock, created_at in products.iterator(chunk_size=chunk_size()):
+        row = sums.get(product_id, {})
+        start = timezone.localdate(created_at)
+        if row.get('first_sale'):
+            # Sales imported from before the product row existed still count
+            start = min(start, row['first_sale'])
+        history_days = min((today - start).days + 1, BANDS[-1][1])
+        plans.append(ProductPlanning(
+            product_id=product_id,
+            computed_at=now,
+            **forecast(row, stock, history_days, options)
+        ))
+
+    ProductPlanning.objects.bulk_create(
+        plans,
+        batch_size=2000,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=FIELDS,
+    )
+    refresh_thresholds()
+    sync_alerts()
+    return len(plans)
@@ -0,0 +1,96 @@
+"""
+Per-product low-stock thresholds and the queue of open low-stock alerts.
+
+A product's threshold is, in order of preference:
+- its own ``reorder_level``;
+- the reorder point from the demand forecast (inventory.planning);
+- its category's ``reorder_level``;
+- LOW_STOCK_LEVEL.
+
+The result is stored on ``Product.low_stock_threshold``. A partial index
+over the rows with ``stock_quantity <= low_stock_threshold`` makes the
+low-stock product list an index scan.
+
+When stock falls to the threshold, a StockAlert is opened. It is resolved
+as soon as stock is back above the threshold. Checkout records crossings
+from the stock figures it already holds, so a sale that crosses nothing
+costs no extra queries. Product and category saves re-check the products
+they touch. The dashboard counts open alerts instead of scanning the
+catalogue.
+"""
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Category, Product, ProductPlanning, StockAlert
+
+# Threshold for products with no level of their own, forecast or category default
+LOW_STOCK_LEVEL = 10
+
+
+def low_stock_filter():
+    """Q for products at or below their threshold; matches the inv_product_low_stock index"""
+    return Q(stock_quantity__lte=F('low_stock_threshold'))
+
+
+def refresh_thresholds(products=None):
+    """Recompute low_stock_threshold for a Product queryset (default: all) in one UPDATE"""
+    if products is None:
+        products = Product.objects.all()
+    forecast = ProductPlanning.objects.filter(product=OuterRef('pk')).values('reorder_point')
+    category_default = Category.objects.filter(pk=OuterRef('category_id')).values('reorder_level')
+    return products.update(low_stock_threshold=Coalesce(
+        'reorder_level',
+        Subquery(forecast),
+        Subquery(category_default),
+        Value(LOW_STOCK_LEVEL),
+    ))
+
+
+def sync_alerts(products=None):
+    """Open and resolve alerts to match current stock for a Product queryset (default: all)"""
+    from .analytics import stock_changed
+
+    alerts = StockAlert.objects.open()
+    if products is None:
+        products = Product.objects.all()
+    else:
+        alerts = alerts.filter(product__in=products.values('pk'))
+    low = {
+        product_id: (stock, threshold)
+        for product_id, stock, threshold in products.filter(low_stock_filter())
+        .values_list('pk', 'stock_quantity', 'low_stock_threshold')
+    }
+    open_ids = set(alerts.values_list('product_id', flat=True))
+
+    StockAlert.objects.bulk_create(
+        [
+            StockAlert(product_id=product_id, stock_quantity=stock, threshold=threshold)
+            for product_id, (stock, threshold) in low.items()
+            if product_id not in open_ids
+        ],
+        ignore_conflicts=True,
+    )
+    resolved = open_ids - low.keys()
+    if resolved:
+        StockAlert.objects.open().filter(product_id__in=resolved).update(resolved_at=timezone.now())
+    if resolved or low.keys() - open_ids:
+        stock_changed()
+
+
+def record_levels(levels):
+    """Open or resolve alerts for products whose stock crossed their threshold; levels is {product: (before, after)}"""
+    opened = [
+        StockAlert(product=product, stock_quantity=after, threshold=product.low_stock_threshold)
+        for product, (before, after) in levels.items()
+        if before > product.low_stock_threshold >= after
+    ]
+    recovered = [
+        product.pk
+        for product, (before, after) in levels.items()
+        if before <= product.low_stock_threshold < after
+    ]
+    if opened:
+        StockAlert.objects.bulk_create(opened, ignore_conflicts=True)
+    if recovered:
+        StockAlert.objects.open().filter(product_id__in=recovered).update(resolved_at=timezone.now())
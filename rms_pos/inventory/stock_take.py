@@ -0,0 +1,209 @@
+"""
+Stock takes: count the shelves, then correct stock_quantity in one pass.
+
+Scanners post counted quantities in batches to an open StockTake. Each batch
+resolves its barcodes in one query and upserts StockTakeCount rows in one
+statement. In 'add' mode, several people can count the same product in
+different aisles and their counts are summed.
+
+``apply`` runs in a single transaction:
+- one UPDATE records every count's expected stock (the product's current
+  stock_quantity);
+- the differing counts become 'add'/'remove' InventoryLog rows through
+  bulk_create;
+- one UPDATE moves each product's stock_quantity by its variance.
+Stock is moved by the variance rather than set to the count, so a sale
+that lands between those statements is not undone. Escrowed products are
+reconciled first, as in edit_product, so their figure includes what the
+terminals have sold.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import InventoryLog, Product, StockAllotment, StockTake, StockTakeCount
+
+# Counts accepted per request
+MAX_BATCH = 5000
+
+# Barcodes per lookup query; below SQLite's parameter limit
+LOOKUP_CHUNK = 500
+
+MODES = ('set', 'add')
+
+
+def _product_ids(barcodes):
+    ids = {}
+    barcodes = list(barcodes)
+    for start in range(0, len(barcodes), LOOKUP_CHUNK):
+        ids.update(Product.objects.filter(barcode__in=barcodes[start:start + LOOKUP_CHUNK])
+                   .values_list('barcode', 'pk'))
+    return ids
+
+
+@transaction.atomic
+def record_counts(stock_take_id, counts, user=None, mode='set'):
+    """Store a batch of counts, [{'barcode' or 'product_id', 'quantity'}]; returns (accepted, errors)"""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of: {', '.join(MODES)}")
+    if len(counts) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} counts per request")
+    # Serialises batches for one stock take, so 'add' counts are not lost and apply waits
+    stock_take = StockTake.objects.select_for_update().get(pk=stock_take_id)
+    if stock_take.status != 'open':
+        raise ValueError(f"Stock take is {stock_take.get_status_display().lower()}")
+
+    barcodes = _product_ids({str(count['barcode']) for count in counts if count.get('barcode') is not None})
+    product_ids = {count['product_id'] for count in counts if isinstance(count.get('product_id'), int)}
+    known = set()
+    ids = list(product_ids)
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        known.update(Product.objects.filter(pk__in=ids[start:start + LOOKUP_CHUNK]).values_list('pk', flat=True))
+
+    quantities = {}
+    errors = []
+    for i, count in enumerate(counts):
+        quantity = count.get('quantity')
+        if 'barcode' in count:
+            product_id = barcodes.get(str(count['barcode']))
+        else:
+            product_id = count.get('product_id') if count.get('product_id') in known else None
+        if product_id is None:
+            errors.append({'index': i, 'error': 'Unknown product'})
+        elif not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+            errors.append({'index': i, 'error': 'quantity must be a whole number, 0 or more'})
+        elif mode == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        else:
+            quantities[product_id] = quantity
+
+    if mode == 'add' and quantities:
+        ids = list(quantities)
+        for start in range(0, len(ids), LOOKUP_CHUNK):
+            earlier = stock_take.counts.filter(product_id__in=ids[start:start + LOOKUP_CHUNK])\
+                .values_list('product_id', 'counted')
+            for product_id, counted in earlier:
+                quantities[product_id] += counted
+
+    StockTakeCount.objects.bulk_create(
+        [
+            StockTakeCount(stock_take=stock_take, product_id=product_id, counted=quantity, counted_by=user)
+            for product_id, quantity in quantities.items()
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['stock_take', 'product'],
+        update_fields=['counted', 'counted_by', 'counted_at'],
+    )
+    return len(counts) - len(errors), errors
+
+
+@transaction.atomic
+def apply(stock_take_id, user=None):
+    """Move stock to the counted figures and log the variances; returns the report totals"""
+    from . import escrow
+    from .analytics import stock_changed
+    from .stock_alerts import sync_alerts
+
+    stock_take = StockTake.objects.select_for_update().get(pk=stock_take_id)
+    if stock_take.status != 'open':
+        raise ValueError(f"Stock take is {stock_take.get_status_display().lower()}")
+    counts = stock_take.counts.all()
+    counted_products = counts.values('product_id')
+
+    escrowed = set(Product.objects.filter(pk__in=counted_products, escrow_enabled=True).values_list('pk', flat=True))
+    escrowed.update(StockAllotment.objects.filter(product_id__in=counted_products).values_list('product_id', flat=True))
+    for product_id in escrowed:
+        escrow.reconcile(product_id)
+
+    counts.update(expected=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('stock_quantity')[:1]))
+    varied = counts.exclude(counted=F('expected'))
+    note = f"Stock take: {stock_take}"
+    InventoryLog.objects.bulk_create(
+        (
+            InventoryLog(
+                product_id=product_id,
+                action='add' if counted > expected else 'remove',
+                quantity=abs(counted - expected),
+                user=user,
+                note=note,
+            )
+            for product_id, counted, expected in varied.values_list('product_id', 'counted', 'expected').iterator()
+        ),
+        batch_size=1000,
+    )
+    variance = varied.filter(product_id=OuterRef('pk')).values(variance=F('counted') - F('expected'))[:1]
+    Product.objects.filter(pk__in=varied.values('product_id')).update(
+        stock_quantity=F('stock_quantity') + Subquery(variance),
+        updated_at=timezone.now(),
+    )
+    for product_id in escrowed:
+        escrow.reconcile(product_id)
+
+    stock_take.status = 'applied'
+    stock_take.applied_by = user
+    stock_take.applied_at = timezone.now()
+    stock_take.save(update_fields=['status', 'applied_by', 'applied_at'])
+
+    sync_alerts(Product.objects.filter(pk__in=counted_products))
+    stock_changed()
+    _publish_stock(varied)
+    return totals(stock_take)
+
+
+@transaction.atomic
+def cancel(stock_take_id):
+    stock_take = StockTake.objects.select_for_update().get(pk=stock_take_id)
+    if stock_take.status != 'open':
+        raise ValueError(f"Stock take is {stock_take.get_status_display().lower()}")
+    stock_take.status = 'cancelled'
+    stock_take.save(update_fields=['status'])
+
+
+def _publish_stock(varied):
+    """Update this process's POS search index once the new figures are committed"""
+    from pos.search import product_index
+
+    if not product_index.ready:
+        return
+    stock = dict(Product.objects.filter(pk__in=varied.values('product_id')).values_list('pk', 'stock_quantity'))
+    transaction.on_commit(lambda: product_index.set_stock(stock))
+
+
+def _with_expected(stock_take):
+    """Counts annotated with expected stock: stored once applied, live before"""
+    counts = stock_take.counts.all()
+    if stock_take.status == 'applied':
+        return counts.annotate(expected_stock=F('expected'))
+    return counts.annotate(expected_stock=F('product__stock_quantity'))
+
+
+def totals(stock_take):
+    """Summary of a stock take's variances"""
+    counts = _with_expected(stock_take).annotate(variance=F('counted') - F('expected_stock'))
+    over = counts.filter(variance__gt=0).aggregate(
+        products=Count('id'), units=Sum('variance'), value=Sum(F('variance') * F('product__cost'))
+    )
+    short = counts.filter(variance__lt=0).aggregate(
+        products=Count('id'), units=Sum('variance'), value=Sum(F('variance') * F('product__cost'))
+    )
+    return {
+        'status': stock_take.status,
+        'counted': counts.count(),
+        'over': {key: value or 0 for key, value in over.items()},
+        'short': {key: value or 0 for key, value in short.items()},
+    }
+
+
+def variance_rows(stock_take, only_varied=True):
+    """(name, barcode, expected, counted, variance, variance at cost) per product, costliest shortfall first"""
+    counts = _with_expected(stock_take).annotate(
+        variance=F('counted') - F('expected_stock'),
+        value=(F('counted') - F('expected_stock')) * F('product__cost'),
+    )
+    if only_varied:
+        counts = counts.exclude(variance=0)
+    rows = counts.order_by('value', 'product__name').values_list(
+        'product__name', 'product__barcode', 'expected_stock', 'counted', 'variance', 'value'
+    )
+    return rows.iterator()
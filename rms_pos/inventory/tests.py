@@ -0,0 +1,189 @@
+import datetime
+import io
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from inventory.archive import archive_logs, restore_archive
+from inventory.catalog_import import RowError, import_catalog
+from inventory.ledger import balance_at
+from inventory.models import Category, InventoryLog, InventorySnapshot, Product, StockTake, StockTakeCount
+from inventory.stock_take import apply, record_counts
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}})
+class InventoryLogArchiveTests(TestCase):
+    def test_archive_round_trip_goes_through_storage(self):
+        category = Category.objects.create(name='Fruit')
+        product = Product.objects.create(name='Apple', category=category, barcode='1', price=1, cost=1, stock_quantity=9)
+        old = InventoryLog.objects.bulk_create([
+            InventoryLog(product=product, action='add', quantity=10),
+            InventoryLog(product=product, action='sale', quantity=3),
+        ])
+        # auto_now_add stamps the insert time; age the rows past the horizon
+        InventoryLog.objects.filter(pk__in=[log.pk for log in old]).update(
+            timestamp=timezone.now() - datetime.timedelta(days=800)
+        )
+        InventoryLog.objects.create(product=product, action='add', quantity=2)
+
+        [archive] = archive_logs()
+        name = archive.file.name
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(archive.row_count, 2)
+        self.assertEqual(InventoryLog.objects.count(), 1)
+        # The snapshot taken while archiving stands in for the moved rows
+        self.assertEqual(balance_at(product.pk), 9)
+
+        self.assertEqual(restore_archive(archive), 2)
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(
+            sorted(InventoryLog.objects.values_list('action', 'quantity')),
+            [('add', 2), ('add', 10), ('sale', 3)],
+        )
+        self.assertEqual(balance_at(product.pk), 9)
+
+
+class StockTakeCountsTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Fruit')
+        Product.objects.create(name='Apple', category=category, barcode='1', price=1, cost=1, stock_quantity=5)
+        self.manager = get_user_model().objects.create_user('manager', password='x', role='manager')
+        self.stock_take = StockTake.objects.create(name='Aisle 1', created_by=self.manager)
+        self.url = f'/inventory/stock-takes/{self.stock_take.pk}/api/counts/'
+        self.body = '{"counts": [{"barcode": "1", "quantity": 3}]}'
+
+    def test_cashiers_cannot_record_counts(self):
+        self.client.force_login(get_user_model().objects.create_user('cashier', password='x'))
+        response = self.client.post(self.url, self.body, content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(StockTakeCount.objects.exists())
+
+    def test_managers_record_counts(self):
+        self.client.force_login(self.manager)
+        response = self.client.post(self.url, self.body, content_type='application/json')
+        self.assertEqual(response.json(), {'accepted': 1, 'errors': []})
+        self.assertEqual(StockTakeCount.objects.get().counted, 3)
+
+
+class StockTakeApplyTests(TestCase):
+    def test_apply_moves_stock_by_the_variance_once(self):
+        category = Category.objects.create(name='Fruit')
+        over = Product.objects.create(name='Apple', category=category, barcode='a', price=1, cost=2, stock_quantity=10)
+        short = Product.objects.create(name='Pear', category=category, barcode='b', price=1, cost=3, stock_quantity=5)
+        exact = Product.objects.create(name='Plum', category=category, barcode='c', price=1, cost=1, stock_quantity=7)
+        manager = get_user_model().objects.create_user('manager', password='x', role='manager')
+        stock_take = StockTake.objects.create(name='Aisle 1', created_by=manager)
+        accepted, errors = record_counts(stock_take.pk, [
+            {'barcode': 'a', 'quantity': 12},
+            {'barcode': 'b', 'quantity': 3},
+            {'barcode': 'c', 'quantity': 7},
+        ], user=manager)
+        self.assertEqual((accepted, errors), (3, []))
+
+        summary = apply(stock_take.pk, user=manager)
+        self.assertEqual(summary['over'], {'products': 1, 'units': 2, 'value': 4})
+        self.assertEqual(summary['short'], {'products': 1, 'units': -2, 'value': -6})
+        self.assertEqual(
+            dict(stock_take.counts.values_list('product_id', 'expected')),
+            {over.pk: 10, short.pk: 5, exact.pk: 7},
+        )
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'stock_quantity')),
+            {over.pk: 12, short.pk: 3, exact.pk: 7},
+        )
+        self.assertEqual(
+            sorted(InventoryLog.objects.values_list('product_id', 'action', 'quantity', 'note')),
+            [(over.pk, 'add', 2, 'Stock take: Aisle 1'), (short.pk, 'remove', 2, 'Stock take: Aisle 1')],
+        )
+        stock_take.refresh_from_db()
+        self.assertEqual((stock_take.status, stock_take.applied_by), ('applied', manager))
+
+        with self.assertRaisesMessage(ValueError, 'Stock take is applied'):
+            apply(stock_take.pk, user=manager)
+        self.assertEqual(Product.objects.get(pk=over.pk).stock_quantity, 12)
+        self.assertEqual(InventoryLog.objects.count(), 2)
+
+
+@override_settings(INVENTORY_SNAPSHOT_MIN_ENTRIES=3)
+class LedgerTests(TestCase):
+    def reconcile(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_inventory', *args, stdout=out)
+        return out.getvalue()
+
+    def test_snapshot_plus_tail_and_drift(self):
+        category = Category.objects.create(name='Fruit')
+        apple = Product.objects.create(name='Apple', category=category, barcode='1', price=1, cost=1, stock_quantity=12)
+        pear = Product.objects.create(name='Pear', category=category, barcode='2', price=1, cost=1, stock_quantity=4)
+        InventoryLog.objects.bulk_create([
+            InventoryLog(product=apple, action='add', quantity=20),
+            InventoryLog(product=apple, action='sale', quantity=5),
+            InventoryLog(product=apple, action='remove', quantity=1),
+            InventoryLog(product=pear, action='add', quantity=4),
+        ])
+        Product.objects.filter(pk=apple.pk).update(stock_quantity=14)
+
+        output = self.reconcile()
+        self.assertIn('2 products', output)
+        self.assertIn('0 drifted', output)
+        # Apple's three entries reached the threshold; Pear's one did not
+        snapshot = InventorySnapshot.objects.get()
+        self.assertEqual((snapshot.product_id, snapshot.balance), (apple.pk, 14))
+
+        InventoryLog.objects.bulk_create([
+            InventoryLog(product=apple, action='sale', quantity=3),
+            InventoryLog(product=apple, action='add', quantity=2),
+        ])
+        self.assertEqual(balance_at(apple.pk), 13)
+        # A write that bypassed the ledger
+        Product.objects.filter(pk=apple.pk).update(stock_quantity=10)
+
+        output = self.reconcile('--no-snapshots')
+        self.assertIn(f'#{apple.pk} Apple: stock 10, ledger 13 (-3)', output)
+        self.assertIn('(3 log entries read)', output)
+        self.assertIn('1 drifted, 0 fixed', output)
+
+        self.assertIn('1 drifted, 1 fixed', self.reconcile('--fix', 'ledger'))
+        self.assertEqual(Product.objects.get(pk=apple.pk).stock_quantity, 13)
+        self.assertIn('0 drifted', self.reconcile())
+
+
+class CatalogImportTests(TestCase):
+    def test_csv_creates_updates_and_reports_bad_rows(self):
+        user = get_user_model().objects.create_user(username='manager', password='x')
+        fruit = Category.objects.create(name='Fruit')
+        apple = Product.objects.create(name='Apple', category=fruit, barcode='b1', price=2, cost=1, stock_quantity=5)
+        pear = Product.objects.create(name='Pear', category=fruit, barcode='b2', price=3, cost=2, stock_quantity=4)
+        csv_file = io.BytesIO(
+            b'name,category,barcode,price,cost,stock\n'
+            b'Banana,Fruit,b3,1.50,1,12\n'
+            b'Apple,Fruit,b1,2,1,8\n'
+            b'Pear,fruit,b2,3.00,2,4\n'
+            b'Plum,Fruit,b4,abc,1,6\n'
+        )
+
+        result = import_catalog(csv_file, 'catalog.csv', user=user)
+
+        self.assertEqual((result.created, result.updated, result.unchanged), (1, 1, 1))
+        [error] = result.errors
+        self.assertIsInstance(error, RowError)
+        self.assertEqual((error.row, error.barcode), (5, 'b4'))
+        self.assertTrue(error.message.startswith('price:'))
+        self.assertFalse(Product.objects.filter(barcode='b4').exists())
+
+        # Stock moves by the difference to the file's figure, logged once
+        apple.refresh_from_db()
+        self.assertEqual(apple.stock_quantity, 8)
+        [log] = InventoryLog.objects.filter(product=apple)
+        self.assertEqual((log.action, log.quantity, log.note, log.user), ('add', 3, 'Catalog import', user))
+
+        self.assertFalse(InventoryLog.objects.filter(product=pear).exists())
+
+        banana = Product.objects.get(barcode='b3')
+        self.assertEqual((banana.category, banana.stock_quantity), (fruit, 12))
+        [log] = InventoryLog.objects.filter(product=banana)
+        self.assertEqual((log.action, log.quantity, log.note), ('add', 12, 'Initial stock (catalog import)'))
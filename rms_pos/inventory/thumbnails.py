@@ -0,0 +1,126 @@
+"""
+Pre-sized product thumbnails for the POS grid and the product list.
+
+Uploaded product photos are often several megabytes, and the POS search
+returns up to 50 of them per keystroke. ``build_thumbnails`` (run by
+``manage.py build_thumbnails --loop`` next to the web workers) resizes each
+new upload to every PRODUCT_THUMBNAIL_WIDTHS and encodes each size as WebP
+and JPEG. Files are named after a hash of their content under
+MEDIA_ROOT/thumbnails/. A name therefore always means the same bytes, and
+``core.views.thumbnail`` serves them with a one-year immutable Cache-Control.
+
+A product's thumbnails are recorded with the image name they were made from.
+When a new image is uploaded, the names no longer match and the product
+shows its original image until the worker catches up.
+"""
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Product
+
+FORMATS = (
+    # (key, Pillow format, extension)
+    ('webp', 'WEBP', 'webp'),
+    ('jpeg', 'JPEG', 'jpg'),
+)
+
+
+def widths():
+    return sorted(getattr(settings, 'PRODUCT_THUMBNAIL_WIDTHS', (160, 320)))
+
+
+def quality():
+    return getattr(settings, 'PRODUCT_THUMBNAIL_QUALITY', 80)
+
+
+def pending(rebuild=False):
+    """Products with an image whose thumbnails are missing or out of date"""
+    products = Product.objects.exclude(Q(image='') | Q(image__isnull=True))
+    if not rebuild:
+        products = products.exclude(thumbnail_source=F('image'))
+    return products
+
+
+def _encode(image, fmt):
+    out = io.BytesIO()
+    if fmt == 'JPEG':
+        if image.mode != 'RGB':
+            # JPEG has no alpha; flatten onto white like the card background
+            flat = Image.new('RGB', image.size, (255, 255, 255))
+            flat.paste(image, mask=image.getchannel('A'))
+            image = flat
+        image.save(out, 'JPEG', quality=quality(), optimize=True, progressive=True)
+    else:
+        image.save(out, 'WEBP', quality=quality(), method=4)
+    return out.getvalue()
+
+
+def _store(data, extension):
+    name = os.path.join('thumbnails', f"{hashlib.sha256(data).hexdigest()[:20]}.{extension}")
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def render(product):
+    """Resize and store product.image; returns the thumbnails dict saved on the product"""
+    with product.image.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    thumbnails = {'sizes': {}, **{key: {} for key, _, _ in FORMATS}}
+    for width in widths():
+        resized = image.copy()
+        # Fit in a width x width box and never upscale
+        resized.thumbnail((width, width), Image.LANCZOS)
+        thumbnails['sizes'][str(width)] = list(resized.size)
+        for key, fmt, extension in FORMATS:
+            thumbnails[key][str(width)] = _store(_encode(resized, fmt), extension)
+    return thumbnails
+
+
+def build(product):
+    """Build one product's thumbnails; returns the thumbnails dict, or None if the image could not be read"""
+    source = product.image.name
+    try:
+        thumbnails = render(product)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Unreadable or missing file: record the attempt so the worker does not retry it forever
+        thumbnails = None
+    Product.objects.filter(pk=product.pk, image=source).update(
+        thumbnails=thumbnails or {},
+        thumbnail_source=source,
+        updated_at=timezone.now(),
+    )
+    return thumbnails
+
+
+def thumbnail_urls(product):
+    """{'src', 'jpeg_srcset', 'webp_srcset'} for a product with current thumbnails, else None"""
+    thumbnails = product.thumbnails
+    if not product.image or product.thumbnail_source != product.image.name or not thumbnails.get('jpeg'):
+        return None
+
+    def srcset(key):
+        return ', '.join(
+            f"{default_storage.url(name)} {thumbnails['sizes'][width][0]}w"
+            for width, name in sorted(thumbnails[key].items(), key=lambda item: int(item[0]))
+        )
+
+    smallest = min(thumbnails['jpeg'], key=int)
+    return {
+        'src': default_storage.url(thumbnails['jpeg'][smallest]),
+        'jpeg_srcset': srcset('jpeg'),
+        'webp_srcset': srcset('webp'),
+    }
@@ -4,9 +4,19 @@ from . import views
 urlpatterns = [
     path('dashboard/', views.dashboard, name='inventory_dashboard'),
     path('dashboard/api/analytics/', views.dashboard_analytics_api, name='dashboard_analytics_api'),
+    path('dashboard/api/targets/', views.sales_targets_api, name='sales_targets_api'),
+    path('dashboard/api/sales-series/', views.sales_series_api, name='sales_series_api'),
+    path('dashboard/api/top-sellers/', views.top_sellers_api, name='top_sellers_api'),
+    path('dashboard/events/', views.dashboard_events, name='dashboard_events'),
     path('products/', views.product_list, name='product_list'),
 
     path('products/add/', views.add_product, name='add_product'),
     path('products/<int:pk>/edit/', views.edit_product, name='edit_product'),
+    path('products/import/', views.import_products, name='import_products'),
     path('products/export/', views.export_products_data, name='export_products_data'),
+    path('stock-takes/', views.stock_take_list, name='stock_take_list'),
+    path('stock-takes/<int:pk>/', views.stock_take_detail, name='stock_take_detail'),
+    path('stock-takes/<int:pk>/api/counts/', views.stock_take_counts_api, name='stock_take_counts_api'),
+    path('stock-takes/<int:pk>/apply/', views.apply_stock_take, name='apply_stock_take'),
+    path('stock-takes/<int:pk>/cancel/', views.cancel_stock_take, name='cancel_stock_take'),
 ]
@@ -1,61 +1,47 @@
+import datetime
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, F
-from django.db.models.functions import TruncMonth, TruncDay
+from django.db.models import Count
 from django.utils import timezone
-from django.http import JsonResponse
-from .models import Product, Category, InventoryLog
-from .forms import ProductForm
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_POST
+from .models import Product, InventoryLog, StockAlert, StockTake
+from .forms import CatalogImportForm, ProductForm
+from .exports import products_export
+from .analytics import analytics_etag, widget, widget_names
+from .stock_alerts import low_stock_filter
+from . import escrow
 from core.decorators import manager_required
+from core.streaming import csv_response
+from pos.idempotency import idempotent
+
+# Skipped rows listed after a catalog import; the command prints them all
+ERROR_ROWS_SHOWN = 200
+
+# Variance rows shown on a stock take's page; the CSV has them all
+VARIANCE_ROWS_SHOWN = 500
+
+VARIANCE_HEADER = ['Name', 'Barcode', 'Expected', 'Counted', 'Variance', 'Variance at cost']
 
 @login_required
 @manager_required
 def dashboard(request):
-    from pos.models import Sale, SaleItem, SalesTarget
-    from datetime import date
+    from pos.rollups import sales_total, top_selling as top_selling_products
+    from pos.targets import target_progress
     
-    today = timezone.now().date()
-    daily_sales = Sale.objects.filter(created_at__date=today, is_completed=True).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
+    today = timezone.localdate()
+    daily_sales = sales_total(date=today)
     
     total_products = Product.objects.count()
-    low_stock_count = Product.objects.filter(stock_quantity__lte=10).count()
+    low_stock_count = StockAlert.objects.open().count()
     
     # Top Selling Products Logic for Template (optional, can be loaded via API)
-    top_selling = SaleItem.objects.values('product__name')\
-        .annotate(total_qty=Sum('quantity'))\
-        .order_by('-total_qty')[:5]
-
-    # Get active sales targets
-    active_targets = SalesTarget.objects.filter(
-        start_date__lte=today,
-        end_date__gte=today
-    ).select_related('user')
-    
-    # Calculate progress for each target
-    targets_with_progress = []
-    for target in active_targets:
-        if target.user:
-            achieved = Sale.objects.filter(
-                cashier=target.user,
-                created_at__date__gte=target.start_date,
-                created_at__date__lte=target.end_date,
-                is_completed=True
-            ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        else:
-            # Team target
-            achieved = Sale.objects.filter(
-                created_at__date__gte=target.start_date,
-                created_at__date__lte=target.end_date,
-                is_completed=True
-            ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        
-        progress_percent = (achieved / target.target_amount * 100) if target.target_amount > 0 else 0
-        targets_with_progress.append({
-            'target': target,
-            'achieved': achieved,
-            'progress_percent': min(progress_percent, 100)
-        })
+    top_selling = top_selling_products(5)
+
+    # Progress for every active target in one query
+    targets_with_progress = target_progress()
 
     context = {
         'total_products': total_products,
@@ -68,58 +54,86 @@ def dashboard(request):
 
 @login_required
 @manager_required
+@condition(etag_func=analytics_etag)
 def dashboard_analytics_api(request):
-    """API endpoint for dashboard charts"""
-    from pos.models import Sale, SaleItem
-    import datetime
-    
-    # 1. Top Selling Products
-    top_products = SaleItem.objects.values('product__name')\
-        .annotate(total_qty=Sum('quantity'))\
-        .order_by('-total_qty')[:5]
-        
-    top_products_data = {
-        'labels': [item['product__name'] for item in top_products],
-        'data': [item['total_qty'] for item in top_products]
-    }
-    
-    # 2. Low Stock Alerts
-    low_stock_items = Product.objects.filter(stock_quantity__lte=10).values('name', 'stock_quantity')[:10]
-    low_stock_data = {
-        'labels': [item['name'] for item in low_stock_items],
-        'data': [item['stock_quantity'] for item in low_stock_items]
-    }
+    """API endpoint for dashboard charts; ?widget= limits it to some of them"""
+    # Each widget is cached until a sale or stock change invalidates it, and
+    # the ETag lets an unchanged poll return 304 without touching the cache.
+    return JsonResponse({name: widget(name) for name in widget_names(request)})
 
-    # 3. Seasonal Trends (Last 7 Days Sales)
-    last_7_days = timezone.now().date() - datetime.timedelta(days=7)
-    sales_trend = Sale.objects.filter(created_at__date__gte=last_7_days)\
-        .annotate(day=TruncDay('created_at'))\
-        .values('day')\
-        .annotate(total=Sum('total_amount'))\
-        .order_by('day')
-        
-    sales_trend_data = {
-        'labels': [item['day'].strftime('%Y-%m-%d') for item in sales_trend],
-        'data': [float(item['total']) for item in sales_trend]
-    }
-    
+@login_required
+@manager_required
+def sales_targets_api(request):
+    """Progress of the active sales targets, for the dashboard progress bars"""
+    from pos.targets import target_progress, progress_payload
+
+    return JsonResponse({'targets': [progress_payload(item) for item in target_progress()]})
+
+@login_required
+@manager_required
+def sales_series_api(request):
+    """Gap-filled sales series; ?granularity=hour|day|week|month&start=&end=&by=cashier|payment_method|category"""
+    from core.timeranges import parse_date
+    from pos.timeseries import series
+
+    end = parse_date(request.GET.get('end')) or timezone.localdate()
+    start = parse_date(request.GET.get('start')) or end - datetime.timedelta(days=29)
+    try:
+        data = series(request.GET.get('granularity', 'day'), start, end, by=request.GET.get('by') or None)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
+@login_required
+@manager_required
+def top_sellers_api(request):
+    """Best sellers over the last hour, day or week from the streaming tracker"""
+    from pos.top_sellers import WINDOWS, capacity, top_selling
+
+    window = request.GET.get('window', 'day')
+    if window not in WINDOWS:
+        return JsonResponse({'error': f"window must be one of: {', '.join(WINDOWS)}"}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 5)), 1), 50)
+    except ValueError:
+        limit = 5
+    products, total = top_selling(window, limit)
     return JsonResponse({
-        'top_products': top_products_data,
-        'low_stock': low_stock_data,
-        'sales_trend': sales_trend_data
+        'window': window,
+        'products': products,
+        'total_qty': total,
+        # Reported quantities are never low and at most this much high
+        'error_bound': total / capacity(),
     })
 
+@login_required
+@manager_required
+async def dashboard_events(request):
+    """Server-Sent Events stream of live dashboard updates"""
+    from django.core.handlers.asgi import ASGIRequest
+    from core.events import stream
+
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for as long as the stream stays open.
+        # 204 tells EventSource not to reconnect; the page falls back to polling.
+        return HttpResponse(status=204)
+    return StreamingHttpResponse(
+        stream(),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @login_required
 @manager_required
 def product_list(request):
     status = request.GET.get('stock_status', 'all')
-    products = Product.objects.select_related('category').all()
+    products = Product.objects.select_related('category', 'planning').all()
     
     if status == 'low':
-        products = products.filter(stock_quantity__lte=10)
+        products = products.filter(low_stock_filter())
         title = 'Low Stock Items'
     elif status == 'instock':
-        products = products.filter(stock_quantity__gt=10)
+        products = products.exclude(low_stock_filter())
         title = 'In-Stock Items'
     else:
         title = 'All Products'
@@ -157,9 +171,15 @@ def edit_product(request, pk):
     if request.method == 'POST':
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
-            old_stock = Product.objects.get(pk=pk).stock_quantity
+            if product.escrow_enabled or product.allotments.exists():
+                # Count what the terminals have sold before comparing stock
+                old_stock = escrow.reconcile(pk)
+            else:
+                old_stock = Product.objects.get(pk=pk).stock_quantity
             product = form.save()
             new_stock = product.stock_quantity
+            if product.escrow_enabled:
+                escrow.reconcile(pk)
             if new_stock != old_stock:
                 diff = new_stock - old_stock
                 action = 'add' if diff > 0 else 'remove'
@@ -173,40 +193,132 @@ def edit_product(request, pk):
             messages.success(request, 'Product updated successfully.')
             return redirect('product_list')
     else:
+        if product.escrow_enabled:
+            # Show the reconciled figure so saving the form does not restore
+            # stock the terminals have already sold
+            escrow.reconcile(pk)
+            product.refresh_from_db()
         form = ProductForm(instance=product)
     
     return render(request, 'inventory/product_form.html', {'form': form, 'title': 'Edit Product'})
 @login_required
 @manager_required
+def import_products(request):
+    """Upload a CSV/XLSX catalog to create or update products by barcode"""
+    from .catalog_import import import_catalog
+
+    result = None
+    if request.method == 'POST':
+        form = CatalogImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = import_catalog(upload, upload.name, user=request.user)
+            except ValueError as e:
+                form.add_error('file', str(e))
+            else:
+                messages.success(
+                    request,
+                    f"Imported {result.created} new and {result.updated} updated products "
+                    f"({result.unchanged} unchanged, {len(result.errors)} rows skipped)."
+                )
+    else:
+        form = CatalogImportForm()
+    return render(request, 'inventory/product_import.html', {
+        'form': form,
+        'result': result,
+        'errors': result.errors[:ERROR_ROWS_SHOWN] if result else [],
+        'errors_hidden': max(len(result.errors) - ERROR_ROWS_SHOWN, 0) if result else 0,
+    })
+
+@login_required
+@manager_required
 def export_products_data(request):
-    import csv
-    from django.http import HttpResponse
+    return csv_response(*products_export(request.GET))
 
-    status = request.GET.get('stock_status', 'all')
-    products = Product.objects.select_related('category').all()
-    filename = "products_all"
+@login_required
+@manager_required
+def stock_take_list(request):
+    if request.method == 'POST':
+        stock_take = StockTake.objects.create(name=request.POST.get('name', '').strip()[:100], created_by=request.user)
+        return redirect('stock_take_detail', pk=stock_take.pk)
+    stock_takes = StockTake.objects.select_related('created_by').annotate(count_total=Count('counts'))[:50]
+    return render(request, 'inventory/stock_take_list.html', {'stock_takes': stock_takes})
 
-    if status == 'low':
-        products = products.filter(stock_quantity__lte=10)
-        filename = "products_low_stock"
-    elif status == 'instock':
-        products = products.filter(stock_quantity__gt=10)
-        filename = "products_in_stock"
-        
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Name', 'Category', 'Barcode', 'Cost', 'Discount (%)', 'Stock Quantity'])
-    
-    for product in products:
-        writer.writerow([
-            product.name,
-            product.category.name if product.category else 'Uncategorized',
-            product.barcode,
-            product.cost,
-            product.discount_percentage,
-            product.stock_quantity
-        ])
-        
-    return response
+@login_required
+@manager_required
+def stock_take_detail(request, pk):
+    """Variance report; ?format=csv for every row, ?format=json for scanners"""
+    from itertools import islice
+    from .stock_take import totals, variance_rows
+
+    stock_take = get_object_or_404(StockTake, pk=pk)
+    only_varied = request.GET.get('all') != '1'
+    output = request.GET.get('format')
+    if output == 'csv':
+        return csv_response(f"stock_take_{pk}", VARIANCE_HEADER, variance_rows(stock_take, only_varied))
+    summary = totals(stock_take)
+    if output == 'json':
+        return JsonResponse({'id': stock_take.pk, 'name': str(stock_take), **summary})
+    return render(request, 'inventory/stock_take_detail.html', {
+        'stock_take': stock_take,
+        'summary': summary,
+        'rows': list(islice(variance_rows(stock_take, only_varied), VARIANCE_ROWS_SHOWN)),
+        'rows_shown': VARIANCE_ROWS_SHOWN,
+        'only_varied': only_varied,
+    })
+
+@login_required
+@manager_required
+@require_POST
+@idempotent
+def stock_take_counts_api(request, pk):
+    """Record a batch of counts: {"counts": [{"barcode": "...", "quantity": 3}], "mode": "set"|"add"}"""
+    import json
+    from .stock_take import record_counts
+
+    try:
+        data = json.loads(request.body)
+        counts = data.get('counts') if isinstance(data, dict) else None
+        if not isinstance(counts, list) or not all(isinstance(count, dict) for count in counts):
+            return JsonResponse({'error': 'counts must be a list of objects'}, status=400)
+        accepted, errors = record_counts(pk, counts, user=request.user, mode=data.get('mode', 'set'))
+    except StockTake.DoesNotExist:
+        return JsonResponse({'error': 'Stock take not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'accepted': accepted, 'errors': errors})
+
+@login_required
+@manager_required
+@require_POST
+def apply_stock_take(request, pk):
+    from .stock_take import apply
+
+    try:
+        summary = apply(pk, user=request.user)
+    except StockTake.DoesNotExist:
+        raise Http404
+    except ValueError as e:
+        messages.error(request, str(e))
+    else:
+        messages.success(
+            request,
+            f"Stock take applied: {summary['over']['products']} products over, "
+            f"{summary['short']['products']} short."
+        )
+    return redirect('stock_take_detail', pk=pk)
+
+@login_required
+@manager_required
+@require_POST
+def cancel_stock_take(request, pk):
+    from .stock_take import cancel
+
+    try:
+        cancel(pk)
+    except StockTake.DoesNotExist:
+        raise Http404
+    except ValueError as e:
+        messages.error(request, str(e))
+    return redirect('stock_take_detail', pk=pk)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Sale, SaleItem, SalesTarget
+from .models import Sale, SaleItem, SalesTarget, IdempotencyKey, DailySalesSummary, ProductDailySales, Customer, TopSellerBucket, SalesSeriesBucket, ProductAssociation, MarketBasketRun
 
 class SaleItemInline(admin.TabularInline):
     model = SaleItem
@@ -27,3 +27,50 @@ class SalesTargetAdmin(admin.ModelAdmin):
     search_fields = ['user__username']
     date_hierarchy = 'start_date'
 
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'path', 'status_code', 'created_at', 'expires_at']
+    list_filter = ['path', 'status_code']
+    search_fields = ['key']
+    readonly_fields = ['created_at']
+
+@admin.register(DailySalesSummary)
+class DailySalesSummaryAdmin(admin.ModelAdmin):
+    list_display = ['date', 'cashier', 'payment_method', 'sale_count', 'gross_total', 'discount_total', 'tax_total']
+    list_filter = ['payment_method', 'cashier']
+    date_hierarchy = 'date'
+
+@admin.register(ProductDailySales)
+class ProductDailySalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'product', 'quantity', 'revenue', 'cost']
+    search_fields = ['product__name']
+    date_hierarchy = 'date'
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ['mobile', 'name', 'total_spent', 'visit_count', 'last_visit']
+    search_fields = ['mobile', 'name']
+    readonly_fields = ['total_spent', 'visit_count', 'first_visit', 'last_visit']
+
+@admin.register(TopSellerBucket)
+class TopSellerBucketAdmin(admin.ModelAdmin):
+    list_display = ['resolution', 'start', 'total', 'updated_at']
+    list_filter = ['resolution']
+    readonly_fields = ['counts', 'total', 'updated_at']
+
+@admin.register(SalesSeriesBucket)
+class SalesSeriesBucketAdmin(admin.ModelAdmin):
+    list_display = ['granularity', 'start', 'dimension', 'key', 'sale_count', 'quantity', 'amount']
+    list_filter = ['granularity', 'dimension']
+    date_hierarchy = 'start'
+
+@admin.register(ProductAssociation)
+class ProductAssociationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'rank', 'associated', 'pair_count', 'confidence', 'lift']
+    search_fields = ['product__name', 'associated__name']
+    list_select_related = ['product', 'associated']
+
+@admin.register(MarketBasketRun)
+class MarketBasketRunAdmin(admin.ModelAdmin):
+    list_display = ['started_at', 'finished_at', 'incremental', 'sales_processed', 'basket_count', 'last_sale_id']
+    list_filter = ['incremental']
@@ -0,0 +1,196 @@
+"""
+"Frequently bought together" suggestions from market-basket analysis.
+
+The ``build_market_basket`` command streams SaleItem rows in sale order,
+collapses each completed sale into its set of products and counts every pair
+of products that appear together. The counts are kept sparsely in
+ProductPairCount, one row per pair that has occurred at all; the diagonal
+(product_a == product_b) holds how many sales contain each product. From
+these counts, for a product A and a partner B over N baskets:
+
+    support    = count(A, B) / N
+    confidence = count(A, B) / count(A)       share of A's sales that had B
+    lift       = confidence / (count(B) / N)  above 1: more often than chance
+
+Partners seen together at least MARKET_BASKET_MIN_PAIRS times with lift above
+1 are ranked by confidence. The best MARKET_BASKET_TOP_K per product are
+stored in ProductAssociation, so a suggestion request is one indexed read.
+
+``--incremental`` folds in only the sales after the previous run's watermark
+and re-ranks the products that appeared in them. Lift for other products
+drifts slightly as N grows, so run a full build now and then.
+"""
+import itertools
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.streaming import chunk_size
+from .models import MarketBasketRun, ProductAssociation, ProductPairCount, Sale, SaleItem
+
+SUGGESTION_LIMIT = 5
+
+# A sale still pending after this long is taken as abandoned and no longer
+# holds back the watermark; if it is paid later only a full build counts it.
+PENDING_GRACE = timedelta(days=1)
+
+BATCH_SIZE = 1000
+
+
+def _top_k():
+    return getattr(settings, 'MARKET_BASKET_TOP_K', 10)
+
+
+def _min_pairs():
+    return getattr(settings, 'MARKET_BASKET_MIN_PAIRS', 3)
+
+
+def watermark():
+    """Highest sale id at or below which every sale is completed or abandoned"""
+    pending = Sale.objects.filter(is_completed=False, created_at__gte=timezone.now() - PENDING_GRACE)\
+        .order_by('id').values_list('id', flat=True).first()
+    if pending is not None:
+        return pending - 1
+    return Sale.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def count_baskets(after=0, upto=None):
+    """(basket count, Counter of (a, b) product pairs with a <= b) over completed sales after < id <= upto"""
+    items = SaleItem.objects.filter(sale_id__gt=after, sale__is_completed=True, product__isnull=False)
+    if upto is not None:
+        items = items.filter(sale_id__lte=upto)
+    rows = items.order_by('sale_id').values_list('sale_id', 'product_id')
+
+    baskets = 0
+    pairs = Counter()
+    for _, lines in itertools.groupby(rows.iterator(chunk_size=chunk_size()), key=lambda row: row[0]):
+        basket = sorted({product_id for _, product_id in lines})
+        baskets += 1
+        for i, a in enumerate(basket):
+            for b in basket[i:]:
+                pairs[a, b] += 1
+    return baskets, pairs
+
+
+def _store_pairs(pairs, replace):
+    if replace:
+        ProductPairCount.objects.all().delete()
+        existing = {}
+    else:
+        existing = {}
+        firsts = sorted({a for a, _ in pairs})
+        for start in range(0, len(firsts), BATCH_SIZE):
+            rows = ProductPairCount.objects.filter(product_a_id__in=firsts[start:start + BATCH_SIZE])\
+                .values_list('pk', 'product_a_id', 'product_b_id', 'count')
+            for pk, a, b, count in rows.iterator(chunk_size=chunk_size()):
+                if (a, b) in pairs:
+                    existing[a, b] = (pk, count)
+
+    ProductPairCount.objects.bulk_update(
+        [ProductPairCount(pk=pk, count=count + pairs[key]) for key, (pk, count) in existing.items()],
+        ['count'],
+        batch_size=BATCH_SIZE,
+    )
+    ProductPairCount.objects.bulk_create(
+        (
+            ProductPairCount(product_a_id=a, product_b_id=b, count=count)
+            for (a, b), count in pairs.items()
+            if (a, b) not in existing
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def _rank(product_ids, basket_count):
+    """Recompute the stored associations of product_ids (None: every product)"""
+    singles = dict(
+        ProductPairCount.objects.filter(product_a=F('product_b')).values_list('product_a_id', 'count')
+    )
+    if product_ids is None:
+        product_ids = singles.keys()
+        ProductAssociation.objects.all().delete()
+    else:
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            ProductAssociation.objects.filter(product_id__in=product_ids[start:start + BATCH_SIZE]).delete()
+    wanted = set(product_ids)
+
+    partners = defaultdict(list)
+    pairs = ProductPairCount.objects.filter(count__gte=_min_pairs()).exclude(product_a=F('product_b'))\
+        .values_list('product_a_id', 'product_b_id', 'count')
+    for a, b, count in pairs.iterator(chunk_size=chunk_size()):
+        if a in wanted:
+            partners[a].append((b, count))
+        if b in wanted:
+            partners[b].append((a, count))
+
+    top_k = _top_k()
+    associations = []
+    for product_id, candidates in partners.items():
+        scored = []
+        for partner_id, count in candidates:
+            confidence = count / singles[product_id]
+            lift = confidence * basket_count / singles[partner_id]
+            if lift > 1:
+                scored.append((-confidence, -lift, partner_id, count))
+        scored.sort()
+        associations.extend(
+            ProductAssociation(
+                product_id=product_id,
+                associated_id=partner_id,
+                rank=rank,
+                pair_count=count,
+                support=count / basket_count,
+                confidence=-confidence,
+                lift=-lift,
+            )
+            for rank, (confidence, lift, partner_id, count) in enumerate(scored[:top_k], 1)
+        )
+    ProductAssociation.objects.bulk_create(associations, batch_size=BATCH_SIZE)
+    return len(associations)
+
+
+@transaction.atomic
+def build(incremental=False):
+    """Count baskets and refresh the stored associations; returns the MarketBasketRun"""
+    # Concurrent runs queue up on the previous run's row
+    previous = MarketBasketRun.objects.select_for_update().order_by('-id').first()
+    incremental = incremental and previous is not None
+    after = previous.last_sale_id if incremental else 0
+    upto = max(watermark(), after)
+
+    baskets, pairs = count_baskets(after, upto)
+    run = MarketBasketRun.objects.create(
+        incremental=incremental,
+        last_sale_id=upto,
+        basket_count=(previous.basket_count if incremental else 0) + baskets,
+        sales_processed=baskets,
+    )
+    _store_pairs(pairs, replace=not incremental)
+    if run.basket_count:
+        touched = sorted({a for a, b in pairs if a == b}) if incremental else None
+        _rank(touched, run.basket_count)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['finished_at'])
+    return run
+
+
+def suggestions(product_ids, limit=SUGGESTION_LIMIT):
+    """In-stock products most often bought with any of product_ids, strongest first"""
+    from .search import product_payload
+
+    rows = ProductAssociation.objects.filter(product_id__in=product_ids, associated__stock_quantity__gt=0)\
+        .exclude(associated_id__in=product_ids).select_related('associated').order_by('rank')
+    best = {}
+    for row in rows:
+        current = best.get(row.associated_id)
+        if current is None or row.confidence > current.confidence:
+            best[row.associated_id] = row
+    ranked = sorted(best.values(), key=lambda row: (-row.confidence, -row.lift))[:limit]
+    return [
+        dict(product_payload(row.associated), confidence=round(row.confidence, 3), lift=round(row.lift, 2))
+        for row in ranked
+    ]
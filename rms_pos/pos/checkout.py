@@ -0,0 +1,133 @@
+"""
+Set-based checkout engine used by checkout_api.
+
+The whole cart is handled with a fixed number of statements regardless of
+how many lines it has: one ordered ``SELECT ... FOR UPDATE`` over the cart's
+products (a consistent lock order means two terminals can never deadlock on
+each other), one conditional ``UPDATE`` that decrements all stock levels,
+one insert for the Sale and one bulk insert each for SaleItem and
+InventoryLog rows.
+
+Products in stock escrow (see ``inventory.escrow``) are not locked at all;
+each of their lines is a conditional decrement of the terminal's allotment.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from inventory import escrow
+from inventory.analytics import stock_changed
+from inventory.models import Product, InventoryLog
+from inventory.stock_alerts import record_levels
+from . import live
+from .models import Sale, SaleItem
+from .search import product_index
+
+
+def parse_cart(cart):
+    """Collapse the POS cart payload into {product_id: quantity}"""
+    quantities = OrderedDict()
+    for item in cart:
+        product_id = int(item.get('id'))
+        quantity = int(item.get('quantity', 1))
+        if quantity < 1:
+            raise ValueError("Quantity must be at least 1")
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+@transaction.atomic
+def create_sale(cashier, cart):
+    """Create a pending Sale for cart and take its items out of stock"""
+    quantities = parse_cart(cart)
+    if not quantities:
+        raise ValueError("Cart is empty")
+
+    products = list(
+        Product.objects.select_for_update()
+        .filter(id__in=quantities.keys(), escrow_enabled=False)
+        .order_by('id')
+    )
+    locked = {product.id for product in products}
+    if len(products) < len(quantities):
+        products += list(
+            Product.objects.filter(id__in=quantities.keys(), escrow_enabled=True).order_by('id')
+        )
+    if len(products) != len(quantities):
+        raise Product.DoesNotExist("Product not found")
+
+    by_id = {product.id: product for product in products}
+    for product_id in locked:
+        product = by_id[product_id]
+        if product.stock_quantity < quantities[product_id]:
+            raise ValueError(f"Insufficient stock for {product.name}")
+
+    if locked:
+        # The rows are locked, but keep the decrement conditional so the
+        # update can never drive stock negative even if a caller skips the lock.
+        enough_stock = Q()
+        new_stock = []
+        for product_id in locked:
+            quantity = quantities[product_id]
+            enough_stock |= Q(id=product_id, stock_quantity__gte=quantity)
+            new_stock.append(When(id=product_id, then=F('stock_quantity') - quantity))
+        updated = Product.objects.filter(enough_stock).update(
+            stock_quantity=Case(*new_stock),
+            updated_at=timezone.now(),
+        )
+        if updated != len(locked):
+            raise ValueError("Stock changed during checkout, please try again")
+
+    slot = escrow.slot_for(cashier)
+    for product_id in sorted(set(quantities) - locked):
+        if not escrow.take(product_id, quantities[product_id], slot):
+            raise ValueError(f"Insufficient stock for {by_id[product_id].name}")
+
+    # Sell at cost, as the POS has always done
+    total_amount = sum(
+        (by_id[product_id].cost * quantity for product_id, quantity in quantities.items()),
+        Decimal('0'),
+    )
+    sale = Sale.objects.create(
+        cashier=cashier,
+        total_amount=total_amount,
+        discount_amount=0,
+    )
+
+    sale_items = []
+    logs = []
+    for product_id, quantity in quantities.items():
+        product = by_id[product_id]
+        sale_items.append(SaleItem(
+            sale=sale,
+            product=product,
+            quantity=quantity,
+            price_at_sale=product.cost,
+            subtotal=product.cost * quantity
+        ))
+        logs.append(InventoryLog(
+            product=product,
+            action='sale',
+            quantity=quantity,
+            user=cashier,
+            note=f"Sale {sale.receipt_number}"
+        ))
+    SaleItem.objects.bulk_create(sale_items)
+    InventoryLog.objects.bulk_create(logs)
+
+    remaining = {
+        product_id: by_id[product_id].stock_quantity - quantities[product_id]
+        for product_id in locked
+    }
+    transaction.on_commit(lambda: product_index.set_stock(remaining))
+    stock_changed()
+    levels = {
+        by_id[product_id]: (by_id[product_id].stock_quantity, stock)
+        for product_id, stock in remaining.items()
+    }
+    record_levels(levels)
+    live.stock_levels_changed(levels)
+    return sale
@@ -0,0 +1,151 @@
+"""
+In-memory prefix index for the receipt page's customer autocomplete.
+
+Mobile numbers and lower-cased name words are kept in sorted lists, so a
+prefix becomes one ``bisect`` range and each keystroke is answered from
+memory. Matches are ranked by visit count, then lifetime spend. Building,
+locking and re-syncing with other workers come from ``pos.search.SyncedIndex``,
+as for the product index. attach_customer refreshes the rows it touches.
+A mobile typed with +91 or a leading 0 is matched against the stored number,
+which has neither.
+"""
+import bisect
+import heapq
+import re
+
+from .search import SyncedIndex, _remove
+
+RESULT_LIMIT = 10
+FIELDS = ('pk', 'name', 'mobile', 'visit_count', 'total_spent', 'last_visit')
+
+# Above this many prefix matches, walking the ranked order beats ranking them all
+SORT_THRESHOLD = 2048
+
+
+def _payload(pk, name, mobile, visit_count, total_spent, last_visit):
+    return {
+        'id': pk,
+        'name': name,
+        'mobile': mobile,
+        'visit_count': visit_count,
+        'total_spent': float(total_spent),
+        'last_visit': last_visit.isoformat(),
+    }
+
+
+def customer_payload(customer):
+    return _payload(*(getattr(customer, field) for field in FIELDS))
+
+
+def mobile_prefix(query):
+    """Digits of a typed mobile prefix as stored, without a +91 or leading 0; None if query is not a number"""
+    query = query.strip()
+    digits = re.sub(r'[\s()+-]', '', query)
+    if not digits.isdigit():
+        return None
+    if query.startswith('+91'):
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = digits[1:]
+    return digits
+
+
+class _Entry:
+    __slots__ = ('mobile', 'words', 'rank', 'payload')
+
+    def __init__(self, pk, name, mobile, visit_count, total_spent, last_visit):
+        self.mobile = mobile
+        self.words = set(name.lower().split())
+        # Regulars first
+        self.rank = (-visit_count, -total_spent, pk)
+        self.payload = _payload(pk, name, mobile, visit_count, total_spent, last_visit)
+
+    @classmethod
+    def of(cls, customer):
+        return cls(*(getattr(customer, field) for field in FIELDS))
+
+    def named(self, terms):
+        return all(any(word.startswith(term) for word in self.words) for term in terms)
+
+
+def _prefix_range(keys, prefix):
+    """Slice bounds of the (key, pk) pairs in keys whose key starts with prefix"""
+    lo = bisect.bisect_left(keys, (prefix,))
+    hi = bisect.bisect_left(keys, (prefix + '\uffff',))
+    return lo, hi
+
+
+class CustomerSearchIndex(SyncedIndex):
+    model = 'pos.Customer'
+
+    def _load(self):
+        rows = self._model().objects.filter(visit_count__gt=0).order_by().values_list(*FIELDS)
+        for row in rows.iterator(chunk_size=2000):
+            yield row[0], _Entry(*row)
+
+    def _entry(self, customer):
+        # Customers whose sales were all re-tagged drop out of the lookup
+        return _Entry.of(customer) if customer.visit_count > 0 else None
+
+    def _index(self, entries):
+        return {
+            '_mobiles': sorted((entry.mobile, pk) for pk, entry in entries.items()),
+            '_words': sorted((word, pk) for pk, entry in entries.items() for word in entry.words),
+        }
+
+    def _reset(self):
+        self._mobiles = []
+        self._words = []
+
+    def _link(self, pk, entry):
+        bisect.insort(self._mobiles, (entry.mobile, pk))
+        for word in entry.words:
+            bisect.insort(self._words, (word, pk))
+
+    def _unlink(self, pk, entry):
+        _remove(self._mobiles, (entry.mobile, pk))
+        for word in entry.words:
+            _remove(self._words, (word, pk))
+
+    def refresh(self, customer_ids):
+        """Re-read customers whose totals changed in this process"""
+        if not self._ready or not customer_ids:
+            return
+        found = self._model().objects.in_bulk(customer_ids)
+        with self._lock:
+            for pk in customer_ids:
+                if pk in found:
+                    self.add(found[pk])
+                else:
+                    self._discard(pk)
+
+    def search(self, query, limit=RESULT_LIMIT):
+        """Payloads of the best customers whose mobile, or every name word typed, matches as a prefix"""
+        self._ensure_fresh()
+        query = query.strip().lower()
+        if not query:
+            return []
+        digits = mobile_prefix(query)
+        with self._lock:
+            if digits is not None:
+                keys, seek = self._mobiles, digits
+                matches = lambda pk, entry: entry.mobile.startswith(digits)
+            else:
+                terms = query.split()
+                # Seek on the longest term; it has the narrowest range
+                keys, seek = self._words, max(terms, key=len)
+                matches = lambda pk, entry: entry.named(terms)
+
+            lo, hi = _prefix_range(keys, seek)
+            if hi - lo > SORT_THRESHOLD:
+                # Common prefixes match a large share of customers
+                return self._walk(limit, matches)
+            candidates = {pk for _, pk in keys[lo:hi]}
+            best = heapq.nsmallest(
+                limit,
+                (self._entries[pk].rank for pk in candidates if matches(pk, self._entries[pk]))
+            )
+            return [self._entries[rank[-1]].payload for rank in best]
+
+
+customer_index = CustomerSearchIndex()
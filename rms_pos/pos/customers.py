@@ -0,0 +1,133 @@
+"""
+Loyalty customers, maintained as sales are tagged with customer details.
+
+customers_list used to group the whole Sale table by customer_mobile on
+every page load. A Customer row now holds the running totals.
+``attach_customer`` moves a sale's amount onto the customer that
+save_customer_details names, and ``rebuild_customers`` (the
+``backfill_customers`` command) recomputes every row from sale history.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from core.streaming import chunk_size
+from .customer_search import customer_index
+from .models import Customer, Sale
+
+
+def normalize_mobile(raw):
+    """Digits only, without a +91 / leading 0 prefix; '' if there are none"""
+    digits = re.sub(r'\D', '', raw or '')
+    if len(digits) == 12 and digits.startswith('91'):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    return digits[:15]
+
+
+def _customer_for(mobile, name, when):
+    """Locked Customer row for mobile, created if this is their first visit"""
+    customer = Customer.objects.select_for_update().filter(mobile=mobile).first()
+    if customer is None:
+        try:
+            with transaction.atomic():
+                return Customer.objects.create(mobile=mobile, name=name, first_visit=when, last_visit=when)
+        except IntegrityError:
+            # Another terminal registered the same number first
+            customer = Customer.objects.select_for_update().get(mobile=mobile)
+    return customer
+
+
+def _count(customer_id, sale, sign):
+    updates = {
+        'total_spent': F('total_spent') + sign * sale.total_amount,
+        'visit_count': F('visit_count') + sign,
+        'updated_at': timezone.now(),
+    }
+    if sign > 0:
+        updates['first_visit'] = Least('first_visit', sale.created_at)
+        updates['last_visit'] = Greatest('last_visit', sale.created_at)
+    Customer.objects.filter(pk=customer_id).update(**updates)
+
+
+@transaction.atomic
+def attach_customer(sale, name, mobile):
+    """Record name and mobile on sale and move its totals onto the matching Customer"""
+    sale = Sale.objects.select_for_update().get(pk=sale.pk)
+    mobile = normalize_mobile(mobile)
+    previous = sale.customer_id
+
+    customer = None
+    if mobile:
+        customer = _customer_for(mobile, name, sale.created_at)
+        if name and name != customer.name:
+            Customer.objects.filter(pk=customer.pk).update(name=name, updated_at=timezone.now())
+
+    if previous != (customer.pk if customer else None):
+        if previous:
+            _count(previous, sale, -1)
+        if customer:
+            _count(customer.pk, sale, +1)
+
+    sale.customer_name = name
+    sale.customer_mobile = mobile
+    sale.customer = customer
+    sale.save(update_fields=['customer_name', 'customer_mobile', 'customer'])
+
+    changed = [pk for pk in (previous, customer.pk if customer else None) if pk]
+    transaction.on_commit(lambda: customer_index.refresh(changed))
+    return sale
+
+
+@transaction.atomic
+def rebuild_customers():
+    """Recompute every Customer from the sales carrying a mobile number; returns the customer count"""
+    totals = {}
+    sales = Sale.objects.exclude(customer_mobile='').order_by('created_at', 'id').values_list(
+        'id', 'customer_mobile', 'customer_name', 'total_amount', 'created_at'
+    )
+    for sale_id, raw_mobile, name, amount, created_at in sales.iterator(chunk_size=chunk_size()):
+        mobile = normalize_mobile(raw_mobile)
+        if not mobile:
+            continue
+        entry = totals.setdefault(mobile, {
+            'name': '', 'total_spent': 0, 'visit_count': 0,
+            'first_visit': created_at, 'last_visit': created_at, 'sales': [],
+        })
+        # Sales are read oldest first, so the latest name given wins
+        entry['name'] = name or entry['name']
+        entry['total_spent'] += amount
+        entry['visit_count'] += 1
+        entry['last_visit'] = created_at
+        entry['sales'].append(sale_id)
+
+    # Customers whose sales have all lost their number keep their row at zero
+    Customer.objects.update(total_spent=0, visit_count=0)
+    existing = Customer.objects.in_bulk(totals.keys(), field_name='mobile')
+    fields = ['name', 'total_spent', 'visit_count', 'first_visit', 'last_visit']
+    to_create, to_update = [], []
+    for mobile, entry in totals.items():
+        customer = existing.get(mobile) or Customer(mobile=mobile)
+        for field in fields:
+            setattr(customer, field, entry[field])
+        (to_update if customer.pk else to_create).append(customer)
+    Customer.objects.bulk_create(to_create, batch_size=1000)
+    Customer.objects.bulk_update(to_update, fields, batch_size=1000)
+
+    ids = dict(Customer.objects.values_list('mobile', 'id').iterator(chunk_size=chunk_size()))
+    Sale.objects.filter(customer_mobile='').exclude(customer=None).update(customer=None)
+    Sale.objects.bulk_update(
+        (
+            Sale(pk=sale_id, customer_id=ids[mobile])
+            for mobile, entry in totals.items()
+            for sale_id in entry['sales']
+        ),
+        ['customer'],
+        batch_size=1000,
+    )
+    transaction.on_commit(customer_index.clear)
+    return len(totals)
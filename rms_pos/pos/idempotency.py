@@ -0,0 +1,146 @@
+"""
+Idempotency-Key support for the POS write APIs.
+
+Store Wi-Fi drops responses, and the browser retries the POST. When the
+request carries an ``Idempotency-Key`` header, the first response is stored
+in IdempotencyKey and a small in-process LRU. Any retry with the same key
+gets that response back instead of running the view again. The key is
+claimed inside the same transaction as the view, so a concurrent duplicate
+waits on the unique index and then replays the committed response. A retry
+must repeat the request exactly: the same key with another user, path or body
+is refused with 422.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+class _LRU:
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, item):
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_recent = _LRU(getattr(settings, 'IDEMPOTENCY_CACHE_SIZE', 1024))
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def _fingerprint(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _replay(request, record):
+    # Keys stored before bodies were fingerprinted have no hash to compare
+    same_body = not record.request_hash or record.request_hash == _fingerprint(request)
+    if record.user_id != request.user.pk or record.path != request.path or not same_body:
+        return JsonResponse({'error': 'Idempotency-Key was already used for a different request'}, status=422)
+    if record.status_code is None:
+        return JsonResponse({'error': 'A request with this Idempotency-Key is still in progress'}, status=409)
+    response = HttpResponse(record.response_body, status=record.status_code, content_type=record.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(request, key):
+    """Reserve key for this request, or return the record of an earlier attempt"""
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=key,
+                    user=request.user,
+                    path=request.path,
+                    request_hash=_fingerprint(request),
+                    expires_at=now + _ttl()
+                )
+            return None
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(key=key).first()
+            if record is None:
+                continue
+            if record.expires_at > now:
+                return record
+            # An expired key counts as unused
+            record.delete()
+    raise IntegrityError(f"Could not claim Idempotency-Key {key}")
+
+
+def idempotent(view_func):
+    """Replay the stored response when a request is retried with the same Idempotency-Key"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key:
+            return view_func(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({'error': 'Idempotency-Key must be at most 255 characters'}, status=400)
+
+        record = _recent.get(key)
+        if record is not None and record.expires_at > timezone.now():
+            return _replay(request, record)
+
+        with transaction.atomic():
+            record = _claim(request, key)
+            if record is not None:
+                _recent.put(key, record)
+                return _replay(request, record)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code >= 500:
+                # Server errors are not final; release the key so a retry runs again
+                transaction.set_rollback(True)
+                return response
+
+            record = IdempotencyKey(
+                key=key,
+                user_id=request.user.pk,
+                path=request.path,
+                request_hash=_fingerprint(request),
+                status_code=response.status_code,
+                content_type=response.get('Content-Type', ''),
+                response_body=response.content.decode(response.charset),
+                expires_at=timezone.now() + _ttl()
+            )
+            IdempotencyKey.objects.filter(key=key).update(
+                status_code=record.status_code,
+                content_type=record.content_type,
+                response_body=record.response_body,
+                expires_at=record.expires_at
+            )
+        _recent.put(key, record)
+        return response
+    return wrapper
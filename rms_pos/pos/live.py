@@ -0,0 +1,62 @@
+"""
+Events pushed to live manager dashboards (see core.events).
+
+Each publisher runs once per committed change, so the work is the same
+however many dashboards are connected. ``sale_completed`` sends the sale
+itself, which each dashboard adds to the daily total it shows, and then the
+target progress, computed once here for every dashboard to apply.
+``stock_levels_changed`` runs one count of the open low-stock alerts, and
+only when a product crosses its threshold; checkout reports the products it
+locks and ``inventory.escrow.reconcile`` the escrowed ones.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from core.events import publish
+
+def sale_completed(sale):
+    """Publish the completed sale, then the target progress it moved, after commit"""
+    payload = {
+        'id': sale.pk,
+        'receipt_number': sale.receipt_number,
+        'total_amount': float(sale.total_amount),
+        'payment_method': sale.payment_method,
+        'cashier_id': sale.cashier_id,
+        'created_at': sale.created_at.isoformat(),
+        # Local date, so dashboards only add it to the day they are showing
+        'date': timezone.localdate(sale.created_at).isoformat(),
+    }
+    transaction.on_commit(lambda: publish('sale', payload))
+    # robust: the sale has committed, so a failure here must not fail the request
+    transaction.on_commit(_publish_targets, robust=True)
+
+
+def _publish_targets():
+    from .targets import progress_payload, target_progress
+
+    targets = [progress_payload(item) for item in target_progress()]
+    if targets:
+        publish('targets', {'targets': targets})
+
+
+def stock_levels_changed(levels):
+    """Publish products whose stock fell to their low-stock threshold; levels is {product: (before, after)}"""
+    crossed = [
+        (product, after)
+        for product, (before, after) in levels.items()
+        if before > product.low_stock_threshold >= after
+    ]
+    if not crossed:
+        return
+
+    def _publish():
+        from inventory.models import StockAlert
+
+        publish('low_stock', {
+            'products': [
+                {'id': product.pk, 'name': product.name, 'stock_quantity': after}
+                for product, after in crossed
+            ],
+            'low_stock_count': StockAlert.objects.open().count(),
+        })
+    transaction.on_commit(_publish)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pos.customers import rebuild_customers
+
+
+class Command(BaseCommand):
+    help = "Build Customer rows and Sale.customer links from the customer details on past sales"
+
+    def handle(self, *args, **options):
+        count = rebuild_customers()
+        self.stdout.write(f"Rebuilt {count} customers")
@@ -0,0 +1,61 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from inventory.models import Category, Product
+from pos.checkout import create_sale
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measure checkout latency and query count against cart size. All writes are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,20,40,80', help='Comma separated cart sizes')
+        parser.add_argument('--runs', type=int, default=100, help='Checkouts per cart size')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        runs = options['runs']
+
+        try:
+            with transaction.atomic():
+                self._run(sizes, runs)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, sizes, runs):
+        cashier = get_user_model().objects.create(username='__checkout_benchmark__')
+        category = Category.objects.create(name='Checkout benchmark')
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Benchmark product {i}',
+                category=category,
+                barcode=f'BENCH-{i:06d}',
+                price=10,
+                cost=8,
+                stock_quantity=runs * 10,
+            )
+            for i in range(max(sizes))
+        ])
+
+        self.stdout.write(f"{'lines':>6} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for size in sizes:
+            cart = [{'id': product.id, 'quantity': 1} for product in products[:size]]
+            timings = []
+            for _ in range(runs):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    create_sale(cashier, cart)
+                    timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            self.stdout.write(f"{size:>6} {len(queries):>8} {p50:>8.2f} {p99:>8.2f}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from pos.basket import build
+
+
+class Command(BaseCommand):
+    help = "Count products bought together and store the top associations per product"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help='Only fold in sales since the last run')
+
+    def handle(self, *args, **options):
+        run = build(incremental=options['incremental'])
+        mode = 'incremental' if run.incremental else 'full'
+        self.stdout.write(
+            f"{mode.capitalize()} run: {run.sales_processed} sales counted, "
+            f"{run.basket_count} in total, up to sale #{run.last_sale_id}"
+        )
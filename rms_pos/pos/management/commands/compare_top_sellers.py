@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.top_sellers import WINDOWS, capacity, exact_top, tracker
+
+
+class Command(BaseCommand):
+    help = "Compare the streaming top sellers with the exact answer from sale lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', choices=sorted(WINDOWS), action='append', help='Window(s) to check, default: all')
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        failed = False
+        for window in options['window'] or WINDOWS:
+            rows, total = tracker.top(window, options['limit'])
+            exact = dict(exact_top(window, limit=None))
+            bound = total / capacity()
+            self.stdout.write(f"{window}: {total} sold, error bound {bound:.1f}")
+            for product_id, quantity, error in rows:
+                actual = exact.get(product_id, 0)
+                # Never an undercount, and never more over than the reported error
+                ok = actual <= quantity <= actual + error and error <= bound
+                failed |= not ok
+                self.stdout.write(
+                    f"  product {product_id}: tracked {quantity} (error <= {error}), exact {actual}"
+                    + ('' if ok else '  OUT OF BOUNDS')
+                )
+            missed = [
+                product_id for product_id, quantity in exact.items()
+                if quantity > bound and product_id not in {row[0] for row in rows}
+                and len(rows) < options['limit']
+            ]
+            if missed:
+                failed = True
+                self.stdout.write(f"  heavy hitters not reported: {missed}")
+        if failed:
+            raise CommandError("Streaming top sellers fell outside the documented error bound")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.timeranges import parse_month, timestamp_filter
+from inventory.models import InventoryLog
+from pos.models import Sale
+
+
+class Command(BaseCommand):
+    help = "Print EXPLAIN plans for the report queries and check they use the sale/log indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Exit with an error if a plan does not use its index')
+
+    def queries(self):
+        today = timezone.localdate()
+        first, last = parse_month(today.strftime('%Y-%m'))
+        completed = Sale.objects.completed()
+        return [
+            ('daily sales', 'pos_sale_completed_created',
+             completed.filter(**timestamp_filter('created_at', today, today)).order_by('-created_at', '-id')),
+            ('monthly sales', 'pos_sale_completed_created',
+             completed.filter(**timestamp_filter('created_at', first, last)).order_by('-created_at', '-id')),
+            ('cashier sales', 'pos_sale_cashier_created',
+             Sale.objects.filter(cashier_id=1, **timestamp_filter('created_at', first, last))),
+            ('product stock history', 'inv_log_product_timestamp',
+             InventoryLog.objects.filter(product_id=1, **timestamp_filter('timestamp', first, last)).order_by('timestamp')),
+        ]
+
+    def handle(self, *args, **options):
+        missing = []
+        for label, index, queryset in self.queries():
+            plan = queryset.explain()
+            self.stdout.write(f"-- {label} (expects {index})\n{plan}\n")
+            if index not in plan:
+                missing.append(label)
+        if missing and options['check']:
+            raise CommandError(f"Index not used for: {', '.join(missing)}")
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from pos.rollups import rebuild_daily_sales, rebuild_in_chunks, rebuild_product_daily_sales
+from pos.timeseries import rebuild_sales_series
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value)
+
+
+class Command(BaseCommand):
+    help = "Recompute the sales rollup tables from raw sales for a date range (inclusive)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_date, help='First day to rebuild (YYYY-MM-DD), default: all history')
+        parser.add_argument('--end', type=_date, help='Last day to rebuild (YYYY-MM-DD), default: today')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days rebuilt per transaction for product rollups and series buckets')
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_sales(options['start'], options['end'])
+        self.stdout.write(f"Rebuilt {rows} daily sales summary rows")
+        rows = rebuild_in_chunks(
+            rebuild_product_daily_sales,
+            options['start'],
+            options['end'],
+            options['chunk_days']
+        )
+        self.stdout.write(f"Rebuilt {rows} product daily sales rows")
+        rows = rebuild_in_chunks(
+            rebuild_sales_series,
+            options['start'],
+            options['end'],
+            options['chunk_days']
+        )
+        self.stdout.write(f"Rebuilt {rows} sales series buckets")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos.top_sellers import rebuild, tracker
+
+
+class Command(BaseCommand):
+    help = "Merge this process's top-seller counts into the stored buckets, or rebuild them from sales"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the buckets exactly from sale lines first')
+        parser.add_argument('--loop', action='store_true', help='Keep pruning expired buckets instead of exiting')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between snapshots with --loop')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            buckets = rebuild()
+            self.stdout.write(f"Rebuilt {buckets} top-seller buckets")
+        while True:
+            tracker.snapshot()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
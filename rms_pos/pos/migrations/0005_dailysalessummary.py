@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_sales(apps, schema_editor):
+    Sale = apps.get_model('pos', 'Sale')
+    DailySalesSummary = apps.get_model('pos', 'DailySalesSummary')
+    rows = Sale.objects.filter(is_completed=True).annotate(
+        day=TruncDate('created_at')
+    ).values('day', 'cashier_id', 'payment_method').annotate(
+        sale_count=Count('id'),
+        gross_total=Sum('total_amount'),
+        discount_total=Sum('discount_amount'),
+        tax_total=Sum('tax_amount')
+    ).order_by()
+    DailySalesSummary.objects.bulk_create(
+        [DailySalesSummary(date=row.pop('day'), **row) for row in rows.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0004_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('upi', 'UPI')], max_length=10)),
+                ('sale_count', models.IntegerField(default=0)),
+                ('gross_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('discount_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tax_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cashier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales summaries',
+                'indexes': [models.Index(fields=['date'], name='pos_dailysa_date_192add_idx')],
+                'unique_together': {('date', 'cashier', 'payment_method')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
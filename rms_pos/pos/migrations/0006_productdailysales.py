@@ -0,0 +1,63 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_product_daily_sales(apps, schema_editor):
+    SaleItem = apps.get_model('pos', 'SaleItem')
+    ProductDailySales = apps.get_model('pos', 'ProductDailySales')
+    line_cost = ExpressionWrapper(
+        F('quantity') * F('product__cost'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+    rows = SaleItem.objects.filter(sale__is_completed=True).annotate(
+        day=TruncDate('sale__created_at')
+    ).values('day', 'product_id').annotate(
+        total_quantity=Sum('quantity'),
+        total_revenue=Sum('subtotal'),
+        total_cost=Sum(line_cost)
+    ).order_by()
+    ProductDailySales.objects.bulk_create(
+        [
+            ProductDailySales(
+                product_id=row['product_id'],
+                date=row['day'],
+                quantity=row['total_quantity'] or 0,
+                revenue=row['total_revenue'] or 0,
+                cost=row['total_cost'] or 0,
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stock_escrow'),
+        ('pos', '0005_dailysalessummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='inventory.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Product daily sales',
+                'indexes': [models.Index(fields=['date', 'product'], name='pos_product_date_d26206_idx')],
+                'unique_together': {('product', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_product_daily_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0006_productdailysales'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['is_completed', 'created_at'], name='pos_sale_completed_created'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['cashier', 'created_at'], name='pos_sale_cashier_created'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0007_sale_report_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mobile', models.CharField(max_length=15, unique=True)),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('visit_count', models.IntegerField(default=0)),
+                ('first_visit', models.DateTimeField()),
+                ('last_visit', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_visit', 'id'], name='pos_custome_last_vi_2e8e87_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='pos.customer'),
+        ),
+    ]
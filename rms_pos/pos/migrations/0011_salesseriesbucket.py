@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0010_topsellerbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesSeriesBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('dimension', models.CharField(blank=True, choices=[('', 'All sales'), ('cashier', 'Cashier'), ('payment_method', 'Payment method'), ('category', 'Category')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=50)),
+                ('sale_count', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'dimension', 'start'], name='pos_salesse_granula_f13be5_idx')],
+                'unique_together': {('granularity', 'dimension', 'key', 'start')},
+            },
+        ),
+    ]
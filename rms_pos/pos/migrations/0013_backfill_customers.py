@@ -0,0 +1,80 @@
+import re
+
+from django.db import migrations
+
+
+def normalize_mobile(raw):
+    """Frozen copy of pos.customers.normalize_mobile as of this migration"""
+    digits = re.sub(r'\D', '', raw or '')
+    if len(digits) == 12 and digits.startswith('91'):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    return digits[:15]
+
+
+def backfill_customers(apps, schema_editor):
+    """
+    Customer rows and Sale.customer links from the details on past sales.
+
+    A frozen copy of pos.customers.rebuild_customers, which migrations cannot
+    import. Every Customer is recomputed and every sale relinked, so the
+    result is the same whatever rows already exist.
+    """
+    Sale = apps.get_model('pos', 'Sale')
+    Customer = apps.get_model('pos', 'Customer')
+
+    totals = {}
+    sales = Sale.objects.exclude(customer_mobile='').order_by('created_at', 'id').values_list(
+        'id', 'customer_mobile', 'customer_name', 'total_amount', 'created_at'
+    )
+    for sale_id, raw_mobile, name, amount, created_at in sales.iterator(chunk_size=2000):
+        mobile = normalize_mobile(raw_mobile)
+        if not mobile:
+            continue
+        entry = totals.setdefault(mobile, {
+            'name': '', 'total_spent': 0, 'visit_count': 0,
+            'first_visit': created_at, 'last_visit': created_at, 'sales': [],
+        })
+        # Sales are read oldest first, so the latest name given wins
+        entry['name'] = name or entry['name']
+        entry['total_spent'] += amount
+        entry['visit_count'] += 1
+        entry['last_visit'] = created_at
+        entry['sales'].append(sale_id)
+
+    # Customers whose sales have all lost their number keep their row at zero
+    Customer.objects.update(total_spent=0, visit_count=0)
+    existing = Customer.objects.in_bulk(totals.keys(), field_name='mobile')
+    fields = ['name', 'total_spent', 'visit_count', 'first_visit', 'last_visit']
+    to_create, to_update = [], []
+    for mobile, entry in totals.items():
+        customer = existing.get(mobile) or Customer(mobile=mobile)
+        for field in fields:
+            setattr(customer, field, entry[field])
+        (to_update if customer.pk else to_create).append(customer)
+    Customer.objects.bulk_create(to_create, batch_size=1000)
+    Customer.objects.bulk_update(to_update, fields, batch_size=1000)
+
+    ids = dict(Customer.objects.values_list('mobile', 'id'))
+    Sale.objects.exclude(customer=None).update(customer=None)
+    Sale.objects.bulk_update(
+        [
+            Sale(pk=sale_id, customer_id=ids[mobile])
+            for mobile, entry in totals.items()
+            for sale_id in entry['sales']
+        ],
+        ['customer'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0012_market_basket'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_customers, migrations.RunPython.noop),
+    ]
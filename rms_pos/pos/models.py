@@ -2,6 +2,31 @@ from django.db import models
 from django.conf import settings
 from inventory.models import Product
 
+class Customer(models.Model):
+    """Loyalty customer keyed by normalized mobile number, with running totals of their sales"""
+    mobile = models.CharField(max_length=15, unique=True)
+    name = models.CharField(max_length=200, blank=True)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    visit_count = models.IntegerField(default=0)
+    first_visit = models.DateTimeField()
+    last_visit = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_visit', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.name or 'Customer'} ({self.mobile})"
+
+class SaleQuerySet(models.QuerySet):
+    def completed(self):
+        # Written as IN (true) rather than =True: Django renders the latter as a
+        # bare boolean column, which SQLite cannot match to the
+        # (is_completed, created_at) index.
+        return self.filter(is_completed__in=[True])
+
 class Sale(models.Model):
     PAYMENT_CHOICES = (
         ('cash', 'Cash'),
@@ -24,10 +49,19 @@ class Sale(models.Model):
     # Customer details for loyalty program
     customer_name = models.CharField(max_length=200, blank=True)
     customer_mobile = models.CharField(max_length=15, blank=True)
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales')
     
     # Payment status - pending until payment is completed
     is_completed = models.BooleanField(default=False)
 
+    objects = SaleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_completed', 'created_at'], name='pos_sale_completed_created'),
+            models.Index(fields=['cashier', 'created_at'], name='pos_sale_cashier_created'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.receipt_number:
             import uuid
@@ -60,3 +94,157 @@ class SalesTarget(models.Model):
 
     def __str__(self):
         return f"Target {self.target_amount} ({self.start_date} - {self.end_date})"
+
+class IdempotencyKey(models.Model):
+    """Stored response for a POS API request, replayed when the client retries it"""
+    key = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, related_name='+')
+    path = models.CharField(max_length=255)
+    # SHA-256 of the request body, so a key reused for a different cart is refused
+    request_hash = models.CharField(max_length=64, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.path})"
+
+class DailySalesSummary(models.Model):
+    """Completed sales rolled up per day, cashier and payment method"""
+    date = models.DateField()
+    cashier = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_sales')
+    payment_method = models.CharField(max_length=10, choices=Sale.PAYMENT_CHOICES)
+    sale_count = models.IntegerField(default=0)
+    gross_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily sales summaries'
+        unique_together = ('date', 'cashier', 'payment_method')
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.cashier} {self.payment_method}: {self.gross_total}"
+
+class ProductDailySales(models.Model):
+    """Completed sale lines rolled up per product and day"""
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='daily_sales')
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Product daily sales'
+        unique_together = ('product', 'date')
+        indexes = [
+            models.Index(fields=['date', 'product']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product}: {self.quantity}"
+
+class TopSellerBucket(models.Model):
+    """Space-Saving summary of the quantities sold in one time bucket (see pos.top_sellers)"""
+    RESOLUTION_CHOICES = [
+        ('5m', '5 minutes'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    start = models.DateTimeField()
+    # {product_id: [count, error]}
+    counts = models.JSONField(default=dict)
+    total = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('resolution', 'start')
+
+    def __str__(self):
+        return f"{self.resolution} {self.start}: {self.total}"
+
+class SalesSeriesBucket(models.Model):
+    """Completed sales counted per hour or day, overall or split by one dimension (see pos.timeseries)"""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    DIMENSION_CHOICES = [
+        ('', 'All sales'),
+        ('cashier', 'Cashier'),
+        ('payment_method', 'Payment method'),
+        ('category', 'Category'),
+    ]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    # Local start of the hour or day
+    start = models.DateTimeField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES, blank=True)
+    # Cashier/category id or payment method; '' for all sales or no cashier/category
+    key = models.CharField(max_length=50, blank=True)
+    sale_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('granularity', 'dimension', 'key', 'start')
+        indexes = [
+            models.Index(fields=['granularity', 'dimension', 'start']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.start} {self.dimension}={self.key}: {self.amount}"
+
+class ProductPairCount(models.Model):
+    """Number of completed sales containing both products (product_a <= product_b; equal ids count the product alone)"""
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product_a', 'product_b')
+        indexes = [
+            models.Index(fields=['product_b']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_a_id} + {self.product_b_id}: {self.count}"
+
+class ProductAssociation(models.Model):
+    """A product often bought together with another, ranked per product (see pos.basket)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='associations')
+    associated = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    pair_count = models.IntegerField()
+    support = models.FloatField()
+    confidence = models.FloatField()
+    lift = models.FloatField()
+
+    class Meta:
+        unique_together = ('product', 'associated')
+        indexes = [
+            models.Index(fields=['product', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.product} -> {self.associated} ({self.confidence:.0%})"
+
+class MarketBasketRun(models.Model):
+    """One run of the build_market_basket command; the latest holds the totals the next incremental run extends"""
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    incremental = models.BooleanField(default=False)
+    # Every completed sale with an id up to this has been counted
+    last_sale_id = models.IntegerField(default=0)
+    basket_count = models.IntegerField(default=0)
+    sales_processed = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Market basket run {self.started_at:%Y-%m-%d %H:%M}"
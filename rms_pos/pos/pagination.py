@@ -0,0 +1,70 @@
+"""
+Keyset ("seek") pagination over a (timestamp, id) pair.
+
+Offset pagination gets slower the further back you page, because the
+database still reads every skipped row. A keyset page instead starts from
+the last row of the previous page. Every page costs the same, and rows
+added while someone is paging do not shift the results.
+"""
+import base64
+import binascii
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    raw = f"{value.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (datetime, pk) for a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        return datetime.datetime.fromisoformat(value), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def page_size_from(request, default=None):
+    """Clamp ?page_size= to 1..SALES_LIST_MAX_PAGE_SIZE"""
+    default = default or getattr(settings, 'SALES_LIST_PAGE_SIZE', 50)
+    limit = getattr(settings, 'SALES_LIST_MAX_PAGE_SIZE', 200)
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, limit))
+
+
+def keyset_page(queryset, cursor, page_size, field='created_at'):
+    """Newest-first page of queryset after cursor, as (rows, next_cursor)"""
+    queryset = queryset.order_by(f'-{field}', '-id')
+    position = decode_cursor(cursor)
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+        )
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return rows, next_cursor
+
+
+def keyset_iterator(queryset, page_size, field='created_at'):
+    """Walk every row of queryset newest first, one keyset page per query"""
+    cursor = None
+    while True:
+        rows, cursor = keyset_page(queryset, cursor, page_size, field)
+        yield from rows
+        if cursor is None:
+            return
@@ -0,0 +1,249 @@
+"""
+Pre-aggregated sales tables.
+
+Reports used to re-run ``Sum('total_amount')`` over raw Sale rows on every
+page view, and product reports grouped every SaleItem. The rollup tables are
+bumped once when a sale completes, so reports cost one row per day (per
+product) rather than one row per sale line. ``bump_many`` applies a sale's
+increments in a fixed handful of queries however many lines it has, because
+it runs inside the locked payment transaction. The ``rebuild_*`` functions
+recompute any date range from the raw rows (see the ``rebuild_sales_rollups``
+command). Run them after editing or deleting sales by hand.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Min, Q, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.timeranges import date_range
+from .models import DailySalesSummary, ProductDailySales, Sale, SaleItem
+
+LINE_COST = ExpressionWrapper(
+    F('quantity') * F('product__cost'),
+    output_field=DecimalField(max_digits=14, decimal_places=2)
+)
+
+
+# Rollup rows per query when bumping; keeps the UPDATE's CASE under SQLite's parameter limit
+BUMP_CHUNK = 100
+
+
+def _row_ids(model, key_fields, keys):
+    """{key: pk} for the rollup rows among keys (tuples of key_fields values) that exist
+
+    unique_together does not cover NULLs, so a key with a None in it (a
+    deleted cashier or product) can match several rows: SET_NULL merges the
+    deleted one's rows into it, and two terminals may create one each. The
+    lowest pk is always chosen, so every bump lands on the same row; reports
+    sum over rows, so the totals are right either way.
+    """
+    ids = {}
+    keys = list(keys)
+    for start in range(0, len(keys), BUMP_CHUNK):
+        match = Q()
+        for key in keys[start:start + BUMP_CHUNK]:
+            match |= Q(**dict(zip(key_fields, key)))
+        for row in model.objects.filter(match).order_by('pk').values_list('pk', *key_fields):
+            ids.setdefault(row[1:], row[0])
+    return ids
+
+
+def bump_many(model, key_fields, deltas):
+    """Add {key: {field: delta}} to the rollup rows keyed by key_fields, creating missing rows
+
+    Costs one SELECT and one UPDATE per BUMP_CHUNK rows, plus an INSERT and a
+    second SELECT when some rows are new, however many keys there are.
+    """
+    if not deltas:
+        return
+    ids = _row_ids(model, key_fields, deltas)
+    missing = [key for key in deltas if key not in ids]
+    if missing:
+        # Create them at zero; a row another terminal created first is left alone and bumped below
+        model.objects.bulk_create([model(**dict(zip(key_fields, key))) for key in missing], ignore_conflicts=True)
+        ids.update(_row_ids(model, key_fields, missing))
+
+    keys = list(deltas)
+    fields = list(deltas[keys[0]])
+    for start in range(0, len(keys), BUMP_CHUNK):
+        chunk = keys[start:start + BUMP_CHUNK]
+        model.objects.filter(pk__in=[ids[key] for key in chunk]).update(**{
+            field: Case(*(When(pk=ids[key], then=F(field) + deltas[key][field]) for key in chunk))
+            for field in fields
+        })
+
+
+def sale_lines(sale):
+    """{product_id: {'category_id', 'quantity', 'revenue', 'cost'}} for a sale, in one query"""
+    lines = {}
+    items = SaleItem.objects.filter(sale=sale).values_list(
+        'product_id', 'product__category_id', 'quantity', 'subtotal', 'product__cost'
+    )
+    for product_id, category_id, quantity, subtotal, cost in items:
+        line = lines.setdefault(product_id, {'category_id': category_id, 'quantity': 0, 'revenue': 0, 'cost': 0})
+        line['quantity'] += quantity
+        line['revenue'] += subtotal
+        line['cost'] += quantity * (cost or 0)
+    return lines
+
+
+def record_sale(sale):
+    """Fold a just-completed sale into the rollups and, once committed, the top-sellers tracker"""
+    day = timezone.localdate(sale.created_at)
+    bump_many(
+        DailySalesSummary,
+        ('date', 'cashier_id', 'payment_method'),
+        {
+            (day, sale.cashier_id, sale.payment_method): {
+                'sale_count': 1,
+                'gross_total': sale.total_amount,
+                'discount_total': sale.discount_amount,
+                'tax_total': sale.tax_amount,
+            },
+        },
+    )
+
+    lines = sale_lines(sale)
+    bump_many(
+        ProductDailySales,
+        ('product_id', 'date'),
+        {
+            (product_id, day): {'quantity': line['quantity'], 'revenue': line['revenue'], 'cost': line['cost']}
+            for product_id, line in lines.items()
+        },
+    )
+
+    from .timeseries import record_series
+    record_series(sale, lines)
+
+    from .top_sellers import tracker
+    # Counted at payment, not checkout, so abandoned carts are never best sellers
+    quantities = {product_id: line['quantity'] for product_id, line in lines.items() if product_id is not None}
+    transaction.on_commit(lambda: tracker.record(quantities, when=sale.created_at))
+
+
+@transaction.atomic
+def rebuild_daily_sales(start=None, end=None):
+    """Recompute DailySalesSummary for the inclusive date range from raw sales"""
+    summaries = DailySalesSummary.objects.all()
+    sales = Sale.objects.completed()
+    lower, upper = date_range(start, end)
+    if start:
+        summaries = summaries.filter(date__gte=start)
+        sales = sales.filter(created_at__gte=lower)
+    if end:
+        summaries = summaries.filter(date__lte=end)
+        sales = sales.filter(created_at__lt=upper)
+    summaries.delete()
+
+    rows = sales.annotate(
+        day=TruncDate('created_at')
+    ).values('day', 'cashier_id', 'payment_method').annotate(
+        sale_count=Count('id'),
+        gross_total=Sum('total_amount'),
+        discount_total=Sum('discount_amount'),
+        tax_total=Sum('tax_amount')
+    ).order_by()
+    created = DailySalesSummary.objects.bulk_create(
+        (
+            DailySalesSummary(
+                date=row['day'],
+                cashier_id=row['cashier_id'],
+                payment_method=row['payment_method'],
+                sale_count=row['sale_count'],
+                gross_total=row['gross_total'] or 0,
+                discount_total=row['discount_total'] or 0,
+                tax_total=row['tax_total'] or 0,
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+    return len(created)
+
+
+@transaction.atomic
+def rebuild_product_daily_sales(start=None, end=None):
+    """Recompute ProductDailySales for the inclusive date range from raw sale lines"""
+    rows = ProductDailySales.objects.all()
+    items = SaleItem.objects.filter(sale__is_completed=True)
+    lower, upper = date_range(start, end)
+    if start:
+        rows = rows.filter(date__gte=start)
+        items = items.filter(sale__created_at__gte=lower)
+    if end:
+        rows = rows.filter(date__lte=end)
+        items = items.filter(sale__created_at__lt=upper)
+    rows.delete()
+
+    totals = items.annotate(
+        day=TruncDate('sale__created_at')
+    ).values('day', 'product_id').annotate(
+        total_quantity=Sum('quantity'),
+        total_revenue=Sum('subtotal'),
+        total_cost=Sum(LINE_COST)
+    ).order_by()
+    created = ProductDailySales.objects.bulk_create(
+        (
+            ProductDailySales(
+                product_id=row['product_id'],
+                date=row['day'],
+                quantity=row['total_quantity'] or 0,
+                revenue=row['total_revenue'] or 0,
+                cost=row['total_cost'] or 0,
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+    return len(created)
+
+
+def rebuild_in_chunks(rebuild, start=None, end=None, chunk_days=31):
+    """Run a rebuild_* function over [start, end] a chunk of days at a time"""
+    if start is None:
+        first = Sale.objects.completed().aggregate(first=Min('created_at'))['first']
+        if first is None:
+            return 0
+        start = timezone.localdate(first)
+    if end is None:
+        end = timezone.localdate()
+
+    rows = 0
+    step = datetime.timedelta(days=chunk_days)
+    while start <= end:
+        chunk_end = min(start + step - datetime.timedelta(days=1), end)
+        rows += rebuild(start, chunk_end)
+        start = chunk_end + datetime.timedelta(days=1)
+    return rows
+
+
+def product_sales(**filters):
+    """Per product quantity and revenue from the rollup, best sellers by revenue first"""
+    return ProductDailySales.objects.filter(**filters).values(
+        'product__name',
+        'product__barcode',
+        'product__category__name'
+    ).annotate(
+        total_quantity=Sum('quantity'),
+        total_revenue=Sum('revenue')
+    ).order_by('-total_revenue')
+
+
+def top_selling(limit=5, **filters):
+    """Best sellers by units from the rollup"""
+    return ProductDailySales.objects.filter(**filters).values('product__name')\
+        .annotate(total_qty=Sum('quantity'))\
+        .order_by('-total_qty')[:limit]
+
+
+def sales_count(**filters):
+    """Number of completed sales from the rollup"""
+    return DailySalesSummary.objects.filter(**filters).aggregate(count=Sum('sale_count'))['count'] or 0
+
+
+def sales_total(**filters):
+    """Gross completed sales from the rollup, e.g. sales_total(date=today)"""
+    return DailySalesSummary.objects.filter(**filters).aggregate(total=Sum('gross_total'))['total'] or 0
@@ -0,0 +1,300 @@
+"""
+In-memory product search index for the POS search box.
+
+The index keeps trigram postings over the lower-cased product name and
+barcode alongside a list of all products pre-sorted in result order, so a
+keystroke is answered from memory instead of two ``icontains`` table scans. It is built lazily on the first search,
+kept current through the Product signals in ``pos.signals`` and periodically
+re-synced (see ``SyncedIndex``) to pick up writes and deletes made by other
+workers.
+"""
+import bisect
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+GRAM_SIZE = 3
+RESULT_LIMIT = 50
+
+# Above this many candidates it is cheaper to walk the pre-ranked order until
+# RESULT_LIMIT matches are found than to verify and sort every candidate.
+SORT_THRESHOLD = 1024
+
+
+def product_payload(product):
+    """JSON-ready representation returned by product_search_api"""
+    from inventory.thumbnails import thumbnail_urls
+
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': float(product.price),
+        'cost': float(product.cost),
+        'discounted_price': float(product.get_discounted_price()),
+        'discount_percentage': float(product.discount_percentage),
+        'stock': product.stock_quantity,
+        'barcode': product.barcode,
+        'image_url': product.image.url if product.image else None,
+        # {'src', 'jpeg_srcset', 'webp_srcset'}, or None while the thumbnails are pending
+        'thumbnail': thumbnail_urls(product),
+    }
+
+
+def _grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class _Entry:
+    __slots__ = ('name', 'barcode', 'stock', 'rank', 'grams', 'payload')
+
+    def __init__(self, product):
+        self.name = product.name.lower()
+        self.barcode = product.barcode.lower()
+        self.stock = product.stock_quantity
+        # Same ordering as the old query: highest discount first, then name
+        self.rank = (-product.discount_percentage, product.name, product.pk)
+        self.grams = _grams(self.name) | _grams(self.barcode)
+        self.payload = product_payload(product)
+
+    def matches(self, needle):
+        return needle in self.name or needle in self.barcode
+
+
+def _remove(keys, key):
+    """Delete key from the sorted list keys, if it is there"""
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+class SyncedIndex:
+    """
+    What the POS's in-memory indexes have in common: one lock, a lazy first
+    build, a periodic re-sync from the model's ``updated_at`` and ids, and the
+    entries' ranks kept sorted for walking in result order.
+
+    Subclasses name the model and say how to load, rank and link entries into
+    their own lookup structures. Each entry has ``rank`` (a tuple ending in the
+    pk) and ``payload``.
+    """
+    model = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._order = []
+        self._ready = False
+        self._synced_at = None
+        self._synced_clock = 0.0
+        self._reset()
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def _model(self):
+        from django.apps import apps
+
+        return apps.get_model(self.model)
+
+    def _load(self):
+        """Yield (pk, entry) for every row the index holds"""
+        raise NotImplementedError
+
+    def _entry(self, instance):
+        """Entry for one model instance, or None if it does not belong in the index"""
+        raise NotImplementedError
+
+    def _index(self, entries):
+        """{attribute: lookup structure} built from all entries at once"""
+        return {}
+
+    def _reset(self):
+        """Empty the lookup structures"""
+
+    def _link(self, pk, entry):
+        """Add one entry to the lookup structures"""
+
+    def _unlink(self, pk, entry):
+        """Remove one entry from the lookup structures"""
+
+    def build(self):
+        """(Re)build the whole index from the database"""
+        started = timezone.now()
+        entries = dict(self._load())
+        structures = self._index(entries)
+        order = sorted(entry.rank for entry in entries.values())
+
+        with self._lock:
+            self._entries = entries
+            for name, value in structures.items():
+                setattr(self, name, value)
+            self._order = order
+            self._synced_at = started
+            self._synced_clock = time.monotonic()
+            self._ready = True
+
+    def add(self, instance):
+        """Insert or refresh a single row"""
+        if not self._ready:
+            return
+        entry = self._entry(instance)
+        with self._lock:
+            self._discard(instance.pk)
+            if entry is None:
+                return
+            self._entries[instance.pk] = entry
+            self._link(instance.pk, entry)
+            bisect.insort(self._order, entry.rank)
+
+    def remove(self, pk):
+        if not self._ready:
+            return
+        with self._lock:
+            self._discard(pk)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._order = []
+            self._reset()
+            self._ready = False
+
+    def _walk(self, limit, predicate):
+        """Payloads of the first limit entries in rank order for which predicate(pk, entry) holds"""
+        results = []
+        for rank in self._order:
+            pk = rank[-1]
+            entry = self._entries[pk]
+            if predicate(pk, entry):
+                results.append(entry.payload)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _discard(self, pk):
+        entry = self._entries.pop(pk, None)
+        if entry is None:
+            return
+        self._unlink(pk, entry)
+        _remove(self._order, entry.rank)
+
+    def _ensure_fresh(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    self.build()
+            return
+
+        interval = getattr(settings, 'POS_SEARCH_INDEX_SYNC_SECONDS', 30)
+        if not interval or time.monotonic() - self._synced_clock < interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._synced_clock < interval:
+                return
+            self._sync()
+
+    def _sync(self):
+        """Pick up rows changed or deleted by other worker processes"""
+        model = self._model()
+        started = timezone.now()
+        # Overlap the window slightly so writes racing the last sync are not lost
+        since = self._synced_at - timedelta(seconds=5)
+        for instance in model.objects.filter(updated_at__gte=since).order_by():
+            self.add(instance)
+        # Deletes leave no updated_at behind, so drop whatever is no longer in the table
+        existing = set(model.objects.values_list('pk', flat=True).order_by())
+        for pk in [pk for pk in self._entries if pk not in existing]:
+            self._discard(pk)
+        self._synced_at = started
+        self._synced_clock = time.monotonic()
+
+
+class ProductSearchIndex(SyncedIndex):
+    model = 'inventory.Product'
+
+    def _load(self):
+        for product in self._model().objects.order_by().iterator(chunk_size=2000):
+            yield product.pk, _Entry(product)
+
+    def _entry(self, product):
+        return _Entry(product)
+
+    def _index(self, entries):
+        postings = {}
+        for pk, entry in entries.items():
+            for gram in entry.grams:
+                posting = postings.get(gram)
+                if posting is None:
+                    postings[gram] = {pk}
+                else:
+                    posting.add(pk)
+        return {'_postings': postings}
+
+    def _reset(self):
+        self._postings = {}
+
+    def _link(self, pk, entry):
+        for gram in entry.grams:
+            self._postings.setdefault(gram, set()).add(pk)
+
+    def _unlink(self, pk, entry):
+        for gram in entry.grams:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(pk)
+                if not posting:
+                    del self._postings[gram]
+
+    def set_stock(self, stock_by_id):
+        """Refresh stock figures for writes that bypass Product.save()"""
+        if not self._ready:
+            return
+        with self._lock:
+            for product_id, stock in stock_by_id.items():
+                entry = self._entries.get(product_id)
+                if entry is not None:
+                    entry.stock = stock
+                    entry.payload = dict(entry.payload, stock=stock)
+
+    def search(self, query, limit=RESULT_LIMIT):
+        """Return payloads of in-stock products whose name or barcode contains query"""
+        self._ensure_fresh()
+        needle = query.lower()
+        with self._lock:
+            if not needle:
+                return self._walk(limit, lambda pk, entry: entry.stock > 0)
+            if len(needle) < GRAM_SIZE:
+                # Short queries match a large share of the catalog, so the
+                # first RESULT_LIMIT hits turn up early in the ranked order
+                return self._walk(limit, lambda pk, entry: entry.stock > 0 and entry.matches(needle))
+
+            postings = sorted(
+                (self._postings.get(gram, ()) for gram in _grams(needle)), key=len
+            )
+            if len(postings[0]) > SORT_THRESHOLD:
+                rarest = postings[0]
+                return self._walk(
+                    limit, lambda pk, entry: entry.stock > 0 and pk in rarest and entry.matches(needle)
+                )
+
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates &= posting
+            # All trigrams present does not mean they are contiguous, so confirm
+            entries = [self._entries[pk] for pk in candidates]
+            entries = [e for e in entries if e.stock > 0 and e.matches(needle)]
+            entries.sort(key=lambda e: e.rank)
+            return [e.payload for e in entries[:limit]]
+
+
+product_index = ProductSearchIndex()
+
+
+def search_enabled():
+    return getattr(settings, 'POS_SEARCH_INDEX_ENABLED', True)
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from inventory.analytics import stock_changed
+from inventory.models import Category, Product
+from inventory.stock_alerts import refresh_thresholds, sync_alerts
+from .search import product_index
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Keep the POS search index and dashboard cache in step with product edits and stock changes"""
+    stock_changed()
+    if product_index.ready:
+        # Only publish once the write is durable; a rolled back checkout must
+        # not leave a decremented stock figure behind in the index.
+        transaction.on_commit(lambda: product_index.add(instance))
+
+
+@receiver(post_save, sender=Product)
+def check_product_stock(sender, instance, raw=False, **kwargs):
+    """Re-derive the product's low-stock threshold and open or resolve its alert"""
+    if raw:
+        return
+    products = Product.objects.filter(pk=instance.pk)
+    refresh_thresholds(products)
+    sync_alerts(products)
+
+
+@receiver(post_save, sender=Category)
+def check_category_stock(sender, instance, raw=False, **kwargs):
+    """A new category default changes the threshold of products without their own"""
+    if raw:
+        return
+    products = Product.objects.filter(category=instance)
+    refresh_thresholds(products)
+    sync_alerts(products)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    stock_changed()
+    if product_index.ready:
+        pk = instance.pk
+        transaction.on_commit(lambda: product_index.remove(pk))
@@ -0,0 +1,66 @@
+"""
+Progress of the active sales targets.
+
+The dashboard used to run one Sale aggregate per active target. Here every
+target becomes one conditional ``Sum`` over DailySalesSummary, so the whole
+set is answered by a single query over the days the targets span. The cost
+depends on that date window, not on how many targets there are.
+"""
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from core.timeranges import date_filter
+from .models import DailySalesSummary, SalesTarget
+
+
+def active_targets(today=None):
+    today = today or timezone.localdate()
+    return SalesTarget.objects.filter(
+        start_date__lte=today,
+        end_date__gte=today
+    ).select_related('user').order_by('end_date', 'pk')
+
+
+def target_progress(targets=None):
+    """[{'target', 'achieved', 'progress_percent'}] for targets (default: active ones)"""
+    targets = list(active_targets() if targets is None else targets)
+    if not targets:
+        return []
+
+    sums = {}
+    for target in targets:
+        condition = Q(**date_filter('date', target.start_date, target.end_date))
+        if target.user_id:
+            condition &= Q(cashier_id=target.user_id)
+        sums[f'target_{target.pk}'] = Sum('gross_total', filter=condition)
+
+    window = date_filter(
+        'date',
+        min(target.start_date for target in targets),
+        max(target.end_date for target in targets)
+    )
+    totals = DailySalesSummary.objects.filter(**window).aggregate(**sums)
+
+    progress = []
+    for target in targets:
+        achieved = totals[f'target_{target.pk}'] or 0
+        progress_percent = (achieved / target.target_amount * 100) if target.target_amount > 0 else 0
+        progress.append({
+            'target': target,
+            'achieved': achieved,
+            'progress_percent': min(progress_percent, 100)
+        })
+    return progress
+
+
+def progress_payload(item):
+    target = item['target']
+    return {
+        'id': target.pk,
+        'user': target.user.username if target.user else None,
+        'target_amount': float(target.target_amount),
+        'start_date': target.start_date.isoformat(),
+        'end_date': target.end_date.isoformat(),
+        'achieved': float(item['achieved']),
+        'progress_percent': float(item['progress_percent'])
+    }
@@ -0,0 +1,357 @@
+import io
+import json
+import os
+import random
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from django.utils import timezone
+
+from core.export_jobs import run_job
+from core.models import ExportJob
+from inventory import escrow
+from inventory.models import Category, InventoryLog, Product
+from pos.checkout import create_sale
+from pos.customer_search import CustomerSearchIndex
+from pos.idempotency import _recent as recent_idempotency_keys
+from pos.models import (
+    Customer, DailySalesSummary, ProductDailySales, Sale, SaleItem, SalesSeriesBucket, SalesTarget, TopSellerBucket,
+)
+from pos.rollups import record_sale
+from pos.search import ProductSearchIndex
+from pos.top_sellers import WINDOWS, TopSellerTracker, exact_top
+
+from pos.management.commands.explain_report_queries import Command as ExplainReportQueries
+
+
+class ReportQueryPlanTests(TestCase):
+    def test_report_queries_use_their_indexes(self):
+        for label, index, queryset in ExplainReportQueries().queries():
+            with self.subTest(label):
+                self.assertIn(index, queryset.explain())
+
+
+class ReportPeriodTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('cashier', password='x')
+        self.client.force_login(self.user)
+
+    def test_malformed_period_is_rejected(self):
+        for query in ('view=daily&date=2024-13-01', 'view=monthly&month=May', 'view=product&date=yesterday'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/pos/sales/?{query}').status_code, 400)
+                self.assertEqual(self.client.get(f'/pos/sales/export/?{query}').status_code, 400)
+        response = self.client.get('/pos/sales/?view=daily&date=nope&format=json')
+        self.assertEqual(response.json(), {'error': 'date must be YYYY-MM-DD'})
+
+    def test_valid_period_is_accepted(self):
+        for query in ('view=daily&date=2024-02-29', 'view=monthly&month=2024-02', 'view=all'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/pos/sales/?{query}&format=json').status_code, 200)
+                self.assertEqual(self.client.get(f'/pos/sales/export/?{query}').status_code, 200)
+
+
+class SalesExportJobTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings = override_settings(MEDIA_ROOT=self.media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = get_user_model().objects.create_user('cashier', password='x')
+        self.client.force_login(self.user)
+
+    def test_malformed_date_is_rejected_before_queueing(self):
+        response = self.client.post('/exports/sales/', {'view': 'daily', 'date': '../../../../tmp/evil/x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_file_is_named_from_the_parsed_date(self):
+        response = self.client.post('/exports/sales/', {'view': 'daily', 'date': '2024-02-29'})
+        job = run_job(ExportJob.objects.get(pk=response.json()['job_id']))
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.file.name, f'exports/sales/sales_daily_2024-02-29-{job.pk}.csv.gz')
+        self.assertTrue(os.path.exists(os.path.join(self.media.name, job.file.name)))
+
+    def test_jobs_are_private_to_their_requester(self):
+        job_id = self.client.post('/exports/sales/').json()['job_id']
+        other = get_user_model().objects.create_user('other', password='x')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/exports/job/{job_id}/').status_code, 404)
+        self.assertNotEqual(self.client.post('/exports/sales/').json()['job_id'], job_id)
+
+
+class SearchIndexTests(TestCase):
+    def test_customer_mobile_with_country_code_or_trunk_prefix(self):
+        now = timezone.now()
+        Customer.objects.create(mobile='9876543210', name='Asha', visit_count=1, first_visit=now, last_visit=now)
+        index = CustomerSearchIndex()
+        for query in ('98765', '+91 98765', '+91-987-65', '098765'):
+            with self.subTest(query):
+                self.assertEqual([c['name'] for c in index.search(query)], ['Asha'])
+
+    def test_sync_drops_products_deleted_elsewhere(self):
+        category = Category.objects.create(name='Fruit')
+        product = Product.objects.create(name='Apple', category=category, barcode='1', price=1, cost=1, stock_quantity=5)
+        index = ProductSearchIndex()
+        self.assertEqual(len(index.search('apple')), 1)
+        # A queryset delete stands in for another worker; this index hears no signal
+        Product.objects.filter(pk=product.pk).delete()
+        index._synced_clock = 0
+        self.assertEqual(index.search('apple'), [])
+
+
+@override_settings(TOP_SELLERS_CAPACITY=16)
+@mock.patch.object(TopSellerTracker, '_start_flusher', lambda tracker: None)
+class TopSellersTests(TestCase):
+    def test_tracker_is_within_its_error_bound_of_the_exact_answer(self):
+        user = get_user_model().objects.create_user('cashier', password='x')
+        category = Category.objects.create(name='Snacks')
+        products = [
+            Product.objects.create(name=f'p{i}', category=category, barcode=str(i), price=1, cost=1)
+            for i in range(60)
+        ]
+        # Long tail: more products than counters, a few of them selling most
+        rng = random.Random(7)
+        weights = [1 / (rank + 1) for rank in range(len(products))]
+        worker = TopSellerTracker()
+        for _ in range(150):
+            sale = Sale.objects.create(cashier=user, total_amount=0, is_completed=True)
+            quantities = {}
+            for product in rng.choices(products, weights, k=3):
+                quantities[product.pk] = quantities.get(product.pk, 0) + rng.randint(1, 4)
+            for product_id, quantity in quantities.items():
+                SaleItem.objects.create(sale=sale, product_id=product_id, quantity=quantity, price_at_sale=1)
+            worker.record(quantities)
+        # What the worker's exit handler does
+        worker.flush()
+
+        reader = TopSellerTracker()
+        for window in WINDOWS:
+            with self.subTest(window):
+                rows, total = reader.top(window, limit=16)
+                exact = dict(exact_top(window, limit=None))
+                bound = total / 16
+                self.assertEqual(total, sum(exact.values()))
+                for product_id, quantity, error in rows:
+                    self.assertLessEqual(exact.get(product_id, 0), quantity)
+                    self.assertLessEqual(quantity, exact.get(product_id, 0) + error)
+                    self.assertLessEqual(error, bound)
+                heavy = {product_id for product_id, quantity in exact.items() if quantity > bound}
+                self.assertTrue(heavy)
+                self.assertLessEqual(heavy, {row[0] for row in rows})
+
+    def test_only_paid_sales_are_counted_and_reads_do_not_write(self):
+        cashier = get_user_model().objects.create_user('cashier', password='x')
+        self.client.force_login(cashier)
+        category = Category.objects.create(name='Snacks')
+        product = Product.objects.create(name='Chips', category=category, barcode='1', price=1, cost=1, stock_quantity=20)
+        cart = json.dumps({'cart': [{'id': product.pk, 'quantity': 2}]})
+        with mock.patch('pos.top_sellers.tracker', TopSellerTracker()) as tracker:
+            with self.captureOnCommitCallbacks(execute=True):
+                abandoned = self.client.post('/pos/api/checkout/', cart, content_type='application/json').json()
+                paid = self.client.post('/pos/api/checkout/', cart, content_type='application/json').json()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f"/pos/api/payment/{paid['sale_id']}/process/", '{"payment_method": "card"}',
+                                 content_type='application/json')
+            self.assertNotEqual(abandoned['sale_id'], paid['sale_id'])
+            tracker._loaded_clock = 0
+            # One SELECT of the merged buckets and nothing else
+            with self.assertNumQueries(1):
+                self.assertEqual(tracker.top('hour'), ([(product.pk, 2, 0)], 2))
+            self.assertFalse(TopSellerBucket.objects.exists())
+        self.assertEqual(exact_top('hour'), [(product.pk, 2)])
+
+    def test_failed_flush_keeps_the_counts(self):
+        worker = TopSellerTracker()
+        worker.record({1: 2})
+        with mock.patch.object(TopSellerBucket.objects, 'select_for_update', side_effect=DatabaseError):
+            with self.assertLogs('pos.top_sellers', 'ERROR'):
+                worker.flush()
+        self.assertFalse(TopSellerBucket.objects.exists())
+        worker.flush()
+        self.assertEqual(TopSellerTracker().top('hour')[0], [(1, 2, 0)])
+
+
+
+@mock.patch.object(TopSellerTracker, '_start_flusher', lambda tracker: None)
+@mock.patch('pos.live.publish')
+class LiveEventsTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Drinks')
+
+    def test_payment_publishes_the_sale_and_target_progress_once(self, publish):
+        self.client.force_login(get_user_model().objects.create_user('cashier', password='x'))
+        today = timezone.localdate()
+        SalesTarget.objects.create(target_amount=100, start_date=today, end_date=today)
+        product = Product.objects.create(name='Tea', category=self.category, barcode='1', price=5, cost=4, stock_quantity=50)
+        cart = json.dumps({'cart': [{'id': product.pk, 'quantity': 5}]})
+        sale_id = self.client.post('/pos/api/checkout/', cart, content_type='application/json').json()['sale_id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/pos/api/payment/{sale_id}/process/', '{"payment_method": "card"}', content_type='application/json')
+        events = [call.args[0] for call in publish.call_args_list]
+        self.assertEqual(events, ['sale', 'targets'])
+        self.assertEqual(publish.call_args_list[0].args[1]['total_amount'], 20)
+        self.assertEqual(publish.call_args_list[1].args[1]['targets'][0]['achieved'], 20)
+
+    def test_escrowed_product_crossing_its_threshold_is_published(self, publish):
+        product = Product.objects.create(
+            name='Cola', category=self.category, barcode='2', price=1, cost=1, stock_quantity=12, escrow_enabled=True
+        )
+        escrow.reconcile(product.pk)
+        self.assertTrue(escrow.take(product.pk, 3, slot=0))
+        self.assertTrue(escrow.take(product.pk, 3, slot=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            escrow.reconcile(product.pk)
+        publish.assert_called_once_with('low_stock', {
+            'products': [{'id': product.pk, 'name': 'Cola', 'stock_quantity': 6}],
+            'low_stock_count': 1,
+        })
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.cashier = get_user_model().objects.create_user('cashier', password='x')
+        category = Category.objects.create(name='Groceries')
+        # Well above their thresholds, so no sale crosses one
+        self.products = [
+            Product.objects.create(name=f'p{i}', category=category, barcode=str(i), price=2, cost=1, stock_quantity=100)
+            for i in range(20)
+        ]
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        with CaptureQueriesContext(connection) as single:
+            create_sale(self.cashier, [{'id': self.products[0].pk, 'quantity': 1}])
+        # Listed in descending id order; the lock is still taken in id order
+        cart = [{'id': product.pk, 'quantity': 2} for product in reversed(self.products)]
+        with CaptureQueriesContext(connection) as full:
+            sale = create_sale(self.cashier, cart)
+        self.assertEqual(len(full.captured_queries), len(single.captured_queries))
+        [lock] = [query['sql'] for query in full.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertIn('ORDER BY "inventory_product"."id" ASC', lock)
+        self.assertEqual(sale.items.count(), 20)
+        self.assertEqual(InventoryLog.objects.filter(action='sale').count(), 21)
+        stock = dict(Product.objects.values_list('pk', 'stock_quantity'))
+        self.assertEqual(stock[self.products[0].pk], 97)
+        self.assertEqual(stock[self.products[1].pk], 98)
+
+    def test_insufficient_stock_rolls_the_whole_cart_back(self):
+        first, scarce = self.products[:2]
+        Product.objects.filter(pk=scarce.pk).update(stock_quantity=3, escrow_enabled=True)
+        escrow.reconcile(scarce.pk)
+        cart = [{'id': first.pk, 'quantity': 2}, {'id': scarce.pk, 'quantity': 5}]
+        # The escrowed line fails after the locked lines' stock was already decremented
+        with self.assertRaisesMessage(ValueError, 'Insufficient stock for p1'):
+            create_sale(self.cashier, cart)
+        self.assertEqual(Product.objects.get(pk=first.pk).stock_quantity, 100)
+        self.assertEqual(Product.objects.get(pk=scarce.pk).stock_quantity, 3)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SaleItem.objects.exists())
+        self.assertFalse(InventoryLog.objects.exists())
+
+
+@mock.patch.object(TopSellerTracker, '_start_flusher', lambda tracker: None)
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        # The in-process LRU outlives each test's rollback
+        recent_idempotency_keys.clear()
+        self.addCleanup(recent_idempotency_keys.clear)
+        self.client.force_login(get_user_model().objects.create_user('cashier', password='x'))
+        category = Category.objects.create(name='Bakery')
+        self.product = Product.objects.create(name='Bun', category=category, barcode='1', price=1, cost=1, stock_quantity=10)
+
+    def checkout(self, quantity, key='till-1-0001'):
+        cart = json.dumps({'cart': [{'id': self.product.pk, 'quantity': quantity}]})
+        return self.client.post('/pos/api/checkout/', cart, content_type='application/json',
+                                headers={'Idempotency-Key': key})
+
+    def test_retry_replays_the_first_response(self):
+        first = self.checkout(2)
+        retry = self.checkout(2)
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(Product.objects.get().stock_quantity, 8)
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.checkout(2)
+        self.assertEqual(self.checkout(3).status_code, 422)
+        # The same from the stored row, as another worker would see it
+        recent_idempotency_keys.clear()
+        self.assertEqual(self.checkout(3).status_code, 422)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(Product.objects.get().stock_quantity, 8)
+
+
+@mock.patch.object(TopSellerTracker, '_start_flusher', lambda tracker: None)
+class SalesRollupTests(TestCase):
+    ROLLUPS = {
+        DailySalesSummary: ('date', 'cashier_id', 'payment_method', 'sale_count', 'gross_total', 'discount_total', 'tax_total'),
+        ProductDailySales: ('product_id', 'date', 'quantity', 'revenue', 'cost'),
+        SalesSeriesBucket: ('granularity', 'start', 'dimension', 'key', 'sale_count', 'quantity', 'amount'),
+    }
+
+    def rollups(self):
+        return {model: sorted(model.objects.values_list(*fields), key=repr) for model, fields in self.ROLLUPS.items()}
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        users = get_user_model().objects
+        cashiers = [users.create_user('anne', password='x'), users.create_user('bob', password='x')]
+        categories = [Category.objects.create(name='Dairy'), Category.objects.create(name='Bakery')]
+        products = [
+            Product.objects.create(name=f'p{i}', category=categories[i % 2], barcode=str(i), price=3, cost=2, stock_quantity=100)
+            for i in range(4)
+        ]
+        paid = [
+            (cashiers[0], 'cash', [(0, 1), (1, 2)]),
+            (cashiers[0], 'card', [(1, 1)]),
+            (cashiers[1], 'card', [(2, 3), (3, 1), (0, 1)]),
+            (cashiers[1], 'card', [(3, 2)]),
+        ]
+        for cashier, method, lines in paid:
+            self.client.force_login(cashier)
+            cart = json.dumps({'cart': [{'id': products[index].pk, 'quantity': quantity} for index, quantity in lines]})
+            sale_id = self.client.post('/pos/api/checkout/', cart, content_type='application/json').json()['sale_id']
+            body = {'payment_method': method, 'cash_received': 100}
+            response = self.client.post(f'/pos/api/payment/{sale_id}/process/', json.dumps(body),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+        # Two sales without a cashier on the same day and method share one row,
+        # and a line whose product was deleted rolls up under no product
+        for quantity in (1, 4):
+            sale = Sale.objects.create(cashier=None, total_amount=2 * quantity, payment_method='upi', is_completed=True)
+            SaleItem.objects.create(sale=sale, product=products[0], quantity=quantity, price_at_sale=2)
+            SaleItem.objects.create(sale=sale, product=None, quantity=1, price_at_sale=0)
+            record_sale(sale)
+        # An unpaid checkout is not a sale
+        create_sale(cashiers[0], [{'id': products[2].pk, 'quantity': 5}])
+
+        incremental = self.rollups()
+        self.assertEqual(len(incremental[DailySalesSummary]), 4)
+        self.assertEqual(DailySalesSummary.objects.filter(cashier=None).count(), 1)
+        self.assertEqual(ProductDailySales.objects.filter(product=None).count(), 1)
+        call_command('rebuild_sales_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_null_keys_always_bump_the_same_row(self):
+        today = timezone.localdate()
+        # As deleting two cashiers leaves their rows for the day
+        first, second = DailySalesSummary.objects.bulk_create([
+            DailySalesSummary(date=today, cashier=None, payment_method='cash', sale_count=1, gross_total=5),
+            DailySalesSummary(date=today, cashier=None, payment_method='cash', sale_count=1, gross_total=7),
+        ])
+        for amount in (2, 3):
+            record_sale(Sale.objects.create(cashier=None, total_amount=amount, payment_method='cash', is_completed=True))
+        self.assertEqual(
+            list(DailySalesSummary.objects.order_by('pk').values_list('pk', 'sale_count', 'gross_total')),
+            [(first.pk, 3, 10), (second.pk, 1, 7)],
+        )
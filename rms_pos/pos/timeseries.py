@@ -0,0 +1,285 @@
+"""
+Hourly, daily, weekly and monthly sales series, overall or split by cashier,
+payment method or category.
+
+A completed sale bumps one SalesSeriesBucket counter per hour and per day,
+both for the sale as a whole and for each dimension. Weeks and months are
+summed from the daily counters, so a three-year monthly chart reads about a
+thousand small rows per series rather than every sale. Buckets nobody sold
+in come back as zeros.
+
+Counters are read a calendar month at a time through core.versioned_cache.
+Past months depend only on the 'sales_history' version, which changes
+only when a sale lands in a past month (a sale completed long after
+checkout) or the buckets are rebuilt. In practice their cache entries never
+change, and only the current month is re-read after each sale.
+``rebuild_sales_series`` (part of the ``rebuild_sales_rollups`` command)
+recomputes the counters from raw sales.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from core import versioned_cache
+from core.timeranges import date_range
+from .models import Sale, SaleItem, SalesSeriesBucket
+from .rollups import bump_many
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+DIMENSIONS = ('cashier', 'payment_method', 'category')
+
+# Longest series served in one response (about 7 months of hours)
+MAX_POINTS = 5000
+
+SALES = 'sales'
+HISTORY = 'sales_history'
+
+# Sale field behind each sale-level dimension
+SALE_FIELDS = {'': None, 'cashier': 'cashier_id', 'payment_method': 'payment_method'}
+
+
+def bucket_start(moment, stored):
+    """Local start of the hour or day containing moment"""
+    local = timezone.localtime(moment)
+    if stored == 'day':
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def _key(value):
+    return '' if value is None else str(value)
+
+
+KEY_FIELDS = ('granularity', 'start', 'dimension', 'key')
+
+
+def record_series(sale, lines):
+    """Count a just-completed sale into the hourly and daily buckets; lines is rollups.sale_lines(sale)"""
+    categories = {}
+    for line in lines.values():
+        totals = categories.setdefault(_key(line['category_id']), {'sale_count': 1, 'quantity': 0, 'amount': 0})
+        totals['quantity'] += line['quantity']
+        totals['amount'] += line['revenue']
+    quantity = sum(line['quantity'] for line in lines.values())
+
+    deltas = {}
+    for stored in ('hour', 'day'):
+        start = bucket_start(sale.created_at, stored)
+        for dimension, field in SALE_FIELDS.items():
+            key = _key(getattr(sale, field)) if field else ''
+            deltas[stored, start, dimension, key] = {
+                'sale_count': 1, 'quantity': quantity, 'amount': sale.total_amount
+            }
+        for key, totals in categories.items():
+            deltas[stored, start, 'category', key] = totals
+    bump_many(SalesSeriesBucket, KEY_FIELDS, deltas)
+
+    if timezone.localdate(sale.created_at) < timezone.localdate().replace(day=1):
+        versioned_cache.bump(HISTORY)
+
+
+@transaction.atomic
+def rebuild_sales_series(start=None, end=None):
+    """Recompute the buckets for the inclusive date range from raw sales"""
+    lower, upper = date_range(start, end)
+    buckets = SalesSeriesBucket.objects.all()
+    sales = Sale.objects.completed()
+    items = SaleItem.objects.filter(sale__is_completed=True)
+    if lower:
+        buckets = buckets.filter(start__gte=lower)
+        sales = sales.filter(created_at__gte=lower)
+        items = items.filter(sale__created_at__gte=lower)
+    if upper:
+        buckets = buckets.filter(start__lt=upper)
+        sales = sales.filter(created_at__lt=upper)
+        items = items.filter(sale__created_at__lt=upper)
+    buckets.delete()
+
+    rows = {}
+    for stored, trunc in (('hour', TruncHour), ('day', TruncDay)):
+        for dimension, field in SALE_FIELDS.items():
+            group = ['bucket'] + ([field] if field else [])
+            totals = sales.annotate(bucket=trunc('created_at')).values(*group).annotate(
+                sale_count=Count('id'),
+                amount=Sum('total_amount')
+            ).order_by()
+            quantities = items.annotate(bucket=trunc('sale__created_at')).values(
+                'bucket', *([f'sale__{field}'] if field else [])
+            ).annotate(quantity=Sum('quantity')).order_by()
+            for row in totals.iterator():
+                key = _key(row[field]) if field else ''
+                rows[stored, row['bucket'], dimension, key] = [row['sale_count'], 0, row['amount'] or 0]
+            for row in quantities.iterator():
+                key = _key(row[f'sale__{field}']) if field else ''
+                rows[stored, row['bucket'], dimension, key][1] = row['quantity'] or 0
+
+        categories = items.annotate(bucket=trunc('sale__created_at')).values(
+            'bucket', 'product__category_id'
+        ).annotate(
+            sale_count=Count('sale', distinct=True),
+            quantity=Sum('quantity'),
+            amount=Sum('subtotal')
+        ).order_by()
+        for row in categories.iterator():
+            rows[stored, row['bucket'], 'category', _key(row['product__category_id'])] = [
+                row['sale_count'], row['quantity'] or 0, row['amount'] or 0
+            ]
+
+    created = SalesSeriesBucket.objects.bulk_create(
+        (
+            SalesSeriesBucket(
+                granularity=stored, start=bucket, dimension=dimension, key=key,
+                sale_count=sale_count, quantity=quantity, amount=amount,
+            )
+            for (stored, bucket, dimension, key), (sale_count, quantity, amount) in rows.items()
+        ),
+        batch_size=1000,
+    )
+    versioned_cache.bump(SALES, HISTORY)
+    return len(created)
+
+
+def _months(start, end):
+    """First day of every calendar month touching start..end"""
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _month_buckets(stored, dimension, month):
+    """{key: {bucket start isoformat: [sale_count, quantity, amount]}} for one month"""
+    following = (month + datetime.timedelta(days=32)).replace(day=1)
+    lower, upper = date_range(month, following - datetime.timedelta(days=1))
+    rows = SalesSeriesBucket.objects.filter(
+        granularity=stored, dimension=dimension, start__gte=lower, start__lt=upper
+    ).values_list('key', 'start', 'sale_count', 'quantity', 'amount')
+    buckets = {}
+    for key, start, sale_count, quantity, amount in rows:
+        buckets.setdefault(key, {})[timezone.localtime(start).isoformat()] = [sale_count, quantity, str(amount)]
+    return buckets
+
+
+def _month(stored, dimension, month):
+    # Months before the current one only change on a rebuild or a late sale
+    depends_on = (HISTORY,) if month < timezone.localdate().replace(day=1) else (SALES, HISTORY)
+    return versioned_cache.get_or_compute(
+        f'series:{stored}:{dimension or "all"}:{month:%Y-%m}',
+        depends_on,
+        lambda: _month_buckets(stored, dimension, month),
+    )
+
+
+def _label(granularity, moment):
+    """Label of the output bucket a local hour or day start falls in"""
+    if granularity == 'hour':
+        return moment.strftime('%Y-%m-%d %H:00')
+    day = moment.date()
+    if granularity == 'week':
+        return (day - datetime.timedelta(days=day.weekday())).isoformat()
+    if granularity == 'month':
+        return day.strftime('%Y-%m')
+    return day.isoformat()
+
+
+def _labels(granularity, start, end):
+    """Every output bucket label for start..end, in order"""
+    if granularity == 'hour':
+        lower, upper = date_range(start, end)
+        moments = []
+        moment = lower
+        while moment < upper:
+            moments.append(timezone.localtime(moment))
+            moment += datetime.timedelta(hours=1)
+    else:
+        moments = [
+            datetime.datetime.combine(start + datetime.timedelta(days=offset), datetime.time.min)
+            for offset in range((end - start).days + 1)
+        ]
+    return list(dict.fromkeys(_label(granularity, moment) for moment in moments))
+
+
+def point_count(granularity, start, end):
+    days = (end - start).days + 1
+    return {
+        'hour': days * 24,
+        'day': days,
+        'week': days // 7 + 2,
+        'month': (end.year - start.year) * 12 + end.month - start.month + 1,
+    }[granularity]
+
+
+def _key_labels(dimension, keys):
+    if not dimension:
+        return {'': 'All sales'}
+    if dimension == 'payment_method':
+        return {key: dict(Sale.PAYMENT_CHOICES).get(key, key) for key in keys}
+    ids = [int(key) for key in keys if key]
+    if dimension == 'cashier':
+        from django.contrib.auth import get_user_model
+        names = dict(get_user_model().objects.filter(pk__in=ids).values_list('pk', 'username'))
+        missing = 'No cashier'
+    else:
+        from inventory.models import Category
+        names = dict(Category.objects.filter(pk__in=ids).values_list('pk', 'name'))
+        missing = 'No category'
+    return {key: names.get(int(key), f'#{key}') if key else missing for key in keys}
+
+
+def series(granularity, start, end, by=None):
+    """Gap-filled sales series over the inclusive local dates start..end"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    if by and by not in DIMENSIONS:
+        raise ValueError(f"by must be one of: {', '.join(DIMENSIONS)}")
+    if start > end:
+        raise ValueError("start must not be after end")
+    if point_count(granularity, start, end) > MAX_POINTS:
+        raise ValueError(f"More than {MAX_POINTS} {granularity} buckets; choose a coarser granularity")
+
+    stored = 'hour' if granularity == 'hour' else 'day'
+    dimension = by or ''
+    labels = _labels(granularity, start, end)
+    position = {label: i for i, label in enumerate(labels)}
+    lower, upper = (timezone.localtime(moment) for moment in date_range(start, end))
+
+    values = {}
+    for month in _months(start, end):
+        for key, buckets in _month(stored, dimension, month).items():
+            sale_counts, quantities, amounts = values.setdefault(
+                key, ([0] * len(labels), [0] * len(labels), [0] * len(labels))
+            )
+            for moment, (sale_count, quantity, amount) in buckets.items():
+                moment = datetime.datetime.fromisoformat(moment)
+                if not lower <= moment < upper:
+                    continue
+                i = position[_label(granularity, timezone.localtime(moment))]
+                sale_counts[i] += sale_count
+                quantities[i] += quantity
+                amounts[i] += float(amount)
+    if not dimension:
+        values.setdefault('', ([0] * len(labels), [0] * len(labels), [0] * len(labels)))
+
+    names = _key_labels(dimension, list(values))
+    return {
+        'granularity': granularity,
+        'by': by,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'labels': labels,
+        'series': [
+            {
+                'key': key,
+                'label': names[key],
+                'sale_count': sale_counts,
+                'quantity': quantities,
+                'amount': [round(amount, 2) for amount in amounts],
+            }
+            for key, (sale_counts, quantities, amounts) in sorted(
+                values.items(), key=lambda item: -sum(item[1][2])
+            )
+        ],
+    }
@@ -0,0 +1,322 @@
+"""
+Streaming top-sellers for the last hour, day and week.
+
+Completing a payment feeds every sold line into Space-Saving summaries
+(Metwally et al.) kept in time buckets: 5-minute buckets for the hour window,
+hourly buckets for the day and daily buckets for the week. A summary holds at most
+TOP_SELLERS_CAPACITY counters. A window query merges that window's buckets, at
+most 24 summaries, so its cost does not grow with sales volume.
+
+Error bound: a reported quantity never undercounts and overcounts by at most
+``error`` (returned per row), which is itself at most N / capacity, where N
+is the total quantity sold in the window. Any product that sold more than
+N / capacity in the window is guaranteed to be tracked.
+
+``record`` only touches memory, so counting a sale can never fail the
+request that made it. A background thread in each worker merges what the
+worker has counted into TopSellerBucket rows every
+TOP_SELLERS_SNAPSHOT_SECONDS, and an exit handler merges whatever is left
+when the worker shuts down. ``top`` never writes: it reads the merged rows
+again once they are that old, so every worker also sees the others' sales,
+and adds the counts this worker has not merged yet. Loading on first use is how the tracker is "rebuilt on
+startup". ``rebuild`` recomputes the buckets exactly from SaleItem (see the
+``snapshot_top_sellers --rebuild`` command).
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# resolution -> bucket width in seconds
+RESOLUTIONS = {'5m': 5 * 60, '1h': 60 * 60, '1d': 24 * 60 * 60}
+
+# window -> (resolution, number of buckets)
+WINDOWS = {
+    'hour': ('5m', 12),
+    'day': ('1h', 24),
+    'week': ('1d', 7),
+}
+
+
+def capacity():
+    return getattr(settings, 'TOP_SELLERS_CAPACITY', 256)
+
+
+class SpaceSaving:
+    """Bounded counter set; counts[k] overestimates the true count by at most errors[k]"""
+    __slots__ = ('capacity', 'counts', 'errors', 'total')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+
+    def add(self, key, weight=1):
+        self.total += weight
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+        else:
+            # Evict the smallest counter; the newcomer inherits its count as error
+            victim = min(self.counts, key=self.counts.__getitem__)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[key] = floor + weight
+            self.errors[key] = floor
+
+    def floor(self):
+        """Upper bound on the true count of any key not being tracked"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def merge(self, other):
+        """Fold in a summary of a disjoint stream, keeping the error guarantees"""
+        floors = ((self, self.floor()), (other, other.floor()))
+        counts, errors = {}, {}
+        for key in self.counts.keys() | other.counts.keys():
+            count = error = 0
+            for summary, floor in floors:
+                if key in summary.counts:
+                    count += summary.counts[key]
+                    error += summary.errors[key]
+                else:
+                    # It may have been evicted from a full summary
+                    count += floor
+                    error += floor
+            counts[key] = count
+            errors[key] = error
+        if len(counts) > self.capacity:
+            keep = sorted(counts, key=counts.__getitem__, reverse=True)[:self.capacity]
+            counts = {key: counts[key] for key in keep}
+            errors = {key: errors[key] for key in keep}
+        self.counts = counts
+        self.errors = errors
+        self.total += other.total
+        return self
+
+    def top(self, limit):
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return [(key, count, self.errors[key]) for key, count in ranked[:limit]]
+
+    def to_json(self):
+        return {str(key): [count, self.errors[key]] for key, count in self.counts.items()}
+
+    @classmethod
+    def from_json(cls, capacity, data, total):
+        summary = cls(capacity)
+        for key, (count, error) in data.items():
+            summary.counts[int(key)] = count
+            summary.errors[int(key)] = error
+        summary.total = total
+        return summary
+
+
+def bucket_start(moment, resolution):
+    width = RESOLUTIONS[resolution]
+    seconds = int(moment.timestamp()) // width * width
+    return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+
+
+class TopSellerTracker:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._base = {}
+        self._delta = {}
+        self._ready = False
+        self._loaded_clock = 0.0
+        self._flusher = None
+
+    def record(self, quantities, when=None):
+        """Count {product_id: quantity} sold at when (default now); memory only, never raises for the database"""
+        when = when or timezone.now()
+        with self._lock:
+            for resolution in RESOLUTIONS:
+                key = (resolution, bucket_start(when, resolution))
+                summary = self._delta.get(key)
+                if summary is None:
+                    summary = self._delta[key] = SpaceSaving(capacity())
+                for product_id, quantity in quantities.items():
+                    summary.add(product_id, quantity)
+            self._start_flusher()
+
+    def top(self, window='day', limit=5, now=None):
+        """[(product_id, quantity, error)] best sellers in the window, highest first"""
+        resolution, buckets = WINDOWS[window]
+        self._ensure_loaded()
+        if time.monotonic() - self._loaded_clock >= snapshot_interval():
+            # Read what the workers' flushers have merged since; merging is left to them
+            self.load()
+        now = now or timezone.now()
+        width = timedelta(seconds=RESOLUTIONS[resolution])
+        newest = bucket_start(now, resolution)
+        starts = [newest - width * i for i in range(buckets)]
+        merged = SpaceSaving(capacity())
+        with self._lock:
+            for start in starts:
+                for store in (self._base, self._delta):
+                    summary = store.get((resolution, start))
+                    if summary is not None:
+                        merged.merge(summary)
+        return merged.top(limit), merged.total
+
+    def load(self):
+        """Replace the merged base with the stored buckets that are still in a window"""
+        from .models import TopSellerBucket
+
+        base = {}
+        for bucket in TopSellerBucket.objects.filter(_live_buckets()):
+            base[(bucket.resolution, bucket.start)] = SpaceSaving.from_json(capacity(), bucket.counts, bucket.total)
+        with self._lock:
+            self._base = base
+            self._ready = True
+            self._loaded_clock = time.monotonic()
+
+    def snapshot(self):
+        """Merge this process's counts into the stored buckets and reload them"""
+        from .models import TopSellerBucket
+
+        with self._lock:
+            delta, self._delta = self._delta, {}
+        try:
+            with transaction.atomic():
+                for (resolution, start), summary in sorted(delta.items()):
+                    bucket, _ = TopSellerBucket.objects.select_for_update().get_or_create(
+                        resolution=resolution, start=start
+                    )
+                    stored = SpaceSaving.from_json(capacity(), bucket.counts, bucket.total)
+                    stored.merge(summary)
+                    bucket.counts = stored.to_json()
+                    bucket.total = stored.total
+                    bucket.save(update_fields=['counts', 'total', 'updated_at'])
+                TopSellerBucket.objects.exclude(_live_buckets()).delete()
+        except Exception:
+            # Keep the counts for the next attempt
+            with self._lock:
+                for key, summary in delta.items():
+                    self._delta.setdefault(key, SpaceSaving(capacity())).merge(summary)
+            raise
+        self.load()
+
+    def flush(self):
+        """snapshot() for background and shutdown use: errors are logged and the counts kept"""
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception("Could not save top-seller counts; keeping them for the next attempt")
+
+    def clear(self):
+        with self._lock:
+            self._base = {}
+            self._delta = {}
+            self._ready = False
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name='top-sellers-snapshot', daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(snapshot_interval())
+            self.flush()
+            # This thread's connection is not closed by any request cycle
+            connection.close()
+
+    def _ensure_loaded(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    self.load()
+
+
+def snapshot_interval():
+    return getattr(settings, 'TOP_SELLERS_SNAPSHOT_SECONDS', 60) or 60
+
+
+def _live_buckets():
+    """Q matching the buckets any window still covers"""
+    from django.db.models import Q
+
+    now = timezone.now()
+    live = Q()
+    for resolution, buckets in WINDOWS.values():
+        width = timedelta(seconds=RESOLUTIONS[resolution])
+        oldest = bucket_start(now, resolution) - width * (buckets - 1)
+        live |= Q(resolution=resolution, start__gte=oldest)
+    return live
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute every live bucket exactly from sale lines; returns the bucket count"""
+    from .models import SaleItem, TopSellerBucket
+
+    now = timezone.now()
+    oldest = min(
+        bucket_start(now, resolution) - timedelta(seconds=RESOLUTIONS[resolution]) * (buckets - 1)
+        for resolution, buckets in WINDOWS.values()
+    )
+    lines = SaleItem.objects.filter(sale__is_completed=True, sale__created_at__gte=oldest, product__isnull=False)\
+        .values_list('product_id', 'quantity', 'sale__created_at')
+    summaries = {}
+    for product_id, quantity, created_at in lines.iterator(chunk_size=2000):
+        for resolution in RESOLUTIONS:
+            key = (resolution, bucket_start(created_at, resolution))
+            summaries.setdefault(key, SpaceSaving(capacity())).add(product_id, quantity)
+
+    TopSellerBucket.objects.all().delete()
+    TopSellerBucket.objects.bulk_create([
+        TopSellerBucket(resolution=resolution, start=start, counts=summary.to_json(), total=summary.total)
+        for (resolution, start), summary in summaries.items()
+    ])
+    TopSellerBucket.objects.exclude(_live_buckets()).delete()
+    transaction.on_commit(tracker.clear)
+    return len(summaries)
+
+
+def exact_top(window='day', limit=5, now=None):
+    """The same window answered exactly from SaleItem, for checking the tracker"""
+    from .models import SaleItem
+
+    resolution, buckets = WINDOWS[window]
+    now = now or timezone.now()
+    oldest = bucket_start(now, resolution) - timedelta(seconds=RESOLUTIONS[resolution]) * (buckets - 1)
+    return list(
+        SaleItem.objects.filter(sale__is_completed=True, sale__created_at__gte=oldest, product__isnull=False)
+        .values('product_id')
+        .annotate(total_qty=Sum('quantity'))
+        .order_by('-total_qty', 'product_id')
+        .values_list('product_id', 'total_qty')[:limit]
+    )
+
+
+def top_selling(window='day', limit=5):
+    """Best sellers in the window as dicts with product name, quantity and error bound"""
+    from inventory.models import Product
+
+    rows, total = tracker.top(window, limit)
+    names = Product.objects.in_bulk([product_id for product_id, _, _ in rows])
+    return [
+        {
+            'product_id': product_id,
+            'product__name': names[product_id].name if product_id in names else 'Deleted product',
+            'total_qty': quantity,
+            'error': error,
+        }
+        for product_id, quantity, error in rows
+    ], total
+
+
+tracker = TopSellerTracker()
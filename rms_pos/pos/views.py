@@ -1,12 +1,44 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Sum
-from django.http import JsonResponse
+from django.db.models import Prefetch
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 import json
-from inventory.models import Product, InventoryLog
-from .models import Sale, SaleItem
+from core.streaming import csv_response
+from core.timeranges import report_period, timestamp_filter, date_filter
+from inventory.analytics import sales_changed
+from inventory.models import Product
+from .models import Customer, Sale, SaleItem
+from . import live
+from .basket import suggestions
+from .checkout import create_sale
+from .customer_search import customer_index, customer_payload, mobile_prefix, RESULT_LIMIT as CUSTOMER_RESULT_LIMIT
+from .customers import attach_customer
+from .exports import sales_export, customers_export, customer_summaries
+from .idempotency import idempotent
+from .pagination import keyset_page, page_size_from
+from .rollups import record_sale, sales_total, sales_count, product_sales
+from .search import product_index, product_payload, search_enabled, RESULT_LIMIT
+
+SALES_LIST_FIELDS = ('id', 'receipt_number', 'created_at', 'total_amount', 'discount_amount', 'cashier__username')
+SALES_LIST_ITEM_FIELDS = ('id', 'sale', 'quantity', 'product__name')
+
+
+def sale_list_payload(sale):
+    """JSON row for the sales_list infinite scroll"""
+    return {
+        'id': sale.id,
+        'receipt_number': sale.receipt_number,
+        'created_at': sale.created_at.isoformat(),
+        'cashier': sale.cashier.username if sale.cashier else None,
+        'total_amount': float(sale.total_amount),
+        'discount_amount': float(sale.discount_amount),
+        'items': [
+            {'name': item.product.name if item.product else None, 'quantity': item.quantity}
+            for item in sale.items.all()
+        ]
+    }
 
 @login_required
 def pos_view(request):
@@ -15,6 +47,9 @@ def pos_view(request):
 @login_required
 def product_search_api(request):
     query = request.GET.get('q', '')
+    if search_enabled():
+        return JsonResponse({'results': product_index.search(query)})
+
     products = (Product.objects.filter(
         name__icontains=query,
         stock_quantity__gt=0
@@ -22,25 +57,20 @@ def product_search_api(request):
         barcode__icontains=query,
         stock_quantity__gt=0
     )).order_by('-discount_percentage', 'name')
-    results = []
-    for p in products[:50]:
-        discounted_price = p.get_discounted_price()
-        results.append({
-            'id': p.id,
-            'name': p.name,
-            'price': float(p.price),
-            'cost': float(p.cost),
-            'discounted_price': float(discounted_price),
-            'discount_percentage': float(p.discount_percentage),
-            'stock': p.stock_quantity,
-            'barcode': p.barcode,
-            'image_url': p.image.url if p.image else None
-        })
+    results = [product_payload(p) for p in products[:RESULT_LIMIT]]
     return JsonResponse({'results': results})
 
+@login_required
+def product_suggestions_api(request):
+    """Products frequently bought together with the cart's ?products=1,2,3"""
+    product_ids = [int(value) for value in request.GET.get('products', '').split(',') if value.strip().isdigit()]
+    if not product_ids:
+        return JsonResponse({'results': []})
+    return JsonResponse({'results': suggestions(product_ids[:50])})
+
 @login_required
 @require_POST
-@transaction.atomic
+@idempotent
 def checkout_api(request):
     try:
         data = json.loads(request.body)
@@ -49,50 +79,7 @@ def checkout_api(request):
         if not cart:
             return JsonResponse({'error': 'Cart is empty'}, status=400)
 
-        total_amount = 0
-        total_discount = 0
-        sale = Sale.objects.create(
-            cashier=request.user,
-            total_amount=0 # Will update later
-        )
-
-        for item in cart:
-            product_id = item.get('id')
-            quantity = int(item.get('quantity', 1))
-            
-            product = Product.objects.select_for_update().get(id=product_id)
-            
-            if product.stock_quantity < quantity:
-                raise ValueError(f"Insufficient stock for {product.name}")
-            
-            product.stock_quantity -= quantity
-            product.save()
-            
-            InventoryLog.objects.create(
-                product=product,
-                action='sale',
-                quantity=quantity,
-                user=request.user,
-                note=f"Sale {sale.receipt_number}"
-            )
-            
-            # Use cost instead of price for the sale
-            sale_price = product.cost
-            
-            SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=quantity,
-                price_at_sale=sale_price,
-                subtotal=sale_price * quantity
-            )
-            
-            total_amount += float(sale_price) * quantity
-            # We skip discount calculation here since we're selling at cost
-
-        sale.total_amount = total_amount
-        sale.discount_amount = total_discount
-        sale.save()
+        sale = create_sale(request.user, cart)
         
         return JsonResponse({'success': True, 'sale_id': sale.id, 'receipt_number': sale.receipt_number})
         
@@ -122,9 +109,12 @@ def payment_page(request, sale_id):
 
 @login_required
 @require_POST
+@idempotent
+@transaction.atomic
 def process_payment(request, sale_id):
     """Process the payment and complete the sale"""
-    sale = get_object_or_404(Sale, id=sale_id, cashier=request.user)
+    # Lock the sale so two submissions cannot both complete it
+    sale = get_object_or_404(Sale.objects.select_for_update(), id=sale_id, cashier=request.user)
     
     if sale.is_completed:
         return JsonResponse({'error': 'Sale already completed'}, status=400)
@@ -144,7 +134,11 @@ def process_payment(request, sale_id):
             sale.change_amount = cash_received - float(sale.total_amount)
         
         sale.is_completed = True
-        sale.save()
+        with transaction.atomic():
+            sale.save()
+            record_sale(sale)
+            sales_changed()
+            live.sale_completed(sale)
         
         return JsonResponse({
             'success': True,
@@ -166,6 +160,25 @@ def receipt_page(request, sale_id):
         'items': items
     })
 
+@login_required
+def customer_lookup_api(request):
+    """Returning customers whose mobile or name starts with ?q=, regulars first"""
+    query = request.GET.get('q', '')
+    if search_enabled():
+        return JsonResponse({'results': customer_index.search(query)})
+
+    query = query.strip()
+    if not query:
+        return JsonResponse({'results': []})
+    customers = Customer.objects.filter(visit_count__gt=0)
+    digits = mobile_prefix(query)
+    if digits is not None:
+        customers = customers.filter(mobile__startswith=digits)
+    else:
+        customers = customers.filter(name__istartswith=query)
+    customers = customers.order_by('-visit_count', '-total_spent')[:CUSTOMER_RESULT_LIMIT]
+    return JsonResponse({'results': [customer_payload(c) for c in customers]})
+
 @login_required
 @require_POST
 def save_customer_details(request, sale_id):
@@ -177,9 +190,8 @@ def save_customer_details(request, sale_id):
         customer_name = data.get('customer_name', '').strip()
         customer_mobile = data.get('customer_mobile', '').strip()
         
-        sale.customer_name = customer_name
-        sale.customer_mobile = customer_mobile
-        sale.save()
+        # Also keeps the Customer table's running totals in step
+        attach_customer(sale, customer_name, customer_mobile)
         
         return JsonResponse({
             'success': True,
@@ -191,174 +203,93 @@ def save_customer_details(request, sale_id):
 
 @login_required
 def sales_list(request):
-    sales = Sale.objects.filter(is_completed=True).prefetch_related('items__product').select_related('cashier').order_by('-created_at')
+    sales = Sale.objects.completed()
     
     view_type = request.GET.get('view', 'all')
     date_input = request.GET.get('date')
     month_input = request.GET.get('month')
     
-    if view_type == 'daily' and date_input:
-        sales = sales.filter(created_at__date=date_input)
-    elif view_type == 'monthly' and month_input:
-        year, month = month_input.split('-')
-        sales = sales.filter(created_at__year=year, created_at__month=month)
-    elif view_type == 'product':
-        if date_input:
-            sales = sales.filter(created_at__date=date_input)
-        elif month_input:
-            year, month = month_input.split('-')
-            sales = sales.filter(created_at__year=year, created_at__month=month)
+    # Half-open timestamp ranges so the (is_completed, created_at) index applies
+    try:
+        start, end = report_period(request.GET)
+    except ValueError as e:
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'error': str(e)}, status=400)
+        return HttpResponseBadRequest(str(e))
+    if view_type in ('daily', 'monthly'):
+        sales = sales.filter(**timestamp_filter('created_at', start, end))
+    
+    # The same period, expressed against the rollup tables
+    period = date_filter('date', start, end)
+    
+    total_sales = sales_total(**period)
+    total_transactions = sales_count(**period)
     
     product_stats = None
+    page = []
+    next_cursor = None
     if view_type == 'product':
-        from .models import SaleItem
-        # from django.db.models import Sum, F  <-- Removed to fix UnboundLocalError
-        
-        # Base filter for completed sales
-        base_qs = SaleItem.objects.filter(sale__is_completed=True)
-        
-        # Apply date filters if provided
-        if date_input:
-            base_qs = base_qs.filter(sale__created_at__date=date_input)
-        elif month_input:
-            year, month = month_input.split('-')
-            base_qs = base_qs.filter(sale__created_at__year=year, sale__created_at__month=month)
-
-        product_stats = base_qs.values(
-            'product__name', 
-            'product__barcode',
-            'product__category__name'
-        ).annotate(
-            total_quantity=Sum('quantity'),
-            total_revenue=Sum('subtotal')
-        ).order_by('-total_revenue')
-
-    total_sales = sales.aggregate(total=Sum('total_amount'))['total'] or 0
+        # Served from the per-product daily rollup rather than raw sale lines
+        product_stats = product_sales(**period)
+    else:
+        # One keyset page of sales, loading only the columns the list shows
+        sales = sales.select_related('cashier').only(*SALES_LIST_FIELDS).prefetch_related(
+            Prefetch('items', queryset=SaleItem.objects.select_related('product').only(*SALES_LIST_ITEM_FIELDS))
+        )
+        page, next_cursor = keyset_page(sales, request.GET.get('after'), page_size_from(request))
+    
+    if request.GET.get('format') == 'json':
+        if product_stats is not None:
+            results = [
+                dict(item, total_revenue=float(item['total_revenue'] or 0))
+                for item in product_stats
+            ]
+        else:
+            results = [sale_list_payload(sale) for sale in page]
+        return JsonResponse({
+            'results': results,
+            'next': next_cursor,
+            'total_sales': float(total_sales),
+            'total_transactions': total_transactions
+        })
+    
+    next_query = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['after'] = next_cursor
+        next_query = query.urlencode()
     
     return render(request, 'pos/sales_list.html', {
-        'sales': sales,
+        'sales': page,
         'view_type': view_type,
         'selected_date': date_input,
         'selected_month': month_input,
         'total_sales': total_sales,
-        'product_stats': product_stats
+        'total_transactions': total_transactions,
+        'product_stats': product_stats,
+        'next_query': next_query,
+        'is_first_page': not request.GET.get('after')
     })
 
 @login_required
 def export_sales_data(request):
-    import csv
-    from django.http import HttpResponse
-
-    sales = Sale.objects.filter(is_completed=True).prefetch_related('items__product').select_related('cashier').order_by('-created_at')
-    
-    view_type = request.GET.get('view', 'all')
-    date_input = request.GET.get('date')
-    month_input = request.GET.get('month')
-    
-    filename = "sales_web_export"
-
-    if view_type == 'daily' and date_input:
-        sales = sales.filter(created_at__date=date_input)
-        filename = f"sales_daily_{date_input}"
-    elif view_type == 'monthly' and month_input:
-        year, month = month_input.split('-')
-        sales = sales.filter(created_at__year=year, created_at__month=month)
-        filename = f"sales_monthly_{month_input}"
-    elif view_type == 'product':
-        filename = f"sales_product_wise_{date_input if date_input else (month_input if month_input else 'all')}"
-        from .models import SaleItem
-        # from django.db.models import Sum <-- Removed as it is imported globally
-        
-        # Base filter for completed sales
-        base_qs = SaleItem.objects.filter(sale__is_completed=True)
-        
-        # Apply date filters if provided
-        if date_input:
-            base_qs = base_qs.filter(sale__created_at__date=date_input)
-        elif month_input:
-            year, month = month_input.split('-')
-            base_qs = base_qs.filter(sale__created_at__year=year, sale__created_at__month=month)
-
-        product_stats = base_qs.values(
-            'product__name', 
-            'product__barcode',
-            'product__category__name'
-        ).annotate(
-            total_quantity=Sum('quantity'),
-            total_revenue=Sum('subtotal')
-        ).order_by('-total_revenue')
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Product Name', 'Barcode', 'Category', 'Total Quantity Sold', 'Total Revenue'])
-        
-        for item in product_stats:
-            writer.writerow([
-                item['product__name'],
-                item['product__barcode'],
-                item['product__category__name'] or '-',
-                item['total_quantity'],
-                item['total_revenue']
-            ])
-            
-        return response
-        
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Receipt Number', 'Date', 'Time', 'Cashier', 'Customer Name', 'Customer Mobile', 'Payment Method', 'Total Amount', 'Items'])
-    
-    for sale in sales:
-        items_str = ", ".join([f"{item.quantity}x {item.product.name}" for item in sale.items.all()])
-        
-        writer.writerow([
-            sale.receipt_number,
-            sale.created_at.strftime('%Y-%m-%d'),
-            sale.created_at.strftime('%H:%M:%S'),
-            sale.cashier.username if sale.cashier else 'Unknown',
-            sale.customer_name,
-            sale.customer_mobile,
-            sale.get_payment_method_display(),
-            sale.total_amount,
-            items_str
-        ])
-        
-    return response
+    # Streamed row by row so long histories start downloading immediately
+    try:
+        export = sales_export(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return csv_response(*export)
 
 @login_required
 def customers_list(request):
-    from django.db.models import Sum, Max, Count
-    
-    # Aggregate customer data from Sales
-    # Filter out empty mobile numbers
-    customers = Sale.objects.exclude(customer_mobile='').values('customer_mobile').annotate(
-        customer_name=Max('customer_name'),
-        total_spent=Sum('total_amount'),
-        last_visit=Max('created_at'),
-        visit_count=Count('id')
-    ).order_by('-last_visit')
-
     if request.GET.get('export') == 'csv':
-        import csv
-        from django.http import HttpResponse
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="customers_list.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Customer Name', 'Mobile Number', 'Total Spent', 'Last Visit', 'Visit Count'])
-        
-        for customer in customers:
-            writer.writerow([
-                customer['customer_name'] or 'Unknown',
-                customer['customer_mobile'],
-                customer['total_spent'],
-                customer['last_visit'].strftime("%Y-%m-%d %H:%M"),
-                customer['visit_count']
-            ])
-        return response
+        return csv_response(*customers_export(request.GET))
 
-    return render(request, 'pos/customers_list.html', {'customers': customers})
+    customers, next_cursor = keyset_page(
+        customer_summaries(), request.GET.get('after'), page_size_from(request), field='last_visit'
+    )
+    return render(request, 'pos/customers_list.html', {
+        'customers': customers,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after')
+    })
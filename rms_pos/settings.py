@@ -109,6 +109,18 @@ else:
     }
 
 
+# Cache configuration
+# Per-process memory by default. Point CACHE_BACKEND/CACHE_LOCATION at a shared
+# cache (e.g. django.core.cache.backends.redis.RedisCache) so that cache
+# version bumps and warmed entries are seen by every worker.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'rms-pos'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -149,6 +161,9 @@ STATICFILES_DIRS = [BASE_DIR / 'rms_pos' / 'static']
 
 # Use WhiteNoise to serve static files
 STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
@@ -185,4 +200,94 @@ MEDIA_ROOT = BASE_DIR / 'rms_pos' / 'media'
 
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
-LOGOUT_REDIRECT_URL = '/accounts/login/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/accounts/login/'
+
+# POS product search and customer lookup: serve product_search_api and
+# customer_lookup_api from the in-memory indexes (pos/search.py,
+# pos/customer_search.py). The sync interval bounds how stale data written by
+# other worker processes can get; 0 disables the periodic sync.
+POS_SEARCH_INDEX_ENABLED = True
+POS_SEARCH_INDEX_SYNC_SECONDS = 30
+
+# Number of per-terminal stock allotments for products with escrow_enabled
+# (inventory/escrow.py). Run `manage.py rebalance_stock_escrow --loop` to keep
+# Product.stock_quantity reconciled.
+STOCK_ESCROW_SLOTS = 4
+
+# Responses to POS API calls sent with an Idempotency-Key header are kept this
+# long (seconds) and replayed on retry (pos/idempotency.py). Expired keys are
+# removed by `manage.py purge_idempotency_keys`.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_CACHE_SIZE = 1024
+
+# Keyset page size for the sales history page and its ?format=json variant
+SALES_LIST_PAGE_SIZE = 50
+SALES_LIST_MAX_PAGE_SIZE = 200
+
+# Rows fetched per query by the streaming CSV exports (core/streaming.py)
+EXPORT_CHUNK_SIZE = 1000
+
+# Finished background exports (core/export_jobs.py) are handed out again for
+# identical requests made within this many seconds. Jobs are run by
+# `manage.py run_export_worker`.
+EXPORT_JOB_FRESH_SECONDS = 15 * 60
+
+# Lifetime (seconds) of versioned cache entries such as the dashboard analytics
+# widgets (core/versioned_cache.py). Entries are invalidated by version bumps
+# when sales complete or stock changes, so this only bounds memory use. With a
+# shared CACHE_BACKEND, run `manage.py warm_dashboard_cache` after deploy;
+# warming a per-process cache would reach no worker, so the command refuses.
+VERSIONED_CACHE_TIMEOUT = 60 * 60
+# With a per-process cache (the LocMemCache default) other workers never see
+# those bumps, so entries and version counters expire after this many seconds
+# instead. Configure a shared CACHE_BACKEND to use the longer timeout above.
+VERSIONED_CACHE_LOCAL_TIMEOUT = 30
+
+# Live dashboard updates (core/events.py), streamed from inventory/dashboard/events/
+# when served through rms_pos.asgi (e.g. `uvicorn rms_pos.asgi:application`).
+# Set EVENTS_SOCKET_DIR to a directory shared by all workers on the host to fan
+# events out between worker processes.
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_SOCKET_DIR = os.environ.get('EVENTS_SOCKET_DIR') or None
+
+# Streaming top sellers for the last hour/day/week (pos/top_sellers.py). Each
+# window's counts are within total sold / TOP_SELLERS_CAPACITY of the truth.
+# Workers merge their counts into the database every TOP_SELLERS_SNAPSHOT_SECONDS
+# from a background thread, and once more on exit;
+# `manage.py compare_top_sellers` checks them against the exact SQL answer.
+TOP_SELLERS_CAPACITY = 256
+TOP_SELLERS_SNAPSHOT_SECONDS = 60
+
+# "Frequently bought together" suggestions (pos/basket.py), refreshed by
+# `manage.py build_market_basket` (add --incremental for frequent runs).
+MARKET_BASKET_TOP_K = 10
+MARKET_BASKET_MIN_PAIRS = 3
+
+# Demand forecasting and reorder points (inventory/planning.py), recomputed by
+# `manage.py plan_inventory` (run it nightly). Safety stock uses
+# PLANNING_SERVICE_Z standard deviations of daily demand (1.65 ~ 95% service).
+PLANNING_HALF_LIFE_DAYS = 14
+PLANNING_LEAD_TIME_DAYS = 7
+PLANNING_REVIEW_DAYS = 14
+PLANNING_SERVICE_Z = 1.65
+PLANNING_MIN_HISTORY_DAYS = 14
+
+# Inventory ledger (inventory/ledger.py): `manage.py reconcile_inventory`
+# snapshots a product's InventoryLog balance once this many entries have
+# accumulated since its last snapshot.
+INVENTORY_SNAPSHOT_MIN_ENTRIES = 100
+
+# InventoryLog rows older than this many whole months (plus the current one)
+# are moved to gzip CSV files in storage under archive/inventory_logs/ by
+# `manage.py archive_inventory_logs` (inventory/archive.py);
+# `manage.py restore_inventory_logs YYYY-MM` brings a month back.
+INVENTORY_LOG_HOT_MONTHS = 12
+
+# Product thumbnails (inventory/thumbnails.py), built by
+# `manage.py build_thumbnails --loop` as WebP and JPEG at each width in pixels.
+# The POS grid and the product list load these instead of the uploaded image.
+# They are named after their content: in production, have the web server serve
+# MEDIA_URL/thumbnails/ with "Cache-Control: public, max-age=31536000, immutable".
+# The DEBUG server does this itself (core.views.thumbnail).
+PRODUCT_THUMBNAIL_WIDTHS = (160, 320)
+PRODUCT_THUMBNAIL_QUALITY = 80
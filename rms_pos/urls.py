@@ -1,8 +1,10 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import thumbnail
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
@@ -10,5 +12,15 @@ urlpatterns = [
     path('inventory/', include('inventory.urls')),
     path('pos/', include('pos.urls')),
     path('', include('core.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) + static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])
+]
+
+if settings.DEBUG:
+    # Development only, like static() below, and ahead of it so thumbnails get
+    # their long-lived Cache-Control. In production the web server serves
+    # MEDIA_URL and sets that header for thumbnails/ itself.
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.lstrip("/")}thumbnails/(?P<path>.+)$', thumbnail, name='product_thumbnail'),
+    ]
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) + static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])
 